@@ -51,6 +51,18 @@ create table if not exists mst_item_detail_tag (
   tag_id bigint
 );
 
+-- 画像・タグは商品ごとの集合として、登録済みの行との差分だけを insert / delete する（BatchWriter.replace）。
+-- 一意索引を張る前に、これまでに溜まった重複行を1行にまとめる
+delete from mst_item_detail_image a using mst_item_detail_image b
+  where a.ctid > b.ctid and a.item_code = b.item_code and a.size = b.size and a.image_url = b.image_url;
+create unique index if not exists mst_item_detail_image_item_size_url_key
+  on mst_item_detail_image (item_code, size, image_url);
+
+delete from mst_item_detail_tag a using mst_item_detail_tag b
+  where a.ctid > b.ctid and a.item_code = b.item_code and a.tag_id = b.tag_id;
+create unique index if not exists mst_item_detail_tag_item_tag_key
+  on mst_item_detail_tag (item_code, tag_id);
+
 
 CREATE TABLE trn_rakuten_ranking (
     id SERIAL PRIMARY KEY,
@@ -84,4 +96,143 @@ CREATE TABLE trn_rakuten_ranking (
     medium_image_urls JSONB,
     small_image_urls JSONB,
     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
\ No newline at end of file
+);
+
+-- ジャンル別・期間別ランキングの取り込み（main2.py --genres）用
+ALTER TABLE trn_rakuten_ranking ADD COLUMN IF NOT EXISTS ranking_genre_id TEXT;
+ALTER TABLE trn_rakuten_ranking ADD COLUMN IF NOT EXISTS period TEXT;  -- 'realtime' または 'daily'
+CREATE INDEX IF NOT EXISTS trn_rakuten_ranking_genre_period_idx
+    ON trn_rakuten_ranking (ranking_genre_id, period, timestamp);
+
+-- python -m rakuten_sync all は mst_products と mst_rakuten_items の item_code を昇順に読み、
+-- Python の文字列の順序（コードポイント順）で突き合わせる（rakuten_sync/orchestrator.py）。
+-- DB の照合順序（ja_JP.UTF-8 等）では記号や大文字・小文字の順序が異なるため、照合順序を "C" にそろえる
+-- （順序が食い違うと all は例外で止まる）
+-- （どちらのテーブルも他の仕組みで作られるため、存在する場合だけ変更する）
+do $$
+declare
+  t text;
+begin
+  foreach t in array array['mst_products', 'mst_rakuten_items'] loop
+    if to_regclass(t) is not null then
+      execute format('alter table %I alter column item_code type text collate "C"', t);
+    end if;
+  end loop;
+end $$;
+
+
+-- スナップショット形式の価格履歴は (item_code, timestamp) で upsert する（rakuten_sync/price_history.py の SNAPSHOT_KEY）。
+-- 登録がタイムアウトした後の再試行や --resume での再登録で、同じ行が二重に入らないようにするための一意索引。
+-- 一意索引を張る前に、これまでに二重に登録された行を1行にまとめる（存在するテーブルだけ）
+do $$
+declare
+  t text;
+begin
+  foreach t in array array['trn_rakuten_price_history', 'trn_rakuten_price_history_after_ranking'] loop
+    if to_regclass(t) is not null then
+      execute format(
+        'delete from %1$I a using %1$I b '
+        'where a.ctid > b.ctid and a.item_code = b.item_code and a.timestamp = b.timestamp', t
+      );
+      execute format('create unique index if not exists %I on %I (item_code, timestamp)', t || '_item_timestamp_key', t);
+    end if;
+  end loop;
+end $$;
+
+
+-- 期間形式の履歴（--history-mode intervals）
+-- 変動する項目だけを有効期間（valid_from 以上 valid_to 未満）で持つ。valid_to が null の行が現在の値。
+-- 既存のスナップショット行からの移行は compact_history.py で行う
+create table if not exists trn_rakuten_price_history_interval (
+  id bigserial primary key,
+  item_code text not null,
+  valid_from timestamp not null,
+  valid_to timestamp,
+  item_price integer,
+  item_price_base_field text,
+  item_price_min1 integer,
+  item_price_min2 integer,
+  item_price_min3 integer,
+  item_price_max1 integer,
+  item_price_max2 integer,
+  item_price_max3 integer,
+  availability integer,
+  point_rate integer,
+  postage_flag boolean,
+  review_average numeric,  -- API の値と比べるため桁数を丸めない
+  review_count integer
+);
+create unique index if not exists trn_rakuten_price_history_interval_open_idx
+  on trn_rakuten_price_history_interval (item_code) where valid_to is null;
+create index if not exists trn_rakuten_price_history_interval_item_idx
+  on trn_rakuten_price_history_interval (item_code, valid_from);
+
+create table if not exists trn_rakuten_price_history_after_ranking_interval (
+  id bigserial primary key,
+  item_code text not null,
+  valid_from timestamp not null,
+  valid_to timestamp,
+  item_price integer,
+  item_price_base_field text,
+  item_price_min1 integer,
+  item_price_min2 integer,
+  item_price_min3 integer,
+  item_price_max1 integer,
+  item_price_max2 integer,
+  item_price_max3 integer,
+  availability integer,
+  point_rate integer,
+  postage_flag boolean,
+  review_average numeric,
+  review_count integer
+);
+create unique index if not exists trn_rakuten_price_history_after_ranking_interval_open_idx
+  on trn_rakuten_price_history_after_ranking_interval (item_code) where valid_to is null;
+create index if not exists trn_rakuten_price_history_after_ranking_interval_item_idx
+  on trn_rakuten_price_history_after_ranking_interval (item_code, valid_from);
+
+create table if not exists trn_rakuten_ranking_interval (
+  id bigserial primary key,
+  item_code text not null,
+  ranking_genre_id text,
+  period text,  -- 'realtime' または 'daily'
+  valid_from timestamp not null,
+  valid_to timestamp,
+  rank integer,
+  item_price integer,
+  availability integer,
+  point_rate integer
+);
+create unique index if not exists trn_rakuten_ranking_interval_open_idx
+  on trn_rakuten_ranking_interval (item_code, ranking_genre_id, period) where valid_to is null;
+create index if not exists trn_rakuten_ranking_interval_genre_idx
+  on trn_rakuten_ranking_interval (ranking_genre_id, period, valid_from);
+
+
+-- 画像URLの配列（medium_image_urls / small_image_urls）は JSONB の配列として登録する。
+-- 以前は JSON を文字列にしてから登録していたため（JSONB の中身が文字列）、既存の行を配列に直す。
+-- 【破壊的変更】この移行は既存の行を書き換える。これらの列を文字列として読んでいる処理
+-- （medium_image_urls #>> '{}' を JSON として解析し直す等）は、JSONB の配列として読むように直してから流すこと。
+-- 移行前の形式に戻す場合（対象の各テーブルで実行する）:
+--   update <テーブル> set medium_image_urls = to_jsonb(medium_image_urls::text),
+--                         small_image_urls = to_jsonb(small_image_urls::text)
+--   where jsonb_typeof(medium_image_urls) = 'array' or jsonb_typeof(small_image_urls) = 'array';
+do $$
+declare
+  t text;
+begin
+  foreach t in array array['mst_rakuten_items', 'trn_rakuten_ranking', 'trn_rakuten_price_history',
+                           'trn_rakuten_price_history_after_ranking'] loop
+    if to_regclass(t) is not null then
+      execute format(
+        'update %I set '
+        'medium_image_urls = case when jsonb_typeof(medium_image_urls) = ''string'' '
+        '  then (medium_image_urls #>> ''{}'')::jsonb else medium_image_urls end, '
+        'small_image_urls = case when jsonb_typeof(small_image_urls) = ''string'' '
+        '  then (small_image_urls #>> ''{}'')::jsonb else small_image_urls end '
+        'where jsonb_typeof(medium_image_urls) = ''string'' or jsonb_typeof(small_image_urls) = ''string''',
+        t
+      );
+    end if;
+  end loop;
+end $$;
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# 概要 : 価格履歴の変換・書き込み経路の1商品あたりのCPU時間とメモリを、変更前の方式と比べる
+#          dict   : 変更前。レスポンスを標準の json で解析し、行は30列の辞書、画像URLの配列は json.dumps で文字列化、
+#                   書き込みは supabase-py と同じく列の和集合を求めてから標準の json で変換（画像は二重に変換される）
+#          record : rakuten_sync.schema のレコード（slots 付き）と utils.fastjson（orjson）。画像URLは配列のまま1回だけ変換
+#        段階ごと（解析 / 変換 / 書き込みバッチの JSON 生成）の時間と、1商品あたりのメモリを出す。
+#          working  : 解析したレスポンスと変換後の行を両方持っている間（書き込み待ちのブロック）のメモリ
+#          retained : レスポンスを捨て、行だけを残したときのメモリ（レコードは画像URLの配列を参照し続ける）
+#        API・Supabase には触れない。
+#
+# 実行例 : python benchmarks/bench_records.py --items 100000 --repeat 3
+#
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_transform import make_items  # noqa: E402
+from rakuten_sync.schema import CONVERTERS, FIELDS, PRICE_HISTORY, unwrap  # noqa: E402
+from utils import fastjson  # noqa: E402
+
+PAGE_SIZE = 30  # 楽天APIの1レスポンスあたりの商品数
+
+
+def legacy_rows_function(schema):
+    # 変更前の Schema.rows_of（列名 -> 値 の辞書、画像URLは json.dumps で文字列化）
+    converters = dict(CONVERTERS, json=lambda value: json.dumps(value or []))
+    fields = [(column, FIELDS[column].source, converters[FIELDS[column].kind]) for column in schema.columns]
+    timestamp_column = schema.timestamp_column
+
+    def to_rows(items, timestamp):
+        rows = []
+        for item in items:
+            row = {column: convert(item.get(source)) for column, source, convert in fields}
+            row[timestamp_column] = timestamp
+            rows.append(row)
+        return rows
+    return to_rows
+
+
+def legacy_encode(rows):
+    # supabase-py（postgrest）の insert と同じ処理: 全行から列の和集合を求め、httpx が標準の json で本文を作る
+    columns = ','.join(dict.fromkeys(key for row in rows for key in row))
+    body = json.dumps(rows, ensure_ascii=False, separators=(',', ':'), allow_nan=False).encode('utf-8')
+    return columns, body
+
+
+def record_encode(rows):
+    # supabase_client/rest_writer.py と同じ処理
+    columns = {}
+    for row in rows:
+        columns.update(dict.fromkeys(row.keys()))
+    return ','.join(columns), fastjson.dumps(rows)
+
+
+MODES = {
+    'dict': (json.loads, legacy_rows_function(PRICE_HISTORY), legacy_encode),
+    'record': (fastjson.loads, PRICE_HISTORY._to_rows, record_encode),
+}
+
+
+def make_pages(count):
+    items = make_items(count)
+    return [
+        json.dumps({'Items': items[start:start + PAGE_SIZE]}, ensure_ascii=False).encode('utf-8')
+        for start in range(0, count, PAGE_SIZE)
+    ]
+
+
+def run(mode, pages, batch_size, timestamp):
+    loads, to_rows, encode = MODES[mode]
+    timings = {}
+    started = time.perf_counter()
+    parsed = [loads(page) for page in pages]
+    timings['parse'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    rows = []
+    for data in parsed:
+        rows.extend(to_rows(unwrap(data['Items']), timestamp))
+    timings['transform'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    sent = 0
+    for start in range(0, len(rows), batch_size):
+        _columns, body = encode(rows[start:start + batch_size])
+        sent += len(body)
+    timings['encode'] = time.perf_counter() - started
+    return timings, sent
+
+
+def memory_bytes(mode, pages, timestamp):
+    loads, to_rows, _encode = MODES[mode]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    parsed = [loads(page) for page in pages]
+    rows = []
+    for data in parsed:
+        rows.extend(to_rows(unwrap(data['Items']), timestamp))
+    working = tracemalloc.get_traced_memory()[0] - before
+    del parsed
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del rows
+    return working, retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description='商品レコードの変換・書き込み経路のベンチマーク')
+    parser.add_argument('--items', type=int, default=100_000)
+    parser.add_argument('--batch-size', type=int, default=500, help='書き込み1回あたりの行数（PRICE_HISTORY_CHUNK_SIZE）')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    pages = make_pages(args.items)
+    timestamp = '2026-10-17T00:00:00'
+    print(f"items={args.items:,} batch_size={args.batch_size} repeat={args.repeat} (best of) "
+          f"orjson={'あり' if fastjson.orjson else 'なし（標準の json）'}")
+    print(f"{'mode':>6}  {'parse':>8}  {'transform':>9}  {'encode':>8}  {'total':>8}  {'body_MB':>7}  "
+          f"{'working_B/item':>14}  {'retained_B/item':>15}")
+    results = {}
+    for mode in MODES:
+        best = None
+        for _ in range(args.repeat):
+            timings, sent = run(mode, pages, args.batch_size, timestamp)
+            if best is None or sum(timings.values()) < sum(best.values()):
+                best = timings
+        working, retained = memory_bytes(mode, pages, timestamp)
+        results[mode] = (sum(best.values()), working)
+        per_item = {stage: seconds / args.items * 1e6 for stage, seconds in best.items()}
+        print(f"{mode:>6}  {per_item['parse']:>6.2f}us  {per_item['transform']:>7.2f}us  {per_item['encode']:>6.2f}us  "
+              f"{sum(per_item.values()):>6.2f}us  {sent / 1e6:>7.1f}  {working / args.items:>14,.0f}  "
+              f"{retained / args.items:>15,.0f}")
+    (dict_cpu, dict_mem), (record_cpu, record_mem) = results['dict'], results['record']
+    print(f"record vs dict: CPU x{dict_cpu / record_cpu:.2f} 速い / working メモリ {record_mem / dict_mem:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# 概要 : 価格の変わりやすさに合わせた取得計画（rakuten_sync/scheduler.py, --api-budget）の効果をシミュレーションで比べる
+#        商品ごとに変化率の異なる仮想カタログ（大半はほとんど変わらず、一部が1日に何度も変わる）を、
+#        1時間ごとの実行で次の3つの方法で追跡し、API呼び出し数と「DBの値が古いままだった時間」を比べる。
+#          full        : 毎回全件を取得する（現状）
+#          round_robin : 予算の件数ずつ順番に取得する
+#          scheduler   : RefreshScheduler で選ぶ（直近でランキングに載った商品を優先、最大経過時間を保証）
+#        API・Supabase には触れない。
+#
+# 実行例 : python benchmarks/bench_scheduler.py --items 10000 --budget 2000 --hours 168
+#
+
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from rakuten_sync.scheduler import ItemStatsStore, RefreshScheduler  # noqa: E402
+
+HOUR = 3600
+
+
+def build_catalog(items, seed):
+    # (item_code, 1時間あたりの変化率)。変わりやすい商品の一部は直近のランキング商品とする
+    rng = random.Random(seed)
+    catalog = []
+    ranking = set()
+    for i in range(items):
+        draw = rng.random()
+        if draw < 0.05:
+            rate = 1 / 4
+        elif draw < 0.20:
+            rate = 1 / 48
+        else:
+            rate = 1 / 2000
+        code = f'shop{i % 100}:item{i:07d}'
+        catalog.append((code, rate))
+        if rate >= 1 / 4 and rng.random() < 0.5:
+            ranking.add(code)
+    catalog.sort()
+    return catalog, ranking
+
+
+def simulate(policy, catalog, ranking, hours, budget, max_staleness, seed):
+    rng = random.Random(seed)
+    codes = [code for code, _rate in catalog]
+    rates = dict(catalog)
+    version = dict.fromkeys(codes, 0)   # 実際の値（変化のたびに増える）
+    stored = dict.fromkeys(codes, None)  # DB に登録済みの値
+    calls = 0
+    stale_item_hours = 0
+    max_age = 0
+    last_polled = dict.fromkeys(codes, None)
+    cursor = 0
+    store = ItemStatsStore(os.path.join(tempfile.mkdtemp(prefix='bench_scheduler_'), 'schedule.sqlite'))
+    start = 1_700_000_000.0
+    for hour in range(hours):
+        now = start + hour * HOUR
+        for code in codes:
+            # 1時間の間に変化したか（ポアソン過程）
+            if rng.random() < 1 - math.exp(-rates[code]):
+                version[code] += 1
+
+        if policy == 'full':
+            polled = codes
+        elif policy == 'round_robin':
+            polled = [codes[(cursor + i) % len(codes)] for i in range(min(budget, len(codes)))]
+            cursor = (cursor + budget) % len(codes)
+        else:
+            scheduler = RefreshScheduler('bench', budget, max_staleness, ranking, 4.0, store=store, now=now)
+            polled = scheduler.select(codes)
+            for code in polled:
+                scheduler.observe(code, [{'item_price': version[code]}])
+            scheduler.flush()
+            store.record_run('bench', now)  # 共有の store を閉じないため、close() の代わりに実行時刻だけ記録する
+
+        calls += len(polled)
+        for code in polled:
+            stored[code] = version[code]
+            last_polled[code] = now
+        for code in codes:
+            stale_item_hours += stored[code] != version[code]
+            if last_polled[code] is not None:
+                max_age = max(max_age, (now - last_polled[code]) / HOUR)
+    store.close()
+    return {
+        'policy': policy,
+        'calls': calls,
+        'calls_per_run': round(calls / hours, 1),
+        'stale_share': round(stale_item_hours / (hours * len(codes)), 4),
+        'max_age_hours': round(max_age, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='取得計画（--api-budget）のシミュレーション')
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--budget', type=int, default=1000, help='1回の実行で取得する商品数の上限')
+    parser.add_argument('--hours', type=int, default=96, help='シミュレーションする時間（1時間に1回実行）')
+    parser.add_argument('--max-staleness-hours', type=float, default=24.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    catalog, ranking = build_catalog(args.items, args.seed)
+    results = [
+        simulate(policy, catalog, ranking, args.hours, args.budget, args.max_staleness_hours, args.seed)
+        for policy in ('full', 'round_robin', 'scheduler')
+    ]
+    full_calls = results[0]['calls']
+    print(f"{'policy':>12}  {'calls':>9}  {'calls/run':>9}  {'saved':>6}  {'stale_share':>11}  {'max_age_h':>9}")
+    for result in results:
+        saved = 1 - result['calls'] / full_calls
+        print(f"{result['policy']:>12}  {result['calls']:>9}  {result['calls_per_run']:>9}  {saved:>6.1%}  "
+              f"{result['stale_share']:>11.2%}  {result['max_age_hours']:>9}")
+
+
+if __name__ == '__main__':
+    main()
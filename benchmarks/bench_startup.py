@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# 概要 : python -m rakuten_sync の起動時間を計測し、予算（--budget-ms）を超えていないか確認する
+#        各コマンドを別プロセスで --repeat 回実行し、実行時間の中央値を出す。
+#          python          : 何も読み込まないインタープリタの起動（差し引く基準）
+#          cli --help      : python -m rakuten_sync --help（引数の解析まで。ジョブの処理は読み込まない）
+#          supabase        : supabase パッケージの読み込み（以前は各スクリプトの起動時に必ず払っていた）
+#          httpx           : httpx の読み込み（楽天APIを呼ぶジョブを実行するときだけ払う）
+#        あわせて、引数の解析までに supabase / httpx が読み込まれていないことを確認する。
+#        予算を超えた場合や重いモジュールが読み込まれていた場合は終了コード 1 を返す（CI で使える）。
+#        API・Supabase には触れない。
+#
+# 実行例 : python benchmarks/bench_startup.py --budget-ms 200 --repeat 10
+#
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 起動時に読み込んではいけないモジュール
+HEAVY_MODULES = ('supabase', 'postgrest', 'httpx', 'h2', 'psycopg')
+
+COMMANDS = {
+    'python': ['-c', 'pass'],
+    'cli --help': ['-m', 'rakuten_sync', '--help'],
+    'supabase': ['-c', 'import supabase'],
+    'httpx': ['-c', 'import httpx'],
+}
+
+CHECK_LAZY = (
+    "import sys\n"
+    "from rakuten_sync.cli import build_parser\n"
+    "build_parser().parse_args(['ranking', 'tracked-refresh', 'post-ranking-refresh'])\n"
+    f"print(','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))\n"
+)
+
+
+def run_ms(args, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, *args], cwd=REPO_DIR, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def loaded_heavy_modules():
+    result = subprocess.run(
+        [sys.executable, '-c', CHECK_LAZY], cwd=REPO_DIR, check=True, capture_output=True, text=True,
+    )
+    return [name for name in result.stdout.strip().split(',') if name]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='python -m rakuten_sync の起動時間の計測')
+    parser.add_argument('--budget-ms', type=float, default=200.0,
+                        help='インタープリタの起動を除いた python -m rakuten_sync --help の実行時間の上限（ミリ秒）')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    results = {}
+    for name, command in COMMANDS.items():
+        try:
+            results[name] = run_ms(command, args.repeat)
+        except subprocess.CalledProcessError:
+            results[name] = None  # 未インストールのパッケージは計測しない
+    baseline = results['python']
+    print(f"{'command':>12}  {'median_ms':>9}  {'net_ms':>7}")
+    for name, ms in results.items():
+        if ms is None:
+            print(f"{name:>12}  {'-':>9}  {'-':>7}")
+        else:
+            print(f"{name:>12}  {ms:>9.1f}  {ms - baseline:>7.1f}")
+
+    failed = False
+    heavy = loaded_heavy_modules()
+    if heavy:
+        print(f"NG: 引数の解析までに {', '.join(heavy)} が読み込まれています")
+        failed = True
+    net = results['cli --help'] - baseline
+    if net > args.budget_ms:
+        print(f"NG: 起動時間 {net:.1f} ms が予算 {args.budget_ms:g} ms を超えています")
+        failed = True
+    if not failed:
+        print(f"OK: 起動時間 {net:.1f} ms（予算 {args.budget_ms:g} ms）/ 重いモジュールは未読み込み")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# 概要 : 同期バッチ（main.py / main2.py / main3.py / main4.py）のスループットを、本番に触れずに計測する
+#        楽天APIと Supabase のスタブサーバー（fake_rakuten.py / fake_postgrest.py）をこのプロセス内で起動し、
+#        各スクリプトを子プロセスとして実行して、処理件数/秒・リクエスト数/秒・ピークメモリ（RSS）を比べる。
+#        カタログの規模は次のように反映する。
+#          main.py  : ランキング1ページの件数（スタブがページサイズを規模に合わせる）
+#          main2.py : --genres で規模 / 1020 個のジャンルを指定（30件 × 34ページ / ジャンル）
+#          main3.py / main4.py : mst_products / mst_rakuten_items に規模分の商品コードを登録
+#
+# 実行例 : python benchmarks/bench_sync.py --scripts main3 main4 --sizes 1000 10000 --latency-ms 20
+#          python benchmarks/bench_sync.py --scripts main4 --sizes 100000 --extra-args=--plan-by-shop
+#          python benchmarks/bench_sync.py --scripts main3 --sizes 1000 --rate-limit 50 --inject-429 0.02
+#
+
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import fake_postgrest  # noqa: E402
+import fake_rakuten  # noqa: E402
+
+sys.path.insert(0, REPO_DIR)
+from rakuten_sync.intervals import HISTORY_MODES, interval_spec  # noqa: E402
+
+SCRIPTS = ('main', 'main2', 'main3', 'main4')
+RANKING_ITEMS_PER_GENRE = fake_rakuten.RANKING_PAGE_SIZE * fake_rakuten.RANKING_MAX_PAGES
+
+# スクリプトごとの (登録先で件数を数えるテーブル, 追跡対象を入れておくテーブル)
+TARGETS = {
+    'main': ('mst_item_detail', None),
+    'main2': ('trn_rakuten_ranking', None),
+    'main3': ('trn_rakuten_price_history', 'mst_products'),
+    'main4': ('trn_rakuten_price_history_after_ranking', 'mst_rakuten_items'),
+}
+
+
+def script_args(script, size):
+    if script == 'main2':
+        genres = -(-size // RANKING_ITEMS_PER_GENRE)
+        return ['--genres', ','.join(str(100 + i) for i in range(genres)), '--periods', 'realtime']
+    return []
+
+
+def seed(postgrest, script, size, catalog):
+    _target, source = TARGETS[script]
+    if source is None:
+        return
+    rows = ({'item_code': fake_rakuten.item_code(i, catalog.shops)} for i in range(size))
+    if source == 'mst_rakuten_items':
+        rows = ({**row, 'shop_code': row['item_code'].split(':', 1)[0]} for row in rows)
+    postgrest.seed(source, rows)
+
+
+def run_child(script, args, env, log_path):
+    # ピークRSSは子プロセスの実行レポートから取る。レポートがない場合は os.wait4 の値
+    # （fork 直後の親プロセス分を含むため、やや大きく出る）で代用する
+    command = [sys.executable, os.path.join(REPO_DIR, f'{script}.py'), *args]
+    with open(log_path, 'w', encoding='utf-8') as log:
+        started = time.perf_counter()
+        process = subprocess.Popen(command, cwd=REPO_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        _pid, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - started
+    process.returncode = os.waitstatus_to_exitcode(status)
+    peak = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+    return process.returncode, elapsed, peak
+
+
+def read_metrics(metrics_dir):
+    # 子プロセスが utils.metrics で書き出した実行レポート（段階ごとの所要時間）
+    for name in sorted(os.listdir(metrics_dir)) if os.path.isdir(metrics_dir) else []:
+        if name.startswith('metrics_') and name.endswith('.json'):
+            with open(os.path.join(metrics_dir, name), encoding='utf-8') as f:
+                return json.load(f)
+    return None
+
+
+def bench(script, size, args):
+    catalog = fake_rakuten.Catalog(size, seed=args.seed)
+    options = fake_rakuten.server_options(args)
+    if script == 'main':
+        options['ranking_page_size'] = size
+    rakuten = fake_rakuten.start(catalog, **options)
+    postgrest = fake_postgrest.start(latency_ms=args.db_latency_ms, max_rows=args.max_rows)
+    seed(postgrest, script, size, catalog)
+
+    work_dir = tempfile.mkdtemp(prefix=f'bench_{script}_{size}_')
+    env = {
+        **os.environ,
+        'ENV': 'production',          # .env を読まない
+        'GITHUB_ACTIONS': 'true',     # ログファイルを作らない
+        'PYTHONPATH': REPO_DIR,
+        'RAKUTEN_API_BASE_URL': rakuten.base_url,
+        'RAKUTEN_APP_ID': 'bench',
+        'RAKUTEN_APP_IDS': ','.join(f'bench{i}' for i in range(args.app_ids)),
+        'SUPABASE_URL': postgrest.url,
+        'SUPABASE_KEY': 'bench',
+        'RAKUTEN_SYNC_STATE_DIR': os.path.join(work_dir, 'state'),
+        'RAKUTEN_METRICS_DIR': os.path.join(work_dir, 'metrics'),
+        'RAKUTEN_RATE_LIMIT': str(args.client_rate),
+        'RAKUTEN_CONCURRENCY': str(args.concurrency),
+    }
+    extra = shlex.split(args.extra_args) if args.extra_args else []
+    if args.history_mode != 'snapshot':
+        extra += ['--history-mode', args.history_mode]
+    code, elapsed, peak = run_child(script, script_args(script, size) + extra, env, os.path.join(work_dir, 'run.log'))
+
+    target, _source = TARGETS[script]
+    if args.history_mode == 'intervals' and script != 'main':
+        target = interval_spec(target).table
+    rows = len(postgrest.rows(target))
+    rakuten.shutdown()
+    postgrest.shutdown()
+    metrics = read_metrics(env['RAKUTEN_METRICS_DIR'])
+    peak = (metrics or {}).get('peak_memory_bytes') or peak
+    return {
+        'script': script,
+        'size': size,
+        'exit_code': code,
+        'elapsed_sec': round(elapsed, 3),
+        'rows': rows,
+        'rows_per_sec': round(rows / elapsed, 1),
+        'rakuten_requests': rakuten.stats['requests'],
+        'rakuten_req_per_sec': round(rakuten.stats['requests'] / elapsed, 1),
+        'rakuten_429': rakuten.stats['429_rate_limit'] + rakuten.stats['429_injected'],
+        'db_requests': postgrest.stats['requests'],
+        'db_req_per_sec': round(postgrest.stats['requests'] / elapsed, 1),
+        'peak_rss_mb': round(peak / 1024 / 1024, 1),
+        'stages': {
+            f"{t['name']}[{','.join(f'{k}={v}' for k, v in t['labels'].items())}]": round(t['sum'], 3)
+            for t in (metrics or {}).get('timings', [])
+        },
+        'log': os.path.join(work_dir, 'run.log'),
+    }
+
+
+def print_table(results):
+    columns = ('script', 'size', 'exit_code', 'elapsed_sec', 'rows', 'rows_per_sec', 'rakuten_req_per_sec',
+               'rakuten_429', 'db_req_per_sec', 'peak_rss_mb')
+    widths = [max(len(c), *(len(str(r[c])) for r in results)) for c in columns]
+    print('  '.join(c.rjust(w) for c, w in zip(columns, widths)))
+    for result in results:
+        print('  '.join(str(result[c]).rjust(w) for c, w in zip(columns, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='同期バッチのオフラインベンチマーク')
+    parser.add_argument('--scripts', nargs='+', default=list(SCRIPTS), choices=SCRIPTS)
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000], help='カタログの商品数（1000〜1000000）')
+    parser.add_argument('--client-rate', type=float, default=200.0, help='同期処理側の RAKUTEN_RATE_LIMIT（アプリIDごと）')
+    parser.add_argument('--concurrency', type=int, default=16, help='同期処理側の RAKUTEN_CONCURRENCY')
+    parser.add_argument('--app-ids', type=int, default=1, help='RAKUTEN_APP_IDS に並べるアプリID数')
+    parser.add_argument('--db-latency-ms', type=float, default=5.0, help='Supabase スタブの応答遅延（ミリ秒）')
+    parser.add_argument('--max-rows', type=int, default=1000, help='Supabase スタブの max-rows')
+    parser.add_argument('--seed', type=int, default=0, help='楽天APIスタブの価格変動の種')
+    parser.add_argument('--history-mode', choices=HISTORY_MODES, default='snapshot',
+                        help='main2〜main4 の履歴の保存形式（intervals は *_interval テーブルの行数を数える）')
+    parser.add_argument('--extra-args', default='', help='各スクリプトに渡す追加の引数（例: "--plan-by-shop"）')
+    parser.add_argument('--output', help='結果を JSON で保存するパス')
+    args = fake_rakuten.add_server_arguments(parser).parse_args()
+
+    results = []
+    for script in args.scripts:
+        for size in args.sizes:
+            result = bench(script, size, args)
+            results.append(result)
+            print(f"{script} × {size}: {result['rows']} 行 / {result['elapsed_sec']} 秒 (終了コード {result['exit_code']})",
+                  file=sys.stderr)
+    print_table(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
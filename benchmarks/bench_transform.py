@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# 概要 : 楽天API商品 -> DB行 の変換処理のベンチマーク
+#        従来の1件ずつの辞書内包表記（main3.py の transform_items 相当）と、
+#        rakuten_sync.schema の一括変換（行形式）を比較する
+#
+# 実行例 : python benchmarks/bench_transform.py --items 100000 --repeat 3
+#
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rakuten_sync.schema import PRICE_HISTORY, unwrap  # noqa: E402
+
+
+def make_items(count):
+    return [{'Item': {
+        'itemCode': f'shop{i % 500}:item{i}',
+        'itemName': f'商品 {i}',
+        'itemCaption': '説明文' * 20,
+        'catchcopy': 'キャッチコピー',
+        'itemPrice': 1000 + i % 5000,
+        'itemPriceBaseField': 'item_price_min3',
+        'itemPriceMin1': 1000, 'itemPriceMin2': 1000, 'itemPriceMin3': 1000,
+        'itemPriceMax1': 2000, 'itemPriceMax2': 2000, 'itemPriceMax3': 2000,
+        'itemUrl': f'https://item.rakuten.co.jp/shop/{i}/',
+        'affiliateUrl': '',
+        'affiliateRate': 4.0,
+        'availability': 1,
+        'creditCardFlag': 1, 'postageFlag': 0, 'taxFlag': 0,
+        'pointRate': 1,
+        'reviewAverage': 4.25,
+        'reviewCount': i % 300,
+        'shopCode': f'shop{i % 500}',
+        'shopName': 'ショップ',
+        'shopUrl': 'https://www.rakuten.co.jp/shop/',
+        'genreId': '100371',
+        'mediumImageUrls': [{'imageUrl': f'https://thumbnail.image.rakuten.co.jp/{i}/{n}.jpg'} for n in range(3)],
+        'smallImageUrls': [{'imageUrl': f'https://thumbnail.image.rakuten.co.jp/{i}/{n}_s.jpg'} for n in range(3)],
+    }} for i in range(count)]
+
+
+def legacy_transform(items):
+    # 変更前の main3.py / main4.py の transform_items をそのまま再現したもの
+    transformed = []
+    for wrapper in items:
+        item = wrapper.get('Item', {})
+        transformed.append({
+            'item_code': item.get('itemCode'),
+            'item_name': item.get('itemName'),
+            'item_caption': item.get('itemCaption'),
+            'catchcopy': item.get('catchcopy'),
+            'item_price': int(item.get('itemPrice', 0)),
+            'item_price_base_field': item.get('itemPriceBaseField'),
+            'item_price_min1': int(item.get('itemPriceMin1', 0)),
+            'item_price_min2': int(item.get('itemPriceMin2', 0)),
+            'item_price_min3': int(item.get('itemPriceMin3', 0)),
+            'item_price_max1': int(item.get('itemPriceMax1', 0)),
+            'item_price_max2': int(item.get('itemPriceMax2', 0)),
+            'item_price_max3': int(item.get('itemPriceMax3', 0)),
+            'item_url': item.get('itemUrl'),
+            'affiliate_url': item.get('affiliateUrl'),
+            'affiliate_rate': str(item.get('affiliateRate', '0.0')),
+            'availability': item.get('availability'),
+            'credit_card_flag': bool(item.get('creditCardFlag')),
+            'postage_flag': bool(item.get('postageFlag')),
+            'tax_flag': bool(item.get('taxFlag')),
+            'point_rate': item.get('pointRate'),
+            'review_average': str(item.get('reviewAverage', '0.0')),
+            'review_count': item.get('reviewCount'),
+            'shop_code': item.get('shopCode'),
+            'shop_name': item.get('shopName'),
+            'shop_url': item.get('shopUrl'),
+            'genre_id': item.get('genreId'),
+            'medium_image_urls': json.dumps(item.get('mediumImageUrls', [])),
+            'small_image_urls': json.dumps(item.get('smallImageUrls', [])),
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        })
+    return transformed
+
+
+def legacy_per_item(items):
+    # 変更前の実行時と同じく、1商品ごとに transform_items を呼ぶ
+    rows = []
+    for wrapper in items:
+        rows.extend(legacy_transform([wrapper]))
+    return rows
+
+
+def batch_rows(items, block_size):
+    rows = []
+    for start in range(0, len(items), block_size):
+        rows.extend(PRICE_HISTORY.rows_of(unwrap(items[start:start + block_size])))
+    return rows
+
+
+def measure(label, func, repeat, count):
+    best = min(_timed(func) for _ in range(repeat))
+    print(f"{label:<32} {best:8.3f} s  {count / best:12,.0f} items/s  {best / count * 1e6:7.2f} us/item")
+    return best
+
+
+def _timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='商品変換処理のベンチマーク')
+    parser.add_argument('--items', type=int, default=100_000)
+    parser.add_argument('--block-size', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    items = make_items(args.items)
+    print(f"items={args.items:,} block_size={args.block_size} repeat={args.repeat} (best of)")
+    base = measure('legacy: 1商品ずつ transform_items', lambda: legacy_per_item(items), args.repeat, args.items)
+    measure('legacy: 全件を1回で transform_items', lambda: legacy_transform(items), args.repeat, args.items)
+    rows = measure('schema: rows_of（行形式）', lambda: batch_rows(items, args.block_size), args.repeat, args.items)
+    print(f"speedup vs legacy per-item: rows x{base / rows:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# 概要 : Supabase（PostgREST）のスタブサーバー
+#        同期処理が使う select（order / limit / 比較・in・or フィルタ）、insert、upsert（on_conflict）、update、delete を
+#        メモリ上のテーブルで受ける。同期処理側は SUPABASE_URL=http://127.0.0.1:<port> で向け先を変える。
+#
+# 実行例 : python benchmarks/fake_postgrest.py --port 8082
+#
+
+import argparse
+import bisect
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+REST_PREFIX = '/rest/v1/'
+OPERATORS = {
+    'eq': lambda a, b: a == b,
+    'neq': lambda a, b: a != b,
+    'gt': lambda a, b: a is not None and a > b,
+    'gte': lambda a, b: a is not None and a >= b,
+    'lt': lambda a, b: a is not None and a < b,
+    'lte': lambda a, b: a is not None and a <= b,
+}
+
+
+def _coerce(value, sample):
+    # クエリ文字列の値を、列の値と比較できる型にそろえる
+    if isinstance(sample, bool):
+        return value == 'true'
+    if isinstance(sample, int):
+        return int(value)
+    if isinstance(sample, float):
+        return float(value)
+    return value
+
+
+def _parse_in(value):
+    # in.(a,"b,c") -> ['a', 'b,c']
+    inner = value[1:-1]
+    values, current, quoted = [], '', False
+    for char in inner:
+        if char == '"':
+            quoted = not quoted
+        elif char == ',' and not quoted:
+            values.append(current)
+            current = ''
+        else:
+            current += char
+    if inner:
+        values.append(current)
+    return values
+
+
+class Table:
+    def __init__(self):
+        self.rows = []
+        self.unique = {}   # on_conflict の列 -> {キー: 行番号}
+        self._sorted = {}  # 列 -> (値のリスト, 行番号のリスト)（書き込みで破棄）
+        self._next_id = 1  # serial の主キー（id を指定しない行に振る）
+
+    def _index(self, columns):
+        index = self.unique.get(columns)
+        if index is None:
+            index = self.unique[columns] = {tuple(row.get(c) for c in columns): i for i, row in enumerate(self.rows)}
+        return index
+
+    def insert(self, rows):
+        self._sorted.clear()
+        for row in rows:
+            if 'id' not in row:
+                row = {'id': self._next_id, **row}
+                self._next_id += 1
+            self.rows.append(row)
+            for columns, index in self.unique.items():
+                index[tuple(row.get(c) for c in columns)] = len(self.rows) - 1
+
+    def upsert(self, rows, on_conflict):
+        self._sorted.clear()
+        columns = tuple(on_conflict.split(','))
+        index = self._index(columns)
+        for row in rows:
+            key = tuple(row.get(c) for c in columns)
+            position = index.get(key)
+            if position is None:
+                self.insert([row])
+            else:
+                self.rows[position] = {**self.rows[position], **row}
+
+    def update(self, predicate, values):
+        updated = 0
+        for i, row in enumerate(self.rows):
+            if predicate(row):
+                self.rows[i] = {**row, **values}
+                updated += 1
+        if updated:
+            self.unique.clear()
+            self._sorted.clear()
+        return updated
+
+    def delete(self, predicate):
+        kept = [row for row in self.rows if not predicate(row)]
+        removed = len(self.rows) - len(kept)
+        if removed:
+            self.rows = kept
+            self.unique.clear()
+            self._sorted.clear()
+        return removed
+
+    def sorted_by(self, column):
+        cached = self._sorted.get(column)
+        if cached is None:
+            pairs = sorted((row[column], i) for i, row in enumerate(self.rows) if row.get(column) is not None)
+            cached = self._sorted[column] = ([value for value, _ in pairs], [i for _, i in pairs])
+        return cached
+
+
+class FakePostgrestServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms=0.0, max_rows=1000):
+        super().__init__(address, Handler)
+        self.latency = latency_ms / 1000
+        self.max_rows = max_rows  # PostgREST の db-max-rows
+        self.tables = {}
+        self.stats = Counter()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def table(self, name):
+        table = self.tables.get(name)
+        if table is None:
+            table = self.tables[name] = Table()
+        return table
+
+    def seed(self, name, rows):
+        with self.lock:
+            self.table(name).insert(list(rows))
+
+    def rows(self, name):
+        with self.lock:
+            return list(self.table(name).rows)
+
+
+def _split_or(value):
+    # or=(a.is.null,b.gt."x,y") -> [('a', 'is.null'), ('b', 'gt.x,y')]
+    parts = []
+    for condition in _parse_in(value):
+        column, _, expression = condition.partition('.')
+        parts.append((column, expression))
+    return parts
+
+
+def _filters(params, sample):
+    filters = []
+    for column, expression in params:
+        if column == 'or':
+            tests = [(c, test) for c, test in _filters(_split_or(expression), sample)]
+            filters.append((None, lambda row, tests=tests: any(test(row.get(c)) for c, test in tests)))
+            continue
+        operator, _, value = expression.partition('.')
+        if operator == 'in':
+            values = set(_parse_in(value))
+            filters.append((column, lambda a, values=values: a is not None and str(a) in values))
+        elif operator in OPERATORS:
+            typed = _coerce(value, sample.get(column)) if sample else value
+            filters.append((column, lambda a, op=OPERATORS[operator], b=typed: op(a, b)))
+        elif operator == 'is' and value == 'null':
+            filters.append((column, lambda a: a is None))
+    return filters
+
+
+def _matches(row, filters):
+    return all(test(row) if column is None else test(row.get(column)) for column, test in filters)
+
+
+def _select(table, params, max_rows):
+    select = None
+    order = None
+    limit = max_rows
+    offset = 0
+    conditions = []
+    for key, value in params:
+        if key == 'select':
+            select = None if value == '*' else value.split(',')
+        elif key == 'order':
+            order = value.split(',')[0]
+        elif key == 'limit':
+            limit = min(int(value), max_rows)
+        elif key == 'offset':
+            offset = int(value)
+        else:
+            conditions.append((key, value))
+
+    rows = table.rows
+    sample = rows[0] if rows else {}
+    filters = _filters(conditions, sample)
+    keyset_conditions = [(c, v) for c, v in conditions if c != 'or']
+    column, _, direction = (order or '').partition('.')
+    keyset = column and direction != 'desc' and len(keyset_conditions) == len(conditions) and \
+        all(c == column for c, _ in conditions) and all(v.startswith(('gt.', 'gte.')) for _, v in conditions)
+    if keyset and rows:
+        # キーセット方式のページングは、並べ替え済みの索引から二分探索で読む
+        values, positions = table.sorted_by(column)
+        start = 0
+        for _, value in conditions:
+            operator, _, bound = value.partition('.')
+            bound = _coerce(bound, sample.get(column))
+            start = max(start, (bisect.bisect_right if operator == 'gt' else bisect.bisect_left)(values, bound))
+        result = [table.rows[i] for i in positions[start + offset:start + offset + limit]]
+    else:
+        result = [row for row in rows if _matches(row, filters)]
+        if column:
+            present = [row for row in result if row.get(column) is not None]
+            present.sort(key=lambda row: row[column], reverse=direction == 'desc')
+            result = present + [row for row in result if row.get(column) is None]
+        result = result[offset:offset + limit]
+    if select:
+        result = [{c: row.get(c) for c in select} for row in result]
+    return result
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # ヘッダーと本文を別々に送るため、遅延ACKで待たされないようにする
+
+    def _parse(self):
+        url = urlsplit(self.path)
+        if not url.path.startswith(REST_PREFIX):
+            return None, []
+        return url.path[len(REST_PREFIX):], parse_qsl(url.query)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send(self, status, payload=b'[]', content_range=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        if content_range:
+            self.send_header('Content-Range', content_range)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self, method):
+        server = self.server
+        name, params = self._parse()
+        body = self._body()
+        if name is None:
+            return self._send(404, b'{"message": "not found"}')
+        if server.latency:
+            time.sleep(server.latency)
+        with server.lock:
+            server.stats['requests'] += 1
+            server.stats[method.lower()] += 1
+            table = server.table(name)
+            if method == 'GET':
+                rows = _select(table, params, server.max_rows)
+                server.stats['rows_read'] += len(rows)
+                return self._send(200, json.dumps(rows, ensure_ascii=False).encode('utf-8'),
+                                  f'0-{max(len(rows) - 1, 0)}/*')
+            if method == 'POST':
+                rows = json.loads(body or b'[]')
+                rows = rows if isinstance(rows, list) else [rows]
+                columns = dict(params).get('columns')
+                if columns:
+                    # PostgREST と同じく、columns にない項目は無視し、行にない列は null にする
+                    columns = [column.strip('"') for column in columns.split(',')]  # supabase-py は列名を引用符で囲む
+                    rows = [{column: row.get(column) for column in columns} for row in rows]
+                prefer = self.headers.get('Prefer', '')
+                on_conflict = dict(params).get('on_conflict')
+                if 'merge-duplicates' in prefer and on_conflict:
+                    table.upsert(rows, on_conflict)
+                else:
+                    table.insert(rows)
+                server.stats['rows_written'] += len(rows)
+                # return=representation なら受け取った行をそのまま返す
+                return self._send(201, body if 'return=minimal' not in prefer else b'')
+            if method == 'PATCH':
+                rows = table.rows
+                filters = _filters(params, rows[0] if rows else {})
+                updated = table.update(lambda row: _matches(row, filters), json.loads(body or b'{}'))
+                server.stats['rows_updated'] += updated
+                return self._send(200, b'[]')
+            if method == 'DELETE':
+                rows = table.rows
+                filters = _filters(params, rows[0] if rows else {})
+                removed = table.delete(lambda row: _matches(row, filters))
+                server.stats['rows_deleted'] += removed
+                return self._send(200, b'[]')
+        return self._send(405, b'{"message": "method not allowed"}')
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start(host='127.0.0.1', port=0, **options):
+    server = FakePostgrestServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, name='fake-postgrest', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Supabase（PostgREST）のスタブサーバー')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8082)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--max-rows', type=int, default=1000)
+    args = parser.parse_args()
+    server = FakePostgrestServer((args.host, args.port), latency_ms=args.latency_ms, max_rows=args.max_rows)
+    print(f'SUPABASE_URL={server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(dict(server.stats))
+
+
+if __name__ == '__main__':
+    main()
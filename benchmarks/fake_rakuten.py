@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# 概要 : 楽天API（商品検索・ランキング・ジャンル検索）のスタブサーバー
+#        本番のAPIを使わずに同期処理のスループットを測るためのもの。
+#        応答の遅延、アプリIDごとのレート上限（超過時は 429 + Retry-After）、429 / 502 の混入、
+#        記録済みレスポンスの再生（JSONL または state/rakuten_cache.sqlite）に対応する。
+#        同期処理側は RAKUTEN_API_BASE_URL=http://127.0.0.1:<port>/services/api で向け先を変える。
+#
+# 実行例 : python benchmarks/fake_rakuten.py --port 8081 --items 100000 --latency-ms 30 --rate-limit 10
+#
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rakuten.cache import IGNORED_PARAMS, cache_key, endpoint_name  # noqa: E402
+from rakuten.http_client import RAKUTEN_API_ROOT  # noqa: E402
+
+API_PREFIX = '/services/api'
+SEARCH_PAGE_SIZE = 30
+RANKING_PAGE_SIZE = 30
+RANKING_MAX_PAGES = 34
+
+
+def item_code(index, shops):
+    return f'shop{index % shops}:item{index}'
+
+
+def parse_item_code(code):
+    # "shop<j>:item<i>" -> i（カタログ外の形式は None）
+    _shop, _, item = code.partition(':')
+    if not item.startswith('item') or not item[4:].isdigit():
+        return None
+    return int(item[4:])
+
+
+def _unit(*parts):
+    # 0〜1 の決定的な疑似乱数
+    digest = hashlib.blake2b(':'.join(map(str, parts)).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 2 ** 64
+
+
+class Catalog:
+    # 商品番号から決まる合成カタログ。seed を変えると change_rate の割合の商品だけ価格・在庫が変わる
+    def __init__(self, items, shops=None, seed=0, change_rate=0.1):
+        self.items = items
+        self.shops = shops or max(1, items // 200)
+        self.seed = seed
+        self.change_rate = change_rate
+
+    def item(self, index):
+        changed = self.seed and _unit('change', index, self.seed) < self.change_rate
+        price = 1000 + index % 5000 + (int(_unit('price', index, self.seed) * 500) if changed else 0)
+        return {
+            'itemCode': item_code(index, self.shops),
+            'itemName': f'ベンチマーク商品 {index}',
+            'itemCaption': '商品説明' * 25,
+            'catchcopy': 'キャッチコピー',
+            'itemPrice': price,
+            'itemPriceBaseField': 'item_price_min3',
+            'itemPriceMin1': price, 'itemPriceMin2': price, 'itemPriceMin3': price,
+            'itemPriceMax1': price, 'itemPriceMax2': price, 'itemPriceMax3': price,
+            'itemUrl': f'https://item.rakuten.co.jp/shop{index % self.shops}/{index}/',
+            'affiliateUrl': '',
+            'affiliateRate': 4.0,
+            'availability': 0 if changed and index % 7 == 0 else 1,
+            'creditCardFlag': 1, 'postageFlag': index % 2, 'taxFlag': 0,
+            'pointRate': 1,
+            'reviewAverage': round(3 + (index % 20) / 10, 2),
+            'reviewCount': index % 300,
+            'shopCode': f'shop{index % self.shops}',
+            'shopName': f'ショップ {index % self.shops}',
+            'shopUrl': f'https://www.rakuten.co.jp/shop{index % self.shops}/',
+            'genreId': str(100000 + index % 50),
+            'mediumImageUrls': [{'imageUrl': f'https://thumbnail.image.rakuten.co.jp/{index}/{k}.jpg'} for k in range(3)],
+            'smallImageUrls': [{'imageUrl': f'https://thumbnail.image.rakuten.co.jp/{index}/s{k}.jpg'} for k in range(3)],
+            'tagIds': [1000 + index % 10, 2000 + index % 7],
+        }
+
+    def search_by_code(self, code):
+        index = parse_item_code(code)
+        if index is None or index >= self.items:
+            return {'count': 0, 'page': 1, 'pageCount': 0, 'hits': 0, 'Items': []}
+        return {'count': 1, 'page': 1, 'pageCount': 1, 'hits': 1, 'Items': [{'Item': self.item(index)}]}
+
+    def search_by_shop(self, shop_code, page, hits):
+        # ショップ j の商品は j, j + shops, j + 2*shops, ...
+        shop = int(shop_code[4:]) if shop_code[4:].isdigit() else self.shops
+        total = 0 if shop >= self.shops else len(range(shop, self.items, self.shops))
+        start = (page - 1) * hits
+        indexes = range(shop + start * self.shops, self.items, self.shops)[:hits] if total else []
+        return {
+            'count': total, 'page': page, 'hits': hits, 'pageCount': -(-total // hits),
+            'Items': [{'Item': self.item(index)} for index in indexes],
+        }
+
+    def ranking(self, genre_id, page, hits):
+        # ジャンルごとに異なる区間のカタログを順位順に返す
+        offset = int(_unit('genre', genre_id) * self.items)
+        start = (page - 1) * hits
+        items = []
+        for rank in range(start + 1, min(start + hits, RANKING_MAX_PAGES * hits) + 1):
+            item = self.item((offset + rank - 1) % self.items)
+            item['rank'] = rank
+            items.append({'Item': item})
+        return {'page': page, 'pageCount': RANKING_MAX_PAGES, 'hits': hits, 'Items': items}
+
+    def genre_children(self, genre_id, fanout):
+        genre_id = int(genre_id or 0)
+        if genre_id >= 10 ** 6:
+            return []
+        return [{'child': {'genreId': genre_id * 10 + k + 1, 'genreLevel': 1}} for k in range(fanout)]
+
+
+class Replay:
+    # 記録済みレスポンス。JSONL は1行に {"path", "params", "status", "body"}、
+    # .sqlite は同期処理のレスポンスキャッシュ（キーは rakuten.cache.cache_key）
+    def __init__(self, path):
+        self.path = path
+        self.responses = {}
+        self.conn = None
+        if path.endswith('.sqlite'):
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.lock = threading.Lock()
+        else:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        key = self._key(record['path'], record.get('params', {}))
+                        self.responses[key] = (record.get('status', 200), record['body'])
+
+    @staticmethod
+    def _key(path, params):
+        return endpoint_name(path), tuple(sorted((k, str(v)) for k, v in params.items() if k not in IGNORED_PARAMS))
+
+    def lookup(self, path, params):
+        if self.conn is None:
+            return self.responses.get(self._key(path, params))
+        key = cache_key(RAKUTEN_API_ROOT + path[len(API_PREFIX):], params)
+        with self.lock:
+            row = self.conn.execute('select body from response_cache where key = ?', (key,)).fetchone()
+        return (200, json.loads(row[0])) if row else None
+
+
+class FakeRakutenServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, catalog, latency_ms=0.0, rate_limit=0.0, inject_429=0.0, inject_5xx=0.0,
+                 retry_after=1, genre_fanout=0, ranking_page_size=None, replay=None):
+        super().__init__(address, Handler)
+        self.catalog = catalog
+        self.latency = latency_ms / 1000
+        self.rate_limit = rate_limit
+        self.inject_429 = inject_429
+        self.inject_5xx = inject_5xx
+        self.retry_after = retry_after
+        self.genre_fanout = genre_fanout
+        self.ranking_page_size = ranking_page_size
+        self.replay = replay
+        self.stats = Counter()
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}{API_PREFIX}'
+
+    def admit(self, app_id):
+        # アプリIDごとに直近1秒のリクエスト数を数え、上限を超えたら拒否する
+        if not self.rate_limit:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.setdefault(app_id, deque())
+            while window and now - window[0] >= 1:
+                window.popleft()
+            if len(window) >= self.rate_limit:
+                return False
+            window.append(now)
+            return True
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def respond(self, path, params):
+        self.count('requests')
+        if not self.admit(params.get('applicationId')):
+            self.count('429_rate_limit')
+            return 429, {'error': 'too_many_requests', 'error_description': 'This application is rate limited'}
+        if self.inject_429 and random.random() < self.inject_429:
+            self.count('429_injected')
+            return 429, {'error': 'too_many_requests', 'error_description': 'injected'}
+        if self.inject_5xx and random.random() < self.inject_5xx:
+            self.count('502_injected')
+            return 502, {'error': 'bad_gateway'}
+        if self.latency:
+            time.sleep(self.latency * random.uniform(0.5, 1.5))
+        if self.replay is not None:
+            recorded = self.replay.lookup(path, params)
+            if recorded is not None:
+                self.count('replayed')
+                return recorded
+        endpoint = endpoint_name(path)
+        page = int(params.get('page', 1))
+        if endpoint == 'IchibaItem/Search':
+            self.count('search')
+            if params.get('itemCode'):
+                return 200, self.catalog.search_by_code(params['itemCode'])
+            if params.get('shopCode'):
+                return 200, self.catalog.search_by_shop(params['shopCode'], page, int(params.get('hits', SEARCH_PAGE_SIZE)))
+            return 400, {'error': 'wrong_parameter', 'error_description': 'keyword, genreId, itemCode or shopCode is required'}
+        if endpoint == 'IchibaItem/Ranking':
+            self.count('ranking')
+            hits = self.ranking_page_size or int(params.get('hits', RANKING_PAGE_SIZE))
+            return 200, self.catalog.ranking(params.get('genreId', '0'), page, hits)
+        if endpoint == 'IchibaGenre/Search':
+            self.count('genre')
+            return 200, {'children': self.catalog.genre_children(params.get('genreId'), self.genre_fanout)}
+        return 404, {'error': 'not_found', 'error_description': 'unknown endpoint'}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # ヘッダーと本文を別々に送るため、遅延ACKで待たされないようにする
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query))
+        status, body = self.server.respond(url.path, params)
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        if status == 429:
+            self.send_header('Retry-After', str(self.server.retry_after))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start(catalog, host='127.0.0.1', port=0, **options):
+    # 別スレッドで起動したサーバーを返す（port=0 なら空いているポート）
+    server = FakeRakutenServer((host, port), catalog, **options)
+    threading.Thread(target=server.serve_forever, name='fake-rakuten', daemon=True).start()
+    return server
+
+
+def add_server_arguments(parser):
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='応答までの平均遅延（ミリ秒）')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='アプリIDごとの1秒あたりの上限（0 は無制限）')
+    parser.add_argument('--inject-429', type=float, default=0.0, help='ランダムに 429 を返す割合')
+    parser.add_argument('--inject-5xx', type=float, default=0.0, help='ランダムに 502 を返す割合')
+    parser.add_argument('--retry-after', type=int, default=1, help='429 の Retry-After（秒）')
+    parser.add_argument('--genre-fanout', type=int, default=0, help='ジャンル検索で返す子ジャンル数')
+    parser.add_argument('--replay', help='記録済みレスポンス（.jsonl または rakuten_cache.sqlite）')
+    return parser
+
+
+def server_options(args):
+    return {
+        'latency_ms': args.latency_ms,
+        'rate_limit': args.rate_limit,
+        'inject_429': args.inject_429,
+        'inject_5xx': args.inject_5xx,
+        'retry_after': args.retry_after,
+        'genre_fanout': args.genre_fanout,
+        'replay': Replay(args.replay) if args.replay else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='楽天APIのスタブサーバー')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--items', type=int, default=10000, help='カタログの商品数')
+    parser.add_argument('--shops', type=int, default=None, help='ショップ数（既定は商品数 / 200）')
+    parser.add_argument('--seed', type=int, default=0, help='価格変動の種（変えると一部の商品の価格が変わる）')
+    parser.add_argument('--change-rate', type=float, default=0.1, help='seed を変えたときに変化する商品の割合')
+    args = add_server_arguments(parser).parse_args()
+    catalog = Catalog(args.items, args.shops, args.seed, args.change_rate)
+    server = FakeRakutenServer((args.host, args.port), catalog, **server_options(args))
+    print(f'RAKUTEN_API_BASE_URL={server.base_url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(dict(server.stats))
+
+
+if __name__ == '__main__':
+    main()
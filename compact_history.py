@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# プログラム名 : compact_history.py
+# 概要         : 価格履歴・ランキング履歴のスナップショット行を、期間形式（--history-mode intervals）の
+#                *_interval テーブルへ詰め直す。期間形式に切り替える前に一度実行する
+# 実行例       : python compact_history.py trn_rakuten_price_history
+#                python compact_history.py trn_rakuten_ranking --max-gap-hours 24 --delete-snapshots
+#
+
+import argparse
+import os
+from datetime import timedelta
+from dotenv import load_dotenv
+from rakuten_sync.compaction import compact_history
+from rakuten_sync.intervals import SPECS
+from supabase_client.client import get_supabase
+from supabase_client.copy_writer import add_writer_argument, writer_client
+from utils import metrics
+import logging
+
+# .env の読み込み（ローカル実行時のみ）
+if os.path.exists('.env'):
+    load_dotenv()
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='履歴のスナップショット行を期間形式に詰め直す')
+    parser.add_argument('tables', nargs='+', choices=list(SPECS), help='詰め直すスナップショットテーブル')
+    parser.add_argument(
+        '--max-gap-hours',
+        type=float,
+        help='次の観測までこの時間より空いた期間は、最後の観測からこの時間後に閉じる（trn_rakuten_ranking は既定 24）',
+    )
+    parser.add_argument('--batch-codes', type=int, default=20, help='一度に読み込む商品コードの数')
+    parser.add_argument('--replace', action='store_true', help='期間テーブルにすでに行のある商品も作り直す')
+    parser.add_argument(
+        '--delete-snapshots',
+        action='store_true',
+        help='期間テーブルへ登録できた商品のスナップショット行を削除する（元に戻せない）',
+    )
+    return add_writer_argument(parser).parse_args()
+
+def main():
+    args = parse_args()
+    metrics.start_run('compaction')
+    supabase = get_supabase()
+    db = writer_client(supabase, args.writer)
+    for table in args.tables:
+        hours = args.max_gap_hours
+        if hours is None and table == 'trn_rakuten_ranking':
+            hours = 24
+        logging.info(f"=== {table} の詰め直し開始 ===")
+        try:
+            compact_history(
+                supabase, db, SPECS[table], batch_codes=args.batch_codes,
+                max_gap=timedelta(hours=hours) if hours else None,
+                replace=args.replace, delete_snapshots=args.delete_snapshots,
+            )
+        except Exception:
+            logging.exception(f"{table} の詰め直しで予期せぬエラーが発生しました")
+
+if __name__ == '__main__':
+    main()
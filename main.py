@@ -1,23 +1,27 @@
 from rakuten.api import fetch_ranking_items, fetch_item_details
-from supabase_client.client import insert_items
+from supabase_client.client import batch_writer, insert_items
+from utils import metrics
 from utils.logger import logger
 
 def main():
+    metrics.start_run('item_detail')
     logger.info("楽天ランキング取得開始")
 
     ranking_items = fetch_ranking_items()
     logger.info(f"ランキング取得: {len(ranking_items)}件")
 
-    for item in ranking_items:
-        item_code = item.get("itemCode")
-        if not item_code:
-            continue
+    # 商品詳細・画像・タグは複数商品分をまとめて書き込み、最後に残りをフラッシュする
+    with batch_writer() as writer:
+        for item in ranking_items:
+            item_code = item.get("itemCode")
+            if not item_code:
+                continue
 
-        details = fetch_item_details(item_code)
-        if details:
-            insert_items(details)
+            details = fetch_item_details(item_code)
+            if details:
+                insert_items(details, writer)
 
-    logger.info("処理完了")
+    logger.info(f"処理完了（書き込みリクエスト {writer.requests} 回）")
 
 if __name__ == "__main__":
     main()
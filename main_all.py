@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# プログラム名 : main_all.py
+# 概要         : main2.py / main3.py / main4.py の処理を1プロセスで実行し、各商品の取得を1回にまとめる
+# 作成者       : Your Name
+# 作成日       : 2026-10-17
+# 実行方法     : python -m rakuten_sync all と同じ（引数もそのまま渡す）。
+#                複数のジョブを1プロセスで実行する場合は python -m rakuten_sync ranking tracked-refresh のように指定する
+# 更新履歴     :
+#   - 2026-10-17 初版作成
+#   - 2026-10-17 python -m rakuten_sync（rakuten_sync/cli.py）の呼び出しに変更
+#
+
+import sys
+
+from rakuten_sync.cli import main
+
+if __name__ == '__main__':
+    sys.exit(main(['all', *sys.argv[1:]]))
@@ -1,9 +1,49 @@
-import httpx
-import os
+import logging
+import time
 from dotenv import load_dotenv
 
+from rakuten.cache import endpoint_name, get_cache
+from rakuten.http_client import api_url, get_client
+from rakuten.key_pool import app_ids_from_env, get_key_pool
+from rakuten.retry import RetryPolicy
+from utils import metrics
+from utils.fastjson import loads
+
+logger = logging.getLogger(__name__)
+
 load_dotenv()
-APP_ID = os.getenv("RAKUTEN_APP_ID")
+APP_ID = next(iter(app_ids_from_env()), None)
+
+def get_json(url, params):
+    # 有効期限内のキャッシュがあればAPIを呼ばずに返す
+    cache = get_cache()
+    cached = cache.get(url, params)
+    if cached is not None:
+        return cached
+    # 並列取得と同じレート制限・再試行方針で呼び出す。再試行しても失敗した場合は例外を送出する
+    pool = get_key_pool()
+    policy = RetryPolicy(pool, params.get('itemCode') or url)
+    endpoint = endpoint_name(url)
+    while True:
+        api_key = pool.acquire_blocking()
+        started = time.perf_counter()
+        try:
+            response = get_client().get(api_url(url), params=api_key.apply(params))
+        except Exception as e:
+            metrics.count('api_requests', endpoint=endpoint, status='error')
+            delay = policy.on_error(api_key, e)
+            if delay is None:
+                raise
+        else:
+            metrics.observe('api_request', time.perf_counter() - started, endpoint=endpoint)
+            metrics.count('api_requests', endpoint=endpoint, status=response.status_code)
+            delay = policy.on_response(api_key, response)
+            if delay is None:
+                response.raise_for_status()
+                data = loads(response.content)
+                cache.set(url, params, data, body=response.content)
+                return data
+        time.sleep(delay)
 
 def fetch_ranking_items():
     url = "https://app.rakuten.co.jp/services/api/IchibaItem/Ranking/20170628"
@@ -11,9 +51,7 @@ def fetch_ranking_items():
         "applicationId": APP_ID,
         "format": "json"
     }
-    response = httpx.get(url, params=params)
-    response.raise_for_status()
-    return [item["Item"] for item in response.json().get("Items", [])]
+    return [item["Item"] for item in get_json(url, params).get("Items", [])]
 
 def fetch_item_details(item_code: str):
     url = "https://app.rakuten.co.jp/services/api/IchibaItem/Search/20170706"
@@ -22,7 +60,10 @@ def fetch_item_details(item_code: str):
         "format": "json",
         "itemCode": item_code
     }
-    response = httpx.get(url, params=params)
-    response.raise_for_status()
-    items = response.json().get("Items", [])
+    try:
+        items = get_json(url, params).get("Items", [])
+    except Exception:
+        # 1件の失敗で実行全体を止めず、その商品だけ飛ばす
+        logger.exception(f"[ERROR] 商品コード {item_code} の取得失敗")
+        return None
     return items[0]["Item"] if items else None
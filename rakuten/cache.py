@@ -0,0 +1,169 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+from utils import metrics
+from utils.fastjson import dumps, loads
+from utils.state import state_path
+
+# 楽天APIのレスポンスをローカルのSQLiteに保存し、有効期限内の同じ問い合わせではAPIを呼ばない。
+# キーはエンドポイントURLとパラメータ（applicationId などの認証情報は除く）。
+
+logger = logging.getLogger(__name__)
+
+# エンドポイントごとの有効期限（秒）。RAKUTEN_CACHE_TTL_<SEARCH|RANKING|...> で上書きできる
+DEFAULT_TTLS = {
+    'IchibaItem/Search': 600,
+    'IchibaItem/Ranking': 1800,
+    'IchibaGenre/Search': 86400,
+}
+DEFAULT_TTL = 600
+IGNORED_PARAMS = {'applicationId', 'affiliateId'}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def endpoint_name(url):
+    # https://app.rakuten.co.jp/services/api/IchibaItem/Search/20220601 -> IchibaItem/Search
+    parts = urlparse(url).path.strip('/').split('/')
+    if parts and parts[-1].isdigit():
+        parts = parts[:-1]
+    return '/'.join(parts[-2:])
+
+
+def ttl_for(endpoint):
+    env_name = 'RAKUTEN_CACHE_TTL_' + endpoint.split('/')[-1].upper()
+    return float(os.getenv(env_name, DEFAULT_TTLS.get(endpoint, DEFAULT_TTL)))
+
+
+def cache_key(url, params):
+    filtered = sorted((k, str(v)) for k, v in params.items() if k not in IGNORED_PARAMS)
+    return hashlib.sha256(json.dumps([url, filtered]).encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path=None, max_bytes=None):
+        self.path = path or state_path('rakuten_cache.sqlite')
+        self.max_bytes = max_bytes or int(float(os.getenv('RAKUTEN_CACHE_MAX_MB', '256')) * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("""
+                create table if not exists response_cache (
+                    key text primary key,
+                    endpoint text not null,
+                    body blob not null,
+                    size integer not null,
+                    expires_at real not null,
+                    accessed_at real not null
+                )
+            """)
+            self._conn.execute("create index if not exists response_cache_accessed on response_cache (accessed_at)")
+            self._total = self._conn.execute("select coalesce(sum(size), 0) from response_cache").fetchone()[0]
+
+    def get(self, url, params):
+        key = cache_key(url, params)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "select body, expires_at from response_cache where key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] <= now:
+                self.misses += 1
+                metrics.count('cache_lookups', endpoint=endpoint_name(url), result='miss')
+                return None
+            with self._conn:
+                self._conn.execute("update response_cache set accessed_at = ? where key = ?", (now, key))
+            self.hits += 1
+        metrics.count('cache_lookups', endpoint=endpoint_name(url), result='hit')
+        return loads(row[0])
+
+    def set(self, url, params, payload, body=None):
+        # body（レスポンスの本文）を渡すと、payload を変換し直さずにそのまま保存する
+        body = dumps(payload) if body is None else body
+        now = time.time()
+        endpoint = endpoint_name(url)
+        key = cache_key(url, params)
+        with self._lock, self._conn:
+            old = self._conn.execute("select size from response_cache where key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "insert or replace into response_cache (key, endpoint, body, size, expires_at, accessed_at) "
+                "values (?, ?, ?, ?, ?, ?)",
+                (key, endpoint, body, len(body), now + ttl_for(endpoint), now),
+            )
+            self._total += len(body) - (old[0] if old else 0)
+            if self._total > self.max_bytes:
+                self._evict(now)
+
+    def _evict(self, now):
+        # 期限切れを消し、それでも上限を超える場合は最後に参照された時刻が古い順に消す
+        self._conn.execute("delete from response_cache where expires_at <= ?", (now,))
+        target = int(self.max_bytes * 0.9)
+        total = self._conn.execute("select coalesce(sum(size), 0) from response_cache").fetchone()[0]
+        if total > target:
+            rows = self._conn.execute("select key, size from response_cache order by accessed_at").fetchall()
+            victims = []
+            for key, size in rows:
+                if total <= target:
+                    break
+                victims.append((key,))
+                total -= size
+            self._conn.executemany("delete from response_cache where key = ?", victims)
+        self._total = total
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            'bytes': self._total,
+        }
+
+    def log_stats(self):
+        stats = self.stats()
+        logger.info(
+            f"APIキャッシュ: ヒット {stats['hits']} 件 / ミス {stats['misses']} 件 "
+            f"(ヒット率 {stats['hit_rate']:.1%}, {stats['bytes'] / 1024 / 1024:.1f} MB)"
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class NullCache:
+    # RAKUTEN_CACHE=0 のときに使う、何も保存しないキャッシュ
+    hits = 0
+    misses = 0
+
+    def get(self, url, params):
+        return None
+
+    def set(self, url, params, payload, body=None):
+        pass
+
+    def stats(self):
+        return {'hits': 0, 'misses': 0, 'hit_rate': 0.0, 'bytes': 0}
+
+    def log_stats(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache() if os.getenv('RAKUTEN_CACHE', '1') != '0' else NullCache()
+        return _cache
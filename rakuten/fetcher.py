@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import AsyncExitStack, aclosing
+
+from rakuten.cache import endpoint_name, get_cache
+from rakuten.http_client import api_url, new_async_client
+from rakuten.key_pool import get_key_pool
+from rakuten.retry import RetryPolicy, get_retry_budget
+from utils import metrics
+from utils.fastjson import loads
+
+logger = logging.getLogger(__name__)
+
+ITEM_SEARCH_URL = 'https://app.rakuten.co.jp/services/api/IchibaItem/Search/20220601'
+
+_DONE = object()
+
+
+# --- 並列取得の設定（環境変数で上書き可能、.env 読み込み後に評価する） ---
+def _concurrency():
+    return int(os.getenv('RAKUTEN_CONCURRENCY', '4'))  # 同時に投げるリクエスト数
+
+
+async def _get_json(client, pool, key, url, params):
+    # キャッシュにあればレート制限のトークンも消費しない
+    cache = get_cache()
+    cached = cache.get(url, params)
+    if cached is not None:
+        return key, cached
+    policy = RetryPolicy(pool, key)
+    endpoint = endpoint_name(url)
+    while True:
+        api_key = await pool.acquire()
+        started = time.perf_counter()
+        try:
+            response = await client.get(api_url(url), params=api_key.apply(params))
+        except Exception as e:
+            metrics.count('api_requests', endpoint=endpoint, status='error')
+            delay = policy.on_error(api_key, e)
+            if delay is None:
+                logger.exception(f"[ERROR] {key} の取得失敗")
+                return key, None
+        else:
+            metrics.observe('api_request', time.perf_counter() - started, endpoint=endpoint)
+            metrics.count('api_requests', endpoint=endpoint, status=response.status_code)
+            delay = policy.on_response(api_key, response)
+            if delay is None:
+                try:
+                    response.raise_for_status()
+                    data = loads(response.content)
+                except Exception:
+                    logger.exception(f"[ERROR] {key} の取得失敗")
+                    return key, None
+                cache.set(url, params, data, body=response.content)
+                return key, data
+        await asyncio.sleep(delay)
+
+
+class _JobReader:
+    # 同期のイテラブル（Supabase をページ単位で読むジェネレータ等）を別スレッドで先読みする。
+    # イベントループ側は先読み済みの分を待たずに取り出し、ページの読み込みを待つ間もループを止めない
+    def __init__(self, jobs, buffer_size):
+        self._jobs = queue.Queue(maxsize=buffer_size)
+        self._stop = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, args=(iter(jobs),), name='rakuten-jobs', daemon=True)
+        self._thread.start()
+
+    def _run(self, jobs):
+        try:
+            for job in jobs:
+                if not self._put(job):
+                    return
+        except BaseException as e:
+            self._error = e
+        self._put(_DONE)
+
+    def _put(self, entry):
+        while not self._stop.is_set():
+            try:
+                self._jobs.put(entry, timeout=0.05)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _wait(self):
+        while not self._stop.is_set():
+            try:
+                return self._jobs.get(timeout=0.05)
+            except queue.Empty:
+                pass
+        return _DONE
+
+    def _checked(self, job):
+        if job is _DONE and self._error is not None:
+            raise self._error  # jobs の例外（商品コードの読み込み失敗等）は取得側にも送出する
+        return job
+
+    def get_nowait(self):
+        # 先読み済みの job。なければ None、読み終えたら _DONE
+        try:
+            return self._checked(self._jobs.get_nowait())
+        except queue.Empty:
+            return None
+
+    async def get(self):
+        return self._checked(await asyncio.to_thread(self._wait))
+
+    def close(self):
+        self._stop.set()
+
+
+async def iter_fetch(jobs, pool=None, concurrency=None, client=None):
+    # jobs: (key, url, params) のイテラブル。完了した順に (key, JSON or None) を返す。
+    # client を渡すと、複数回の呼び出しで接続を共有できる。レート制限は既定でプロセス全体のキープールを共有する。
+    # jobs は別スレッドで先読みする（_JobReader）
+    pool = pool or get_key_pool()
+    limit = concurrency or _concurrency()
+    reader = _JobReader(jobs, buffer_size=max(limit * 4, 100))
+    pending = set()
+    waiting_job = None  # 先読みが追いついていないときに、次の job を待つタスク
+    exhausted = False
+    async with AsyncExitStack() as stack:
+        if client is None:
+            client = await stack.enter_async_context(new_async_client())
+        try:
+            while True:
+                while len(pending) < limit and not exhausted and waiting_job is None:
+                    job = reader.get_nowait()
+                    if job is None:
+                        waiting_job = asyncio.ensure_future(reader.get())
+                    elif job is _DONE:
+                        exhausted = True
+                    else:
+                        pending.add(asyncio.create_task(_get_json(client, pool, *job)))
+                waiting = pending | {waiting_job} if waiting_job is not None else pending
+                if not waiting:
+                    return
+                done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task is waiting_job:
+                        waiting_job = None
+                        job = task.result()
+                        if job is _DONE:
+                            exhausted = True
+                        else:
+                            pending.add(asyncio.create_task(_get_json(client, pool, *job)))
+                    else:
+                        pending.discard(task)
+                        yield task.result()
+        finally:
+            reader.close()
+            for task in pending:
+                task.cancel()
+            if waiting_job is not None:
+                waiting_job.cancel()
+
+
+def log_api_stats():
+    get_cache().log_stats()
+    get_retry_budget().log_stats()
+    get_key_pool().log_stats()
+
+
+def item_search_params(app_id, item_code):
+    return {
+        'applicationId': app_id,
+        'format': 'json',
+        'itemCode': item_code
+    }
+
+
+def item_search_jobs(item_codes, app_id):
+    for code in item_codes:
+        yield code, ITEM_SEARCH_URL, item_search_params(app_id, code)
+
+
+def iter_in_background(produce, buffer_size=100):
+    # produce（非同期ジェネレータを返す関数）を別スレッドのイベントループで動かし、値を順次返す。
+    # 呼び出し側が書き込み中でも取得は進み、buffer_size 件溜まった時点で取得側が待つ。
+    results = queue.Queue(maxsize=buffer_size)
+    stop = threading.Event()
+    errors = []
+
+    async def put(entry):
+        while not stop.is_set():
+            try:
+                results.put_nowait(entry)
+                return True
+            except queue.Full:
+                await asyncio.sleep(0.05)
+        return False
+
+    async def pump():
+        async with aclosing(produce()) as produced:
+            async for entry in produced:
+                if not await put(entry):
+                    return
+
+    def run():
+        try:
+            asyncio.run(pump())
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            asyncio.run(put(_DONE))
+
+    thread = threading.Thread(target=run, name='rakuten-fetcher', daemon=True)
+    thread.start()
+    try:
+        while True:
+            entry = results.get()
+            if entry is _DONE:
+                break
+            yield entry
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()
+        thread.join()
+
+
+def iter_items_by_codes(item_codes, app_id, buffer_size=100, **options):
+    # 取得できた順に (item_code, Items) を返す
+    async def produce():
+        async with aclosing(iter_fetch(item_search_jobs(item_codes, app_id), **options)) as fetched:
+            async for code, data in fetched:
+                if data is not None:
+                    logger.info(f"商品コード {code} の取得成功")
+                yield code, (data or {}).get('Items', [])
+
+    return iter_in_background(produce, buffer_size)
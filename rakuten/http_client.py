@@ -0,0 +1,84 @@
+import atexit
+import os
+import threading
+
+# 楽天APIへの全リクエストで共有するHTTPクライアント。
+# 接続プールを使い回すことで、商品ごとのTCP/TLSハンドシェイクを避ける。
+# httpx の読み込みには時間がかかるため、最初にクライアントを作るときに読み込む（起動時間を短くする）。
+
+RAKUTEN_API_ROOT = 'https://app.rakuten.co.jp/services/api'
+
+DEFAULT_HEADERS = {
+    'Accept-Encoding': 'gzip, deflate',
+    'User-Agent': 'rakuten_sync',
+}
+
+_client = None
+_lock = threading.Lock()
+
+
+def _http2_enabled():
+    if os.getenv('RAKUTEN_HTTP2', '1') == '0':
+        return False
+    try:
+        import h2  # noqa: F401  (httpx[http2] がインストールされている場合のみ有効)
+    except ImportError:
+        return False
+    return True
+
+
+def api_url(url):
+    # RAKUTEN_API_BASE_URL を指定すると、楽天APIの呼び出し先を差し替える（ベンチマーク用のスタブサーバーなど）。
+    # キャッシュのキーやログには元のURLを使う
+    base = os.getenv('RAKUTEN_API_BASE_URL')
+    if base and url.startswith(RAKUTEN_API_ROOT):
+        return base.rstrip('/') + url[len(RAKUTEN_API_ROOT):]
+    return url
+
+
+def client_options():
+    # 環境変数で接続プールとタイムアウトを調整できる
+    import httpx
+
+    return {
+        'http2': _http2_enabled(),
+        'headers': DEFAULT_HEADERS,
+        'timeout': httpx.Timeout(
+            float(os.getenv('RAKUTEN_HTTP_TIMEOUT', '10')),
+            connect=float(os.getenv('RAKUTEN_HTTP_CONNECT_TIMEOUT', '5')),
+        ),
+        'limits': httpx.Limits(
+            max_connections=int(os.getenv('RAKUTEN_HTTP_MAX_CONNECTIONS', '10')),
+            max_keepalive_connections=int(os.getenv('RAKUTEN_HTTP_MAX_KEEPALIVE', '10')),
+            keepalive_expiry=float(os.getenv('RAKUTEN_HTTP_KEEPALIVE_EXPIRY', '30')),
+        ),
+    }
+
+
+def get_client():
+    # 同期処理用の共有クライアント（プロセス内で1つ）
+    import httpx
+
+    global _client
+    with _lock:
+        if _client is None or _client.is_closed:
+            _client = httpx.Client(**client_options())
+        return _client
+
+
+def new_async_client():
+    # AsyncClient はイベントループに紐づくため、asyncio.run() ごとに1つ作る
+    import httpx
+
+    return httpx.AsyncClient(**client_options())
+
+
+def close_client():
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+atexit.register(close_client)
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from rakuten.rate_limiter import new_rate_limiter
+from utils import metrics
+
+# 複数の楽天アプリIDを束ね、アプリIDごとのレート上限の合計まで並列に呼び出す。
+# アプリIDごとにレート制限と状態（流量制限の回数・無効化）を持ち、
+# 次に最も早く払い出せるアプリIDへリクエストを割り当てる。流量制限を受けたアプリIDはしばらく休ませる。
+
+logger = logging.getLogger(__name__)
+
+
+def app_ids_from_env():
+    # RAKUTEN_APP_IDS（カンマ区切り）を優先し、なければ RAKUTEN_APP_ID の1つだけを使う
+    ids = os.getenv('RAKUTEN_APP_IDS') or os.getenv('RAKUTEN_APP_ID') or ''
+    return [app_id.strip() for app_id in ids.split(',') if app_id.strip()]
+
+
+def _cooldown():
+    return float(os.getenv('RAKUTEN_KEY_COOLDOWN', '1'))  # 流量制限を受けたアプリIDを休ませる秒数
+
+
+def _cooldown_max():
+    return float(os.getenv('RAKUTEN_KEY_COOLDOWN_MAX', '60'))
+
+
+class ApiKey:
+    def __init__(self, number, app_id, share=1.0):
+        self.app_id = app_id
+        # ログにアプリIDをそのまま出さない
+        self.label = f"アプリID #{number}" if app_id else '楽天API'
+        self.limiter = new_rate_limiter(share=share, name=self.label)
+        self.requests = 0
+        self.throttled = 0
+        self.consecutive_throttles = 0
+        self.cooling_until = 0.0
+        self.disabled = False
+
+    def apply(self, params):
+        # 呼び出し元が組み立てたパラメータの applicationId を、このアプリIDに差し替える
+        if self.app_id is None:
+            return params
+        return {**params, 'applicationId': self.app_id}
+
+
+class KeyPool:
+    def __init__(self, app_ids, share=1.0):
+        ids = list(dict.fromkeys(app_ids)) or [None]
+        self.keys = [ApiKey(number, app_id, share) for number, app_id in enumerate(ids, 1)]
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        # 無効化されていないアプリIDのうち、最も早く払い出せるものを予約する
+        with self._lock:
+            candidates = [key for key in self.keys if not key.disabled] or self.keys
+            key = min(candidates, key=lambda k: k.limiter.wait_time())
+            key.requests += 1
+            delay = key.limiter.reserve()
+        metrics.observe('rate_limit_wait', delay)
+        return key, delay
+
+    async def acquire(self):
+        key, delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return key
+
+    def acquire_blocking(self):
+        key, delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return key
+
+    def on_success(self, key):
+        key.consecutive_throttles = 0
+        key.limiter.on_success()
+
+    def on_throttle(self, key, retry_after=None):
+        key.throttled += 1
+        metrics.count('api_throttled')
+        key.limiter.on_throttle(retry_after)
+        now = time.monotonic()
+        if len(self.keys) < 2 or now < key.cooling_until:
+            # 休ませている間に届いた 429 は、休ませる前に送ったリクエストの分なので延長しない
+            return
+        # 他のアプリIDがあるうちは、流量制限を受けたアプリIDをローテーションから外す。
+        # 復帰後、成功する前にまた制限されたら倍の時間休ませる
+        key.consecutive_throttles += 1
+        cooldown = min(_cooldown_max(), _cooldown() * 2 ** (key.consecutive_throttles - 1))
+        cooldown = max(cooldown, retry_after or 0)
+        key.cooling_until = now + cooldown
+        key.limiter.pause(cooldown)
+        logger.info(f"{key.label} を {cooldown:.0f} 秒間ローテーションから外します")
+
+    def disable(self, key):
+        # 無効なアプリIDは今回の実行では使わない。他に使えるアプリIDがなければ無効化しない
+        with self._lock:
+            if key.disabled or not any(not k.disabled for k in self.keys if k is not key):
+                return False
+            key.disabled = True
+        logger.error(f"{key.label} が拒否されたため、今回の実行では使用しません")
+        return True
+
+    def log_stats(self):
+        if len(self.keys) < 2:
+            return
+        for key in self.keys:
+            state = '無効' if key.disabled else f"{key.limiter.rate:.2f} 件/秒"
+            logger.info(f"{key.label}: リクエスト {key.requests} 回 / 流量制限 {key.throttled} 回（{state}）")
+
+
+# シャード実行時は、アプリIDごとのレート上限をワーカー数で分け合う
+_rate_share = 1.0
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def set_rate_share(share):
+    global _rate_share, _pool
+    with _pool_lock:
+        _rate_share = share
+        _pool = None
+
+
+def get_key_pool():
+    # 楽天APIへの呼び出しはすべてこの1つのプールを通す
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = KeyPool(app_ids_from_env(), share=_rate_share)
+            if len(_pool.keys) > 1:
+                logger.info(f"楽天アプリID {len(_pool.keys)} 件を使って取得します")
+        return _pool
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    # rate: 1秒あたりに補充するトークン数（= 許容リクエスト数/秒）
+    # capacity: 瞬間的に許容するバースト数
+    # トークンは先に予約し（残量がマイナスになり得る）、不足分だけ待つ。予約順に払い出されるため
+    # 待機中のリクエストは到着順に進み、同期・非同期の呼び出しが混在しても1つの上限を共有できる
+    def __init__(self, rate: float, capacity: float = 1.0):
+        if rate <= 0:
+            raise ValueError("rate には正の値を指定してください")
+        self.rate = rate
+        self.capacity = max(float(capacity), 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, tokens: float = 1.0):
+        # 今予約した場合に待つ秒数（予約はしない）
+        with self._lock:
+            self._refill()
+            return max(0.0, (tokens - self._tokens) / self.rate)
+
+    def reserve(self, tokens: float = 1.0):
+        # 予約したうえで、払い出しまでに待つ秒数を返す
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            return max(0.0, -self._tokens / self.rate)
+
+    async def acquire(self, tokens: float = 1.0):
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def acquire_blocking(self, tokens: float = 1.0):
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill()
+            self.rate = rate
+
+    def pause(self, seconds):
+        # 以降の払い出しを seconds 秒後以降にずらす（Retry-After への対応）
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class AdaptiveRateLimiter(TokenBucket):
+    # AIMD でレートを調整するトークンバケット。
+    # 正常な応答が続けば max_rate までレートを少しずつ上げ、429 / 503 を受けたら decrease 倍に下げる。
+    # 制限を受けたレートを覚えておき、その近くでは上げ幅を小さくして、上限付近に長くとどまるようにする。
+    # 減速は cooldown 秒に1回までとし、同時に飛んでいたリクエストの 429 でまとめて下げすぎないようにする
+    def __init__(self, rate, capacity=1.0, max_rate=None, min_rate=None,
+                 increase=None, decrease=None, cooldown=None, name='楽天API'):
+        super().__init__(rate, capacity)
+        self.name = name
+        self.max_rate = max(max_rate or rate, rate)
+        self.min_rate = min(min_rate or rate / 20, rate)
+        self.increase = increase if increase is not None else self.max_rate / 20
+        self.decrease = decrease if decrease is not None else 0.7
+        self.cooldown = cooldown if cooldown is not None else 1.0
+        self.ceiling = self.max_rate
+        self._last_decrease = 0.0
+        self.throttled = 0
+
+    def on_success(self):
+        if self.rate < self.max_rate:
+            step = self.increase if self.rate < self.ceiling * 0.9 else self.increase / 10
+            self.set_rate(min(self.max_rate, self.rate + step / self.rate))
+
+    def on_throttle(self, retry_after=None):
+        self.throttled += 1
+        now = time.monotonic()
+        if now - self._last_decrease >= self.cooldown:
+            self._last_decrease = now
+            self.ceiling = self.rate
+            rate = max(self.min_rate, self.rate * self.decrease)
+            if rate < self.rate:
+                logger.warning(f"{self.name} の流量制限を検知、リクエストレートを {self.rate:.2f} → {rate:.2f} 件/秒に下げます")
+            self.set_rate(rate)
+        if retry_after:
+            self.pause(retry_after)
+
+
+# --- アプリIDごとのレート制限（環境変数で上書き可能、.env 読み込み後に評価する） ---
+def _rate_limit():
+    return float(os.getenv('RAKUTEN_RATE_LIMIT', '1'))  # 1秒あたりのリクエスト数（アプリID 1つあたり）
+
+
+def _rate_limit_max():
+    return float(os.getenv('RAKUTEN_RATE_LIMIT_MAX', '0')) or None  # 正常時に上げてよい上限（既定は RAKUTEN_RATE_LIMIT）
+
+
+def _rate_burst():
+    return float(os.getenv('RAKUTEN_RATE_BURST', '1'))
+
+
+def new_rate_limiter(rate=None, burst=None, share=1.0, name='楽天API'):
+    # share: シャード実行時に、このワーカーが使ってよい割合
+    max_rate = _rate_limit_max()
+    return AdaptiveRateLimiter(
+        (rate or _rate_limit()) * share, burst or _rate_burst(), max_rate=max_rate and max_rate * share, name=name,
+    )
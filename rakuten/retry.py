@@ -0,0 +1,133 @@
+import logging
+import os
+import random
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from utils import metrics
+
+# 楽天APIの一時的なエラー（429 / 5xx / 通信エラー）の再試行方針。
+# 待ち時間はジッター付きの指数バックオフで、実行全体の再試行回数には上限（リトライ予算）を設ける。
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+THROTTLE_STATUS = frozenset({429, 503})
+
+
+def max_retries():
+    return int(os.getenv('RAKUTEN_MAX_RETRIES', '5'))  # 1リクエストあたりの再試行回数
+
+
+def backoff_delay(attempt):
+    # full jitter: 0〜min(上限, 基準 × 2^attempt) の一様乱数
+    base = float(os.getenv('RAKUTEN_BACKOFF_BASE', '1'))
+    cap = float(os.getenv('RAKUTEN_BACKOFF_MAX', '60'))
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def retry_after(response):
+    # Retry-After は秒数か HTTP 日付のどちらか
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable_error(error):
+    import httpx  # 起動時には読み込まない（rakuten/http_client.py と同じ）
+
+    return isinstance(error, httpx.TransportError)
+
+
+class RetryBudget:
+    # 実行全体で使える再試行回数。障害が長引いたときに再試行だけで実行時間を使い切らないようにする
+    def __init__(self, total=None):
+        self.total = int(os.getenv('RAKUTEN_RETRY_BUDGET', '500')) if total is None else total
+        self.used = 0
+        self.exhausted = 0
+        self._lock = threading.Lock()
+
+    def try_spend(self):
+        with self._lock:
+            if self.used >= self.total:
+                if self.exhausted == 0:
+                    logger.error(f"楽天APIのリトライ予算（{self.total} 回）を使い切りました。以降は再試行しません")
+                self.exhausted += 1
+                return False
+            self.used += 1
+            return True
+
+    def log_stats(self):
+        if self.used or self.exhausted:
+            logger.info(f"楽天APIの再試行: {self.used}/{self.total} 回（予算切れで諦めた呼び出し {self.exhausted} 件）")
+
+
+_budget = None
+_budget_lock = threading.Lock()
+
+
+def get_retry_budget():
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            _budget = RetryBudget()
+        return _budget
+
+
+def is_key_rejected(response):
+    # アプリIDが無効・停止されている場合の応答
+    if response.status_code in (401, 403):
+        return True
+    return response.status_code == 400 and 'applicationId' in response.text
+
+
+class RetryPolicy:
+    # 1リクエスト分の再試行の判断。使ったアプリIDと応答（または例外）を受け取り、再試行するなら待つ秒数を返す。
+    # 流量制限の応答はキープールにも伝え、そのアプリIDの以降のペースを落とす
+    def __init__(self, pool, label):
+        self.pool = pool
+        self.label = label
+        self.attempt = 0
+
+    def on_response(self, key, response):
+        if response.status_code in RETRYABLE_STATUS:
+            if response.status_code in THROTTLE_STATUS:
+                self.pool.on_throttle(key, retry_after(response))
+            return self._next_delay(f"HTTP {response.status_code}")
+        if is_key_rejected(response):
+            if self.pool.disable(key) or key.disabled:
+                # 別のアプリIDですぐに再試行する（他のリクエストで無効化済みの場合も同じ）
+                return self._next_delay(f"HTTP {response.status_code}", backoff=False)
+            # 残り1つのアプリIDも拒否された。レート制限の成功としては数えず、エラーのまま返す
+            logger.error(f"{self.label} の取得で HTTP {response.status_code}: 使えるアプリIDがありません")
+            metrics.count('api_gave_up', reason=f"HTTP {response.status_code}")
+            return None
+        # 400 / 404 等はそのまま返す。レート制限の増速は 2xx の応答だけで行う
+        if 200 <= response.status_code < 300:
+            self.pool.on_success(key)
+        return None
+
+    def on_error(self, key, error):
+        if not is_retryable_error(error):
+            return None
+        return self._next_delay(type(error).__name__)
+
+    def _next_delay(self, reason, backoff=True):
+        if self.attempt >= max_retries() or not get_retry_budget().try_spend():
+            logger.warning(f"{self.label} の取得を諦めます（{reason}, {self.attempt + 1} 回目）")
+            metrics.count('api_gave_up', reason=reason)
+            return None
+        delay = backoff_delay(self.attempt) if backoff else 0.0
+        self.attempt += 1
+        metrics.count('api_retries', reason=reason)
+        logger.warning(f"{self.label} の取得で {reason}、{delay:.1f} 秒後に再試行（{self.attempt}/{max_retries()}）")
+        return delay
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+
+from utils.state import state_path
+
+# 前回登録した内容から変化のない行をスキップするための仕組み。
+# 価格・在庫・ポイント・レビューに関わる項目だけをハッシュ化し、item_code ごとに最後の値と比較する。
+
+logger = logging.getLogger(__name__)
+
+CHANGE_FIELDS = (
+    'item_price',
+    'item_price_base_field',
+    'item_price_min1',
+    'item_price_min2',
+    'item_price_min3',
+    'item_price_max1',
+    'item_price_max2',
+    'item_price_max3',
+    'availability',
+    'point_rate',
+    'postage_flag',
+    'review_average',
+    'review_count',
+)
+
+
+def fingerprint(row, fields=CHANGE_FIELDS):
+    payload = json.dumps([row.get(field) for field in fields], ensure_ascii=False, default=str)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class FingerprintStore:
+    # scope（登録先テーブル名）ごとに item_code -> 最後に登録したフィンガープリント を保持する
+    def __init__(self, path=None):
+        self.path = path or state_path('fingerprints.sqlite')
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("""
+                create table if not exists last_fingerprint (
+                    scope text not null,
+                    item_code text not null,
+                    fingerprint text not null,
+                    updated_at text not null,
+                    primary key (scope, item_code)
+                )
+            """)
+
+    def get_many(self, scope, item_codes):
+        found = {}
+        codes = list(item_codes)
+        with self._lock:
+            for start in range(0, len(codes), 500):
+                part = codes[start:start + 500]
+                placeholders = ','.join('?' * len(part))
+                cursor = self._conn.execute(
+                    f"select item_code, fingerprint from last_fingerprint where scope = ? and item_code in ({placeholders})",
+                    [scope, *part],
+                )
+                found.update(cursor.fetchall())
+        return found
+
+    def put_many(self, scope, fingerprints):
+        now = datetime.now().isoformat()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "insert or replace into last_fingerprint (scope, item_code, fingerprint, updated_at) values (?, ?, ?, ?)",
+                [(scope, code, value, now) for code, value in fingerprints.items()],
+            )
+
+    def close(self):
+        self._conn.close()
+
+
+class ChangeDetector:
+    # select_changed() で変化のあった行だけを選び、登録に成功した行を commit() で記録する。
+    # 登録に失敗した行は記録しないため、次回の実行で再び登録対象になる。
+    def __init__(self, store, scope, full_snapshot=False):
+        self.store = store
+        self.scope = scope
+        self.full_snapshot = full_snapshot
+        self.changed = 0
+        self.unchanged = 0
+
+    def select_changed(self, rows):
+        if self.full_snapshot:
+            self.changed += len(rows)
+            return list(rows)
+        previous = self.store.get_many(self.scope, {row['item_code'] for row in rows})
+        changed = [row for row in rows if previous.get(row['item_code']) != fingerprint(row)]
+        self.changed += len(changed)
+        self.unchanged += len(rows) - len(changed)
+        return changed
+
+    def commit(self, rows):
+        self.store.put_many(self.scope, {row['item_code']: fingerprint(row) for row in rows})
@@ -0,0 +1,131 @@
+import argparse
+import logging
+import os
+import sys
+
+# python -m rakuten_sync <job> [<job>...] の本体。指定したジョブを1つのプロセスで順に実行し、
+# Supabase クライアント・楽天APIの接続プール・キャッシュを共有する。
+# 起動を速くするため、ジョブの処理と supabase / httpx はジョブを実行するときに初めて読み込む。
+
+logger = logging.getLogger(__name__)
+
+# ジョブ名 -> (価格履歴の取得元テーブル, 登録先テーブル)
+REFRESH_JOBS = {
+    'tracked-refresh': ('mst_products', 'trn_rakuten_price_history'),
+    'post-ranking-refresh': ('mst_rakuten_items', 'trn_rakuten_price_history_after_ranking'),
+}
+# all は3つのジョブの商品をまとめ、各商品を1回だけ取得する（rakuten_sync/orchestrator.py）
+JOBS = ('ranking', *REFRESH_JOBS, 'all')
+
+
+def load_env():
+    # .env の読み込み（ローカル実行時のみ）
+    if os.getenv('ENV') != 'production' and os.path.exists('.env'):
+        from dotenv import load_dotenv
+
+        load_dotenv()
+
+
+def setup_logger():
+    is_github_actions = os.getenv('GITHUB_ACTIONS') == 'true'
+
+    log_format = '%(asctime)s [%(levelname)s] %(message)s'
+    handlers = [logging.StreamHandler()]  # 常に標準出力に出す
+
+    if not is_github_actions:
+        # ローカル環境ならログファイルにも出力
+        log_dir = './logs'
+        os.makedirs(log_dir, exist_ok=True)
+        log_file = os.path.join(log_dir, 'rakuten_products.log')
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+
+    logging.basicConfig(level=logging.INFO, format=log_format, handlers=handlers)
+
+
+def _ranking_parser():
+    from rakuten_sync.ranking import add_ranking_arguments
+
+    return add_ranking_arguments(argparse.ArgumentParser(add_help=False))
+
+
+def _refresh_parser():
+    from rakuten_sync.price_history import add_refresh_arguments
+
+    return add_refresh_arguments(argparse.ArgumentParser(add_help=False))
+
+
+def _options(parser, args):
+    # parser が定義する引数だけを args から取り出す（各ジョブの関数にそのまま渡す）
+    return {name: getattr(args, name) for name in vars(parser.parse_args([]))}
+
+
+def build_parser():
+    # --writer / --history-mode はランキングと価格履歴の両方が定義するため、後の定義で置き換える
+    parser = argparse.ArgumentParser(
+        prog='python -m rakuten_sync',
+        description='楽天ランキング・価格履歴の同期ジョブを1プロセスでまとめて実行する',
+        parents=[_ranking_parser(), _refresh_parser()],
+        conflict_handler='resolve',
+    )
+    parser.add_argument(
+        'jobs',
+        nargs='+',
+        choices=JOBS,
+        metavar='job',
+        help=f"実行するジョブ（指定順に実行）: {', '.join(JOBS)}",
+    )
+    return parser
+
+
+def run_job(job, args, supabase, app_id):
+    if job == 'ranking':
+        from rakuten_sync.ranking import run_ranking, run_ranking_ingestion
+
+        if args.genres:
+            # ジャンル別・期間別に全ページを並列取得する
+            return run_ranking_ingestion(supabase, app_id, **_options(_ranking_parser(), args))
+        return run_ranking(supabase, app_id, writer=args.writer)
+    if job == 'all':
+        from rakuten_sync.orchestrator import run_all
+
+        return run_all(supabase, app_id, **_options(_refresh_parser(), args))
+
+    from rakuten_sync.price_history import run_price_history
+
+    source_table, target_table = REFRESH_JOBS[job]
+    return run_price_history(supabase, app_id, source_table, target_table, **_options(_refresh_parser(), args))
+
+
+def main(argv=None):
+    load_env()
+    args = build_parser().parse_args(argv)
+    setup_logger()
+
+    # RAKUTEN_APP_IDS（カンマ区切り）で複数のアプリIDを指定すると、キープールで分散して呼び出す
+    from rakuten.key_pool import app_ids_from_env
+    from supabase_client.client import get_supabase
+
+    app_id = next(iter(app_ids_from_env()), None)
+    if not all([app_id, os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY')]):
+        logger.error("必要な環境変数（RAKUTEN_APP_ID または RAKUTEN_APP_IDS, SUPABASE_URL, SUPABASE_KEY）が不足しています")
+        return 1
+    supabase = get_supabase()
+
+    # ジョブが失敗しても後続のジョブは実行し、終了コードで失敗を知らせる
+    failed = []
+    for job in args.jobs:
+        logger.info(f"=== {job} 開始 ===")
+        try:
+            run_job(job, args, supabase, app_id)
+            logger.info(f"=== {job} 終了 ===")
+        except Exception:
+            failed.append(job)
+            logger.exception(f"{job} で予期せぬエラーが発生しました")
+    if failed:
+        logger.error(f"失敗したジョブ: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+import logging
+from datetime import datetime
+
+from rakuten_sync.intervals import IN_CHUNK_SIZE, interval_key, interval_values, to_interval
+from rakuten_sync.price_history import chunked, insert_chunk
+from supabase_client.pagination import iter_column_values, iter_rows
+from utils import metrics
+
+# 既存のスナップショット行（trn_rakuten_price_history* / trn_rakuten_ranking）を期間形式の *_interval テーブルへ
+# 詰め直す（compact_history.py）。商品コードの範囲ごとに全スナップショットを読み、キーごとに timestamp 順に並べて、
+# 変動する項目の値が変わった時点で期間を区切る。スナップショットテーブルは serial の id 列を持つ前提で、id 順に読む。
+
+logger = logging.getLogger(__name__)
+
+
+def _parse(timestamp):
+    return datetime.fromisoformat(timestamp)
+
+
+def compact_rows(rows, spec, max_gap=None, now=None):
+    # 1つのキーのスナップショット行（timestamp の昇順）を期間にまとめる。
+    # max_gap（timedelta）を指定すると、次の観測まで max_gap より空いた期間は最後の観測の max_gap 後で閉じる
+    # （ランキングから外れていた間を期間に含めない）
+    intervals = []
+    current = None
+    last_seen = None
+    for row in rows:
+        seen_at = _parse(row['timestamp'])
+        if current is not None and max_gap is not None and seen_at - last_seen > max_gap:
+            current['valid_to'] = (last_seen + max_gap).isoformat()
+            current = None
+        if current is None or interval_values(current, spec) != interval_values(row, spec):
+            if current is not None:
+                current['valid_to'] = row['timestamp']
+            current = to_interval(row, spec)
+            intervals.append(current)
+        last_seen = seen_at
+    if current is not None and max_gap is not None and (now or datetime.now(last_seen.tzinfo)) - last_seen > max_gap:
+        current['valid_to'] = (last_seen + max_gap).isoformat()
+    return intervals
+
+
+def iter_snapshot_groups(supabase, spec, item_codes, page_size=None):
+    # item_codes のスナップショット行を読み、(キー, timestamp 昇順の行) を返す
+    columns = ','.join(('id', *spec.keys, *spec.fields, 'timestamp'))
+    rows = list(iter_rows(
+        supabase, spec.source, columns, 'id', page_size, lambda query: query.in_('item_code', item_codes),
+    ))
+    groups = {}
+    for row in rows:
+        if row.get('timestamp') is not None:
+            groups.setdefault(interval_key(row, spec), []).append(row)
+    for key, group in groups.items():
+        group.sort(key=lambda row: _parse(row['timestamp']))
+        yield key, group
+
+
+def _existing_codes(supabase, spec, item_codes):
+    rows = iter_rows(
+        supabase, spec.table, 'id,item_code', 'id', None, lambda query: query.in_('item_code', item_codes),
+    )
+    return {row['item_code'] for row in rows}
+
+
+def compact_history(supabase, db, spec, batch_codes=20, max_gap=None, replace=False, delete_snapshots=False,
+                    chunk_size=500, max_retries=3):
+    # 商品コード batch_codes 件ずつ詰め直す。失敗した範囲は報告して次へ進む。
+    # 期間テーブルにすでに行のある商品は、replace=True なら作り直し、そうでなければスキップする
+    summary = {'codes': 0, 'skipped': 0, 'snapshots': 0, 'intervals': 0, 'deleted_snapshots': 0, 'failed_batches': 0}
+    for batch in chunked(iter_column_values(supabase, spec.source, 'item_code'), batch_codes):
+        try:
+            existing = _existing_codes(supabase, spec, batch)
+            if existing and replace:
+                for start in range(0, len(batch), IN_CHUNK_SIZE):
+                    part = batch[start:start + IN_CHUNK_SIZE]
+                    db.table(spec.table).delete().in_('item_code', part).execute()
+                existing = set()
+            codes = [code for code in batch if code not in existing]
+            summary['skipped'] += len(batch) - len(codes)
+            if not codes:
+                continue
+
+            intervals = []
+            snapshots = 0
+            latest = None
+            with metrics.timer('compaction', table=spec.table):
+                for _key, rows in iter_snapshot_groups(supabase, spec, codes):
+                    snapshots += len(rows)
+                    latest = max(latest or rows[-1]['timestamp'], rows[-1]['timestamp'], key=_parse)
+                    intervals.extend(compact_rows(rows, spec, max_gap))
+            written = all(
+                insert_chunk(db, spec.table, intervals[start:start + chunk_size], max_retries)
+                for start in range(0, len(intervals), chunk_size)
+            )
+            if not written:
+                summary['failed_batches'] += 1
+                continue
+            summary['codes'] += len(codes)
+            summary['snapshots'] += snapshots
+            summary['intervals'] += len(intervals)
+
+            if delete_snapshots and latest is not None:
+                # 読み込んだ時点までの行だけを消す（実行中に追加された行は次回に回す）
+                supabase.table(spec.source).delete().in_('item_code', codes).lte('timestamp', latest).execute()
+                summary['deleted_snapshots'] += snapshots
+        except Exception:
+            summary['failed_batches'] += 1
+            logger.exception(f"{spec.source} の詰め直し失敗（item_code={batch[0]}〜{batch[-1]}）")
+            continue
+        logger.info(
+            f"{spec.table}: {summary['codes']} 商品 / スナップショット {summary['snapshots']} 行 → "
+            f"期間 {summary['intervals']} 行"
+        )
+
+    ratio = summary['snapshots'] / summary['intervals'] if summary['intervals'] else 0
+    logger.info(
+        f"{spec.source} → {spec.table} 詰め直し完了: {summary['codes']} 商品 / スナップショット {summary['snapshots']} 行 → "
+        f"期間 {summary['intervals']} 行（{ratio:.1f} 分の1）/ スキップ {summary['skipped']} 商品 / "
+        f"削除したスナップショット {summary['deleted_snapshots']} 行 / 失敗 {summary['failed_batches']} 回"
+    )
+    return summary
@@ -0,0 +1,130 @@
+import os
+from datetime import datetime
+from itertools import islice
+from typing import NamedTuple
+
+from rakuten_sync.change_detection import CHANGE_FIELDS
+from supabase_client.pagination import iter_rows
+
+# 価格履歴・ランキング履歴を、実行ごとの全項目のスナップショットではなく、変動する項目だけの
+# 有効期間（valid_from 〜 valid_to）として持つ保存形式（--history-mode intervals）。
+# 値が変わったときだけ開いている期間を閉じ（valid_to を設定し）、新しい期間を追加する。valid_to が null の行が現在の値。
+# 商品名・説明・URL・画像などの変わりにくい項目は、商品マスタ（mst_rakuten_items）にだけ置く。
+
+HISTORY_MODES = ('snapshot', 'intervals')
+
+# in フィルタで一度に指定する商品コードの数（URL の長さを抑える）
+IN_CHUNK_SIZE = 200
+
+
+class IntervalSpec(NamedTuple):
+    table: str     # 期間テーブル
+    source: str    # 同じ内容をスナップショット形式で持つテーブル
+    keys: tuple    # 期間を区別する列
+    fields: tuple  # 期間ごとに持つ値（変動する項目）
+
+
+RANKING_FIELDS = ('rank', 'item_price', 'availability', 'point_rate')
+
+SPECS = {spec.source: spec for spec in (
+    IntervalSpec(
+        'trn_rakuten_price_history_interval', 'trn_rakuten_price_history', ('item_code',), CHANGE_FIELDS,
+    ),
+    IntervalSpec(
+        'trn_rakuten_price_history_after_ranking_interval', 'trn_rakuten_price_history_after_ranking',
+        ('item_code',), CHANGE_FIELDS,
+    ),
+    IntervalSpec(
+        'trn_rakuten_ranking_interval', 'trn_rakuten_ranking', ('item_code', 'ranking_genre_id', 'period'),
+        RANKING_FIELDS,
+    ),
+)}
+
+
+def add_history_mode_argument(parser):
+    parser.add_argument(
+        '--history-mode',
+        choices=HISTORY_MODES,
+        default=os.getenv('RAKUTEN_HISTORY_MODE', 'snapshot'),
+        help='履歴の保存形式。intervals は変動する項目だけを有効期間（valid_from / valid_to）で *_interval テーブルに持つ',
+    )
+    return parser
+
+
+def interval_spec(table):
+    # スナップショットテーブル名・期間テーブル名のどちらからでも引ける
+    for spec in SPECS.values():
+        if table in (spec.source, spec.table):
+            return spec
+    raise ValueError(f"{table} は期間形式の履歴に対応していません")
+
+
+def interval_key(row, spec):
+    if len(spec.keys) == 1:
+        return row.get(spec.keys[0])
+    return tuple(row.get(key) for key in spec.keys)
+
+
+def interval_values(row, spec):
+    return tuple(row.get(field) for field in spec.fields)
+
+
+def to_interval(row, spec, valid_from=None):
+    # スナップショット形式の行（timestamp 列を持つ）から、開いた期間の行を作る
+    interval = {key: row.get(key) for key in spec.keys}
+    interval.update((field, row.get(field)) for field in spec.fields)
+    interval['valid_from'] = valid_from or row['timestamp']
+    interval['valid_to'] = None
+    return interval
+
+
+def _chunks(values, size=IN_CHUNK_SIZE):
+    iterator = iter(values)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _columns(spec, extra=()):
+    return ','.join(('id', *spec.keys, *spec.fields, *extra))
+
+
+def iter_open_intervals(client, spec, item_codes=None, filters=None, page_size=None):
+    # 開いている（valid_to が null の）期間を返す。item_codes / filters（列 -> 値 の一致条件）で絞り込める
+    def where(query, codes=None):
+        query = query.is_('valid_to', 'null')
+        for column, value in (filters or {}).items():
+            query = query.eq(column, value)
+        return query.in_('item_code', codes) if codes is not None else query
+
+    if item_codes is None:
+        yield from iter_rows(client, spec.table, _columns(spec, ('valid_from',)), 'id', page_size, where)
+        return
+    for codes in _chunks(item_codes):
+        yield from iter_rows(
+            client, spec.table, _columns(spec, ('valid_from',)), 'id', page_size, lambda query: where(query, codes),
+        )
+
+
+def iter_state_as_of(client, table, at, item_codes=None, page_size=None):
+    # at（datetime または ISO 8601 の文字列）の時点で有効だった期間の行を返す。
+    # table はスナップショットテーブル名・期間テーブル名のどちらでもよい
+    spec = interval_spec(table)
+    at = at.isoformat() if isinstance(at, datetime) else at
+    columns = _columns(spec, ('valid_from', 'valid_to'))
+
+    def where(query, codes=None):
+        # or の中の値は、: や . を含むため二重引用符で囲む
+        query = query.lte('valid_from', at).or_(f'valid_to.is.null,valid_to.gt."{at}"')
+        return query.in_('item_code', codes) if codes is not None else query
+
+    if item_codes is None:
+        yield from iter_rows(client, spec.table, columns, 'id', page_size, where)
+        return
+    for codes in _chunks(item_codes):
+        yield from iter_rows(client, spec.table, columns, 'id', page_size, lambda query: where(query, codes))
+
+
+def state_as_of(client, table, at, item_codes=None):
+    # at の時点の値を、キー（価格履歴は item_code、ランキングは (item_code, ranking_genre_id, period)）-> 行 で返す
+    spec = interval_spec(table)
+    return {interval_key(row, spec): row for row in iter_state_as_of(client, table, at, item_codes)}
@@ -0,0 +1,110 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from utils.fastjson import dumps, loads
+from utils.state import state_path
+
+# 長時間の価格履歴更新を途中から再開するための実行ジャーナル。
+# 取得した商品コードと変換後の行を登録先（scope）ごとに記録し、Supabase への登録が済んだら committed にする。
+# --resume で再実行すると、記録済みの商品は取得をスキップし、未登録の行だけを登録し直す。
+
+logger = logging.getLogger(__name__)
+
+
+class RunJournal:
+    def __init__(self, name, resume=False):
+        self.path = state_path(f'journal_{name}.sqlite')
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("pragma journal_mode=wal")
+        self._conn.execute("pragma synchronous=normal")
+        with self._conn:
+            self._conn.execute("""
+                create table if not exists entry (
+                    item_code text not null,
+                    scope text not null,
+                    rows text not null,
+                    committed integer not null default 0,
+                    primary key (item_code, scope)
+                )
+            """)
+            self._conn.execute("create table if not exists meta (key text primary key, value text)")
+            # 古いジャーナル（前回の定期実行が失敗したまま等）は使わない。取得済みの商品・未登録の行・
+            # フラグ（ランキング登録済み等）をすべて捨て、新しい実行として始める（全件を取得し直す）
+            started_at = self._conn.execute("select value from meta where key = 'started_at'").fetchone()
+            max_age = float(os.getenv('RAKUTEN_RESUME_MAX_AGE_HOURS', '24')) * 3600
+            stale = started_at is not None and time.time() - float(started_at[0]) > max_age
+            if resume and stale:
+                done, pending = self._conn.execute(
+                    "select count(distinct item_code), coalesce(sum(1 - committed), 0) from entry"
+                ).fetchone()
+                logger.info(f"ジャーナルが古いため破棄し、全件を取得し直します（取得済み {done} 件 / 未登録 {pending} 件）")
+            if not resume or stale:
+                self._conn.execute("delete from entry")
+                self._conn.execute("delete from meta")
+            self._conn.execute(
+                "insert or ignore into meta (key, value) values ('started_at', ?)", (str(time.time()),)
+            )
+        self.resumable = resume and not stale
+        if self.resumable:
+            done, pending = self._conn.execute(
+                "select count(distinct item_code), coalesce(sum(1 - committed), 0) from entry"
+            ).fetchone()
+            logger.info(f"ジャーナルから再開: 取得済み {done} 件 / 未登録 {pending} 件（{self.path}）")
+
+    def seen(self):
+        # 前回までに取得済みの商品コード（再開時は取得をスキップする）
+        if not self.resumable:
+            return set()
+        with self._lock:
+            return {row[0] for row in self._conn.execute("select distinct item_code from entry")}
+
+    def pending(self, scope):
+        # 取得済みだが登録が済んでいない行
+        with self._lock:
+            cursor = self._conn.execute("select rows from entry where scope = ? and committed = 0", (scope,))
+            return [row for (rows,) in cursor for row in loads(rows)]
+
+    def record(self, item_code, rows_by_scope):
+        # 取得結果を登録前に記録する。登録先のない商品（取得できなかった等）は取得済みとしてだけ残す
+        entries = [(item_code, scope, dumps(rows), 0) for scope, rows in rows_by_scope.items()]
+        if not entries:
+            entries = [(item_code, '', '[]', 1)]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "insert or replace into entry (item_code, scope, rows, committed) values (?, ?, ?, ?)", entries
+            )
+
+    def get_flag(self, key):
+        with self._lock:
+            return self._conn.execute("select value from meta where key = ?", (key,)).fetchone() is not None
+
+    def set_flag(self, key):
+        with self._lock, self._conn:
+            self._conn.execute("insert or replace into meta (key, value) values (?, '1')", (key,))
+
+    def mark_committed(self, scope, item_codes):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "update entry set committed = 1 where scope = ? and item_code = ?",
+                [(scope, code) for code in set(item_codes)],
+            )
+
+    def commit_scope(self, scope):
+        # scope の未登録の行をすべて登録済みにする（まとめて書き込む登録先で、書き込みが全件済んだとき）
+        with self._lock, self._conn:
+            self._conn.execute("update entry set committed = 1 where scope = ?", (scope,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def finish(self):
+        # 全件の登録が済んだらジャーナルを消す（失敗が残った場合は消さず、次回 --resume で再登録する）
+        self.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
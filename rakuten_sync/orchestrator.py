@@ -0,0 +1,180 @@
+import heapq
+import logging
+from datetime import datetime
+from itertools import groupby, repeat
+
+from rakuten.fetcher import log_api_stats
+from rakuten_sync.change_detection import FingerprintStore
+from rakuten_sync.journal import RunJournal
+from rakuten_sync.price_history import (
+    history_writer, iter_fetched, iter_tracked_item_codes, iter_transformed_blocks, start_shard,
+)
+from rakuten_sync.ranking import fetch_ranking_items, store_ranking, to_master_rows
+from rakuten_sync.scheduler import new_scheduler
+from rakuten_sync.sharding import filter_shard, shard_suffix, write_shard_report
+from supabase_client.batch_writer import BatchWriter
+from supabase_client.copy_writer import writer_client
+from utils import metrics
+
+# main2.py / main3.py / main4.py の処理を1回の実行にまとめる。
+# ランキング・mst_products・mst_rakuten_items の商品コードの和集合について各商品を1回だけ取得し、
+# 取得結果を必要なテーブルへ振り分ける。
+
+logger = logging.getLogger(__name__)
+
+# 価格履歴の登録先テーブル -> 対象商品コードの取得元テーブル
+PRICE_HISTORY_ROUTES = {
+    'trn_rakuten_price_history': 'mst_products',
+    'trn_rakuten_price_history_after_ranking': 'mst_rakuten_items',
+}
+# mst_rakuten_items 由来の商品は、取得結果で商品マスタも更新する
+MASTER_TARGET = 'trn_rakuten_price_history_after_ranking'
+# 商品マスタの行もジャーナルに記録し、登録が済む前に失敗した場合は --resume で登録し直す
+MASTER_TABLE = 'mst_rakuten_items'
+
+
+def _ascending(codes, target):
+    # 突き合わせは Python の文字列の順序（コードポイント順）を前提にするため、DB の照合順序が異なり
+    # 順序が食い違った場合は、商品を取りこぼしたり二重に取得したりする前に例外で止める
+    previous = None
+    for code in codes:
+        if previous is not None and code < previous:
+            raise ValueError(
+                f"{target} の対象商品コードが昇順ではありません（{previous!r} の後に {code!r}）。"
+                f"item_code の照合順序を \"C\" にしてください（DDL.sql）"
+            )
+        previous = code
+        yield code
+
+
+def iter_routed_codes(streams):
+    # item_code 昇順の複数ストリームを突き合わせ、(item_code, その商品を必要とする登録先の集合) を返す
+    merged = heapq.merge(*[zip(_ascending(codes, target), repeat(target)) for target, codes in streams.items()])
+    for code, group in groupby(merged, key=lambda pair: pair[0]):
+        yield code, {target for _code, target in group}
+
+
+def run_all(supabase, app_id, full_snapshot=False, plan_by_shop=False, resume=False, shard_index=0, shard_count=1,
+            writer=None, history_mode='snapshot', api_budget=None, max_staleness_hours=24.0, ranking_boost=4.0,
+            ranking_window_hours=24.0):
+    start_shard(shard_index, shard_count)
+    metrics.start_run('all' + shard_suffix(shard_index, shard_count))
+    started_at = datetime.now()
+    journal = RunJournal('orchestrator' + shard_suffix(shard_index, shard_count), resume=resume)
+    # 書き込みだけを --writer の方法で行い、読み込みは supabase のまま
+    db = writer_client(supabase, writer)
+
+    summary = {}
+
+    # 1. ランキング → mst_rakuten_items / trn_rakuten_ranking（再開時、登録済みなら登録し直さない）
+    #    シャード実行時、ランキングの登録は 0 番のワーカーだけが行う。
+    #    登録に失敗した場合はフラグを立てず、ジャーナルも残して --resume で登録し直す
+    ranking_items = fetch_ranking_items(app_id)
+    if not ranking_items:
+        logger.warning("ランキングデータが取得できませんでした")
+    elif shard_index == 0 and not (journal.resumable and journal.get_flag('ranking_stored')):
+        stored = store_ranking(db, ranking_items)
+        if stored:
+            journal.set_flag('ranking_stored')
+        summary['trn_rakuten_ranking'] = {'failed': 0 if stored else len(ranking_items)}
+
+    # 2. 価格履歴の対象商品コード（ランキング登録後の mst_rakuten_items を含む）を
+    #    ページ単位で読みながら突き合わせ、取得処理へそのまま流す。
+    #    ランキングのレスポンスには商品検索にしかない項目（itemPriceMin1 や tagIds 等）がないため、
+    #    ランキング経由の商品も商品検索で取得し直す
+    streams = {
+        target: filter_shard(iter_tracked_item_codes(supabase, source), shard_index, shard_count)
+        for target, source in PRICE_HISTORY_ROUTES.items()
+    }
+    routes = {}  # 取得中・取得待ちの item_code -> 登録先
+    counts = {'codes': 0, 'separate_calls': 0}
+    seen = journal.seen()
+    # --api-budget 指定時は、価格の変わりやすい商品を優先して取得する商品を選ぶ
+    scheduler = new_scheduler(
+        supabase, 'orchestrator' + shard_suffix(shard_index, shard_count), api_budget and api_budget // shard_count,
+        max_staleness_hours, ranking_boost, ranking_window_hours, history_mode,
+    )
+    routed = iter_routed_codes(streams)
+    if scheduler:
+        routed = scheduler.select(routed, key=lambda pair: pair[0])
+
+    def codes_to_fetch():
+        for code, targets in routed:
+            if code in seen:
+                continue
+            counts['codes'] += 1
+            counts['separate_calls'] += len(targets)
+            routes[code] = targets
+            yield code
+
+    # 3. 1商品につき1回だけ取得し、各テーブルへ振り分ける
+    store = FingerprintStore()
+    writers = {
+        target: history_writer(supabase, db, target, history_mode, store, full_snapshot, journal)
+        for target in PRICE_HISTORY_ROUTES
+    }
+    succeeded = False
+    try:
+        if resume:
+            # 前回取得済みで未登録の行を先に登録する
+            for target, writer in writers.items():
+                for row in journal.pending(target):
+                    writer.add(row)
+        try:
+            with BatchWriter(db) as master:
+                if resume:
+                    for row in journal.pending(MASTER_TABLE):
+                        master.upsert(MASTER_TABLE, row, on_conflict='item_code')
+                fetched = iter_fetched(supabase, codes_to_fetch(), app_id, plan_by_shop)
+                for code, items, rows in iter_transformed_blocks(fetched):
+                    targets = routes.pop(code, set())
+                    master_rows = []
+                    if MASTER_TARGET in targets:
+                        master_rows = to_master_rows([wrapper['Item'] for wrapper in items])
+                    scopes = {target: rows for target in targets} if rows else {}
+                    if master_rows:
+                        scopes[MASTER_TABLE] = master_rows
+                    journal.record(code, scopes)
+                    if scheduler:
+                        scheduler.observe(code, rows)
+                    if not items:
+                        continue
+                    for target in targets:
+                        for row in rows:
+                            writers[target].add(row)
+                    for row in master_rows:
+                        master.upsert(MASTER_TABLE, row, on_conflict='item_code')
+        except Exception:
+            # 商品コードの読み込みや突き合わせが途中で失敗した場合も、取得済みの行は登録してから失敗として終える
+            # （ジャーナルは残すため、--resume で続きから再実行できる）
+            for writer in writers.values():
+                writer.close()
+            journal.close()
+            raise
+        # 商品マスタは BatchWriter の終了時に全件書き込めている（失敗すれば例外で上の except に入る）
+        journal.commit_scope(MASTER_TABLE)
+        for target, writer in writers.items():
+            summary[target] = writer.close()
+        summary[MASTER_TABLE] = master.rows_written.get(MASTER_TABLE, 0)
+        succeeded = True
+    finally:
+        store.close()
+        if scheduler:
+            summary['schedule'] = scheduler.close(succeeded)
+
+    checked = {*writers, 'trn_rakuten_ranking'}
+    if all(result['failed'] == 0 for target, result in summary.items() if target in checked):
+        journal.finish()
+    else:
+        journal.close()
+        logger.warning("未登録の行が残っています。--resume で再実行すると登録し直します")
+    if counts['codes'] == 0 and not resume:
+        logger.warning("追跡対象の商品コードが見つかりません")
+    logger.info(
+        f"対象商品 {counts['codes']} 件（個別実行時の取得件数 {counts['separate_calls']} 件）"
+    )
+    summary['api_calls'] = counts['codes']
+    summary['codes'] = counts['codes']
+    log_api_stats()
+    write_shard_report('orchestrator', shard_index, shard_count, summary, started_at, datetime.now())
+    return summary
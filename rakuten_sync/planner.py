@@ -0,0 +1,131 @@
+import logging
+import os
+from collections import defaultdict
+from contextlib import aclosing
+from itertools import islice
+
+from rakuten.fetcher import ITEM_SEARCH_URL, item_search_jobs, iter_fetch, iter_in_background
+from rakuten.http_client import new_async_client
+from supabase_client.pagination import iter_rows
+
+# 商品コード単位の検索（1商品1リクエスト）の代わりに、追跡商品が多いショップは shopCode 検索で
+# ページをまとめて読み、その中から追跡商品を拾う。ショップごとに安い方の取得方法を選ぶ。
+# 商品コードは一度に全件読まず、RAKUTEN_PLAN_WINDOW 件ずつの範囲でショップにまとめる（メモリはこの件数で頭打ち）。
+# 商品コードは昇順（"ショップコード:商品ID"）で渡されるため、同じショップの商品はほぼ同じ範囲に収まる。
+
+logger = logging.getLogger(__name__)
+
+SEARCH_MAX_HITS = 30    # 商品検索APIの1ページあたり最大件数
+SEARCH_MAX_PAGES = 100  # 商品検索APIで指定できる最大ページ
+
+
+def _plan_window():
+    return int(os.getenv('RAKUTEN_PLAN_WINDOW', '50000'))  # 一度にショップへまとめる商品コードの件数
+
+
+def load_shop_codes(supabase):
+    # mst_rakuten_items に保存済みの item_code -> shop_code
+    return {
+        row['item_code']: row.get('shop_code')
+        for row in iter_rows(supabase, 'mst_rakuten_items', 'item_code,shop_code', 'item_code')
+    }
+
+
+def shop_of(item_code, shop_codes):
+    # 未登録の商品は、商品コード（"ショップコード:商品ID"）の前半をショップコードとみなす
+    return shop_codes.get(item_code) or item_code.split(':', 1)[0]
+
+
+def group_by_shop(item_codes, shop_codes):
+    groups = defaultdict(list)
+    for code in item_codes:
+        groups[shop_of(code, shop_codes)].append(code)
+    return groups
+
+
+def shop_search_params(app_id, shop_code, page):
+    return {
+        'applicationId': app_id,
+        'format': 'json',
+        'shopCode': shop_code,
+        'hits': SEARCH_MAX_HITS,
+        'page': page,
+    }
+
+
+async def _iter_planned(groups, app_id, min_dense, stats):
+    async with new_async_client() as client:
+        dense = {shop: set(codes) for shop, codes in groups.items() if len(codes) >= min_dense}
+        sparse = [code for shop, codes in groups.items() if shop not in dense for code in codes]
+
+        def pick(shop, data):
+            # ショップの検索結果から、まだ取得できていない追跡商品を取り出す
+            found = []
+            for wrapper in (data or {}).get('Items', []):
+                code = wrapper.get('Item', {}).get('itemCode')
+                if code in dense[shop]:
+                    dense[shop].discard(code)
+                    found.append((code, [wrapper]))
+            return found
+
+        # 1. 追跡商品の多いショップは1ページ目を取得し、ショップの総ページ数を調べる
+        scans = {}
+        jobs = ((shop, ITEM_SEARCH_URL, shop_search_params(app_id, shop, 1)) for shop in list(dense))
+        async with aclosing(iter_fetch(jobs, client=client)) as fetched:
+            async for shop, data in fetched:
+                stats['api_calls'] += 1
+                for entry in pick(shop, data):
+                    yield entry
+                if data is None or not dense[shop]:
+                    continue
+                # 残りページを読み切る回数と、見つかっていない商品を個別に取る回数を比べる
+                page_count = min(int(data.get('pageCount', 1)), SEARCH_MAX_PAGES)
+                if page_count - 1 < len(dense[shop]):
+                    scans[shop] = page_count
+                    stats['shop_scans'] += 1
+
+        # 2. ショップ単位で読む方が安いショップは残りページを並列に取得する（全商品が見つかった時点で打ち切る）
+        def page_jobs():
+            for shop, page_count in scans.items():
+                for page in range(2, page_count + 1):
+                    if not dense[shop]:
+                        break
+                    yield (shop, page), ITEM_SEARCH_URL, shop_search_params(app_id, shop, page)
+
+        async with aclosing(iter_fetch(page_jobs(), client=client)) as fetched:
+            async for (shop, _page), data in fetched:
+                stats['api_calls'] += 1
+                for entry in pick(shop, data):
+                    yield entry
+
+        # 3. 追跡商品の少ないショップと、ショップ検索で見つからなかった商品は商品コード単位で取得する
+        leftovers = sparse + [code for codes in dense.values() for code in sorted(codes)]
+        stats['per_code'] += len(leftovers)
+        async with aclosing(iter_fetch(item_search_jobs(leftovers, app_id), client=client)) as fetched:
+            async for code, data in fetched:
+                stats['api_calls'] += 1
+                yield code, (data or {}).get('Items', [])
+
+
+def iter_planned_items(item_codes, app_id, shop_codes, min_dense=None, stats=None, window=None):
+    # iter_items_by_codes と同じく (item_code, Items) を返す。stats に呼び出し回数の内訳を記録する。
+    # item_codes は window 件ずつ読み、その範囲ごとにショップへまとめて取得する
+    # （範囲の境目をまたぐショップは、それぞれの範囲で別のショップとして数える）
+    min_dense = min_dense or int(os.getenv('RAKUTEN_SHOP_SCAN_MIN_ITEMS', '3'))
+    window = window or _plan_window()
+    stats = stats if stats is not None else {}
+    stats.update({'codes': 0, 'shops': 0, 'api_calls': 0, 'shop_scans': 0, 'per_code': 0})
+
+    codes = iter(item_codes)
+    while block := list(islice(codes, window)):
+        groups = group_by_shop(block, shop_codes)
+        stats['codes'] += len(block)
+        stats['shops'] += len(groups)
+        yield from iter_in_background(lambda: _iter_planned(groups, app_id, min_dense, stats))
+
+    stats['saved'] = stats['codes'] - stats['api_calls']
+    logger.info(
+        f"ショップ単位取得: 対象 {stats['codes']} 件 / {stats['shops']} ショップ"
+        f"（ショップ検索 {stats['shop_scans']} 件、商品コード検索 {stats['per_code']} 件）。"
+        f"API呼び出し {stats['api_calls']} 回、商品コード単位に比べ {stats['saved']} 回削減"
+    )
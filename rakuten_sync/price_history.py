@@ -0,0 +1,375 @@
+import logging
+import os
+import time
+from datetime import datetime
+from itertools import chain, islice
+
+from rakuten.fetcher import iter_items_by_codes, log_api_stats
+from rakuten.key_pool import set_rate_share
+from rakuten_sync.change_detection import ChangeDetector, FingerprintStore
+from rakuten_sync.intervals import (
+    IN_CHUNK_SIZE, add_history_mode_argument, interval_key, interval_spec, interval_values, iter_open_intervals,
+    to_interval,
+)
+from rakuten_sync.journal import RunJournal
+from rakuten_sync.planner import iter_planned_items, load_shop_codes
+from rakuten_sync.scheduler import add_schedule_arguments, new_scheduler
+from rakuten_sync.schema import PRICE_HISTORY, unwrap
+from rakuten_sync.sharding import filter_shard, shard_suffix, validate_shard, write_shard_report
+from supabase_client.copy_writer import add_writer_argument, writer_client
+from supabase_client.pagination import iter_column_values
+from utils import metrics
+
+# 追跡対象の商品コードから価格履歴テーブルへ登録する処理（main3.py / main4.py 共通）。
+# 取得 → 変換 → 登録をジェネレータでつなぎ、一定件数ごとに書き込むことでメモリ使用量を一定に保つ。
+
+logger = logging.getLogger(__name__)
+
+
+def add_refresh_arguments(parser):
+    parser.add_argument(
+        '--full-snapshot',
+        action='store_true',
+        help='前回から変化のない商品も含めて全件を登録する',
+    )
+    parser.add_argument(
+        '--plan-by-shop',
+        action='store_true',
+        help='追跡商品の多いショップはショップ単位の検索でまとめて取得し、API呼び出しを減らす'
+             '（商品コードは RAKUTEN_PLAN_WINDOW 件ずつショップにまとめる）',
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='前回中断した実行のジャーナルから再開する（取得済みの商品はスキップし、未登録の行だけ登録する）',
+    )
+    parser.add_argument(
+        '--shard-index',
+        type=int,
+        default=0,
+        help='複数ワーカーで分担する場合の、このワーカーの番号（0 始まり）',
+    )
+    parser.add_argument(
+        '--shard-count',
+        type=int,
+        default=1,
+        help='分担するワーカー数。item_code のハッシュで担当を分け、APIのレート上限も等分する',
+    )
+    add_history_mode_argument(parser)
+    add_schedule_arguments(parser)
+    return add_writer_argument(parser)
+
+
+def start_shard(shard_index, shard_count):
+    validate_shard(shard_index, shard_count)
+    if shard_count > 1:
+        set_rate_share(1 / shard_count)
+        logger.info(f"シャード {shard_index + 1}/{shard_count} として実行")
+
+
+def iter_tracked_item_codes(supabase, table, page_size=None):
+    # 追跡対象の商品コードをページ単位で読み、item_code の昇順に1件ずつ返す。
+    # 途中で読み込みに失敗した場合は例外を送出する（一部の商品だけの更新を成功として扱わない）
+    count = 0
+    try:
+        for code in iter_column_values(supabase, table, 'item_code', page_size):
+            count += 1
+            yield code
+    except Exception:
+        logger.exception(f"[ERROR] {table} の取得失敗（{count} 件目以降を読み込めませんでした）")
+        raise
+    logger.info(f"{count} 件の商品コードを取得（{table}）")
+
+
+def iter_transformed_blocks(results, block_size=None):
+    # 取得結果を block_size 件ずつまとめて一括変換し、(item_code, Items, 変換後の行) を返す
+    block_size = block_size or int(os.getenv('TRANSFORM_BLOCK_SIZE', '100'))
+    for block in chunked(results, block_size):
+        rows = iter(PRICE_HISTORY.rows_of([item for _code, items in block for item in unwrap(items)]))
+        for code, items in block:
+            yield code, items, [next(rows) for _ in items]
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+# スナップショット形式の価格履歴の一意キー。登録は upsert にし、タイムアウト後の再試行や --resume での
+# 再登録で、実際には登録済みだった行を二重に登録しないようにする（DDL.sql の一意索引が必要）
+SNAPSHOT_KEY = 'item_code,timestamp'
+
+
+def insert_chunk(supabase, table, chunk, max_retries, on_conflict=None):
+    # on_conflict を指定すると、同じキーの行を上書きする upsert で登録する
+    codes = [row.get('item_code') for row in chunk]
+    if on_conflict is None:
+        write = lambda: supabase.table(table).insert(chunk).execute()  # noqa: E731
+    else:
+        write = lambda: supabase.table(table).upsert(chunk, on_conflict=on_conflict).execute()  # noqa: E731
+    return write_with_retries(
+        write, table, len(chunk), max_retries, f"{len(chunk)} 件, item_code={codes[0]}〜{codes[-1]}",
+    )
+
+
+def write_with_retries(write, table, rows, max_retries, description):
+    # write() を失敗時に間隔を空けて再試行する。最後まで失敗した場合は報告して False を返す
+    for attempt in range(max_retries + 1):
+        try:
+            with metrics.timer('supabase_write', table=table):
+                write()
+            metrics.count('rows_written', rows, table=table)
+            return True
+        except Exception:
+            metrics.count('supabase_write_errors', table=table)
+            if attempt == max_retries:
+                logger.exception(f"Supabase {table} 登録失敗（{description}）")
+                return False
+            wait = 2 ** attempt
+            logger.warning(f"Supabase {table} 登録失敗、{wait} 秒後に再試行（{attempt + 1}/{max_retries}）")
+            time.sleep(wait)
+
+
+class HistoryWriter:
+    # 登録先テーブル1つ分の書き込み口。行を受け取り、変化検知のうえ chunk_size 件ごとに登録する。
+    # 失敗したチャンクは個別に再試行し、それでも失敗した分だけを報告して処理を続ける
+    def __init__(self, supabase, table, detector=None, chunk_size=None, max_retries=None, journal=None):
+        self.supabase = supabase
+        self.table = table
+        self.detector = detector
+        self.journal = journal
+        self.chunk_size = chunk_size or int(os.getenv('PRICE_HISTORY_CHUNK_SIZE', '500'))
+        self.max_retries = int(os.getenv('SUPABASE_WRITE_RETRIES', '3')) if max_retries is None else max_retries
+        self.summary = {'inserted': 0, 'failed': 0, 'failed_chunks': 0, 'unchanged': 0}
+        self._pending = []
+        self._buffer = []
+
+    def add(self, row):
+        self._pending.append(row)
+        if len(self._pending) >= self.chunk_size:
+            self._select_pending()
+            while len(self._buffer) >= self.chunk_size:
+                self._write(self._buffer[:self.chunk_size])
+                del self._buffer[:self.chunk_size]
+
+    def _select_pending(self):
+        rows, self._pending = self._pending, []
+        if self.detector:
+            changed = self.detector.select_changed(rows)
+            if self.journal and len(changed) < len(rows):
+                changed_ids = {id(row) for row in changed}
+                self.journal.mark_committed(self.table, [row['item_code'] for row in rows if id(row) not in changed_ids])
+            rows = changed
+        self._buffer.extend(rows)
+
+    def _write(self, chunk):
+        if insert_chunk(self.supabase, self.table, chunk, self.max_retries, on_conflict=SNAPSHOT_KEY):
+            self.summary['inserted'] += len(chunk)
+            if self.detector:
+                self.detector.commit(chunk)
+            if self.journal:
+                self.journal.mark_committed(self.table, [row['item_code'] for row in chunk])
+            logger.info(f"{len(chunk)} 件のデータを Supabase の {self.table} に登録完了")
+        else:
+            self.summary['failed'] += len(chunk)
+            self.summary['failed_chunks'] += 1
+
+    def close(self):
+        self._select_pending()
+        for start in range(0, len(self._buffer), self.chunk_size):
+            self._write(self._buffer[start:start + self.chunk_size])
+        self._buffer = []
+        if self.detector:
+            self.summary['unchanged'] = self.detector.unchanged
+            metrics.count('rows_unchanged', self.detector.unchanged, table=self.table)
+        if self.summary['inserted'] == 0 and self.summary['failed'] == 0:
+            logger.info(f"{self.table} への登録データが空のため、Supabaseへの登録をスキップ")
+        logger.info(
+            f"{self.table} 登録結果: 成功 {self.summary['inserted']} 件 / 失敗 {self.summary['failed']} 件 / "
+            f"変化なしでスキップ {self.summary['unchanged']} 件"
+        )
+        return self.summary
+
+
+class IntervalWriter:
+    # 期間形式（--history-mode intervals）の書き込み口。HistoryWriter と同じく行を受け取り、chunk_size 件ごとに
+    # 開いている期間と値を比べて、変わったキーだけ期間を閉じ、新しい期間を追加する。
+    # 比較の相手は期間テーブル自体なので、ローカルのフィンガープリントには依存しない
+    def __init__(self, supabase, db, spec, chunk_size=None, max_retries=None, journal=None):
+        self.supabase = supabase  # 開いている期間の読み込み用
+        self.db = db              # 書き込み用（--writer に応じたクライアント）
+        self.spec = spec
+        self.journal = journal
+        self.chunk_size = chunk_size or int(os.getenv('PRICE_HISTORY_CHUNK_SIZE', '500'))
+        self.max_retries = int(os.getenv('SUPABASE_WRITE_RETRIES', '3')) if max_retries is None else max_retries
+        self.summary = {'inserted': 0, 'closed': 0, 'failed': 0, 'failed_chunks': 0, 'unchanged': 0}
+        self._buffer = []
+
+    def add(self, row):
+        self._buffer.append(row)
+        if len(self._buffer) >= self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        rows, self._buffer = self._buffer, []
+        if not rows:
+            return
+        # 同じキーが複数あれば後の行を使う
+        latest = {interval_key(row, self.spec): row for row in rows}
+        try:
+            current = {
+                interval_key(row, self.spec): row
+                for row in iter_open_intervals(self.supabase, self.spec, {row['item_code'] for row in rows})
+            }
+        except Exception:
+            logger.exception(f"{self.spec.table} の現在の期間の取得失敗（{len(rows)} 件）")
+            self.summary['failed'] += len(rows)
+            self.summary['failed_chunks'] += 1
+            return
+        changed = [
+            row for key, row in latest.items()
+            if key not in current or interval_values(current[key], self.spec) != interval_values(row, self.spec)
+        ]
+        self.summary['unchanged'] += len(latest) - len(changed)
+        closing = {}  # 新しい期間の開始時刻 -> 閉じる期間の id
+        for row in changed:
+            previous = current.get(interval_key(row, self.spec))
+            if previous is not None:
+                closing.setdefault(row['timestamp'], []).append(previous['id'])
+        # 開いている期間はキーごとに1つなので、閉じてから追加する
+        if all(self.close_intervals(ids, valid_to) for valid_to, ids in closing.items()) and (
+            not changed or insert_chunk(self.db, self.spec.table, [to_interval(row, self.spec) for row in changed],
+                                        self.max_retries)
+        ):
+            self.summary['inserted'] += len(changed)
+            if self.journal:
+                self.journal.mark_committed(self.spec.source, [row['item_code'] for row in rows])
+            if changed:
+                logger.info(f"{len(changed)} 件の期間を Supabase の {self.spec.table} に登録完了")
+        else:
+            self.summary['failed'] += len(changed)
+            self.summary['failed_chunks'] += 1
+
+    def close_intervals(self, ids, valid_to):
+        # 失敗した場合は開いたまま残るため、次回の実行で同じ変化として閉じ直される
+        ok = True
+        for start in range(0, len(ids), IN_CHUNK_SIZE):
+            part = ids[start:start + IN_CHUNK_SIZE]
+            if write_with_retries(
+                lambda: self.db.table(self.spec.table).update({'valid_to': valid_to}).in_('id', part).execute(),
+                self.spec.table, len(part), self.max_retries, f"{len(part)} 件の期間を閉じる",
+            ):
+                self.summary['closed'] += len(part)
+            else:
+                ok = False
+        return ok
+
+    def close_missing(self, filters, present_codes, valid_to):
+        # filters（例: ジャンル・期間）の範囲で開いている期間のうち、今回 present_codes に現れなかった商品の期間を閉じる
+        self._flush()
+        try:
+            ids = [
+                row['id'] for row in iter_open_intervals(self.supabase, self.spec, filters=filters)
+                if row['item_code'] not in present_codes
+            ]
+        except Exception:
+            logger.exception(f"{self.spec.table} の現在の期間の取得失敗（{filters}）")
+            return False
+        return self.close_intervals(ids, valid_to) if ids else True
+
+    def close(self):
+        self._flush()
+        logger.info(
+            f"{self.spec.table} 登録結果: 新しい期間 {self.summary['inserted']} 件 / 閉じた期間 {self.summary['closed']} 件 / "
+            f"失敗 {self.summary['failed']} 件 / 変化なし {self.summary['unchanged']} 件"
+        )
+        metrics.count('rows_unchanged', self.summary['unchanged'], table=self.spec.table)
+        return self.summary
+
+
+def history_writer(supabase, db, target_table, history_mode, store, full_snapshot=False, journal=None):
+    # --history-mode に応じた書き込み口を返す
+    if history_mode == 'intervals':
+        return IntervalWriter(supabase, db, interval_spec(target_table), journal=journal)
+    return HistoryWriter(
+        db, target_table, ChangeDetector(store, target_table, full_snapshot=full_snapshot), journal=journal,
+    )
+
+
+def iter_fetched(supabase, item_codes, app_id, plan_by_shop=False):
+    if plan_by_shop:
+        return iter_planned_items(item_codes, app_id, load_shop_codes(supabase))
+    return iter_items_by_codes(item_codes, app_id)
+
+
+def run_price_history(supabase, app_id, source_table, target_table, full_snapshot=False,
+                      plan_by_shop=False, resume=False, shard_index=0, shard_count=1, writer=None,
+                      history_mode='snapshot', api_budget=None, max_staleness_hours=24.0, ranking_boost=4.0,
+                      ranking_window_hours=24.0):
+    start_shard(shard_index, shard_count)
+    metrics.start_run(target_table + shard_suffix(shard_index, shard_count))
+    started_at = datetime.now()
+
+    # 最初のページを読んだ時点で取得を始める（--api-budget 指定時は、全件を読んでから取得する商品を選ぶ）
+    item_codes = filter_shard(iter_tracked_item_codes(supabase, source_table), shard_index, shard_count)
+    scheduler = new_scheduler(
+        supabase, target_table + shard_suffix(shard_index, shard_count), api_budget and api_budget // shard_count,
+        max_staleness_hours, ranking_boost, ranking_window_hours, history_mode,
+    )
+    if scheduler:
+        item_codes = iter(scheduler.select(item_codes))
+    first = next(item_codes, None)
+    if first is None:
+        logger.warning("追跡対象の商品コードが見つかりません")
+        if scheduler:
+            scheduler.close()
+        return None
+    item_codes = chain([first], item_codes)
+
+    journal = RunJournal(target_table + shard_suffix(shard_index, shard_count), resume=resume)
+    store = FingerprintStore()
+    history = history_writer(
+        supabase, writer_client(supabase, writer), target_table, history_mode, store, full_snapshot, journal,
+    )
+    fetched_codes = 0
+    succeeded = False
+    try:
+        if resume:
+            # 前回取得済みで未登録の行を先に登録し、取得済みの商品は再取得しない
+            for row in journal.pending(target_table):
+                history.add(row)
+            seen = journal.seen()
+            item_codes = (code for code in item_codes if code not in seen)
+        try:
+            for code, _items, rows in iter_transformed_blocks(iter_fetched(supabase, item_codes, app_id, plan_by_shop)):
+                fetched_codes += 1
+                journal.record(code, {target_table: rows} if rows else {})
+                if scheduler:
+                    scheduler.observe(code, rows)
+                for row in rows:
+                    history.add(row)
+        except Exception:
+            # 商品コードの読み込み等が途中で失敗した場合も、取得済みの行は登録してから失敗として終える
+            # （ジャーナルは残すため、--resume で続きから再実行できる）
+            history.close()
+            journal.close()
+            raise
+        summary = history.close()
+        succeeded = True
+    finally:
+        store.close()
+        if scheduler:
+            schedule = scheduler.close(succeeded)
+
+    summary['codes'] = fetched_codes
+    if scheduler:
+        summary['schedule'] = schedule
+    if summary['failed'] == 0:
+        journal.finish()
+    else:
+        journal.close()
+        logger.warning(f"未登録の行が残っています。--resume で再実行すると {target_table} へ登録し直します")
+    log_api_stats()
+    write_shard_report(target_table, shard_index, shard_count, summary, started_at, datetime.now())
+    return summary
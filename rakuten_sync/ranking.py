@@ -0,0 +1,239 @@
+import logging
+import os
+from datetime import datetime
+from contextlib import aclosing
+
+from rakuten.api import get_json
+from rakuten.fetcher import iter_fetch, iter_in_background, log_api_stats
+from rakuten.http_client import new_async_client
+from rakuten_sync.intervals import add_history_mode_argument, interval_spec
+from rakuten_sync.price_history import IntervalWriter, write_with_retries
+from rakuten_sync.schema import MASTER, RANKING, unwrap
+from supabase_client.batch_writer import BatchWriter
+from supabase_client.copy_writer import add_writer_argument, writer_client
+from utils import metrics
+
+# 楽天ランキングを取得し、商品マスタ（mst_rakuten_items）とランキング履歴（trn_rakuten_ranking）に保存する
+
+logger = logging.getLogger(__name__)
+
+RAKUTEN_RANKING_URL = 'https://app.rakuten.co.jp/services/api/IchibaItem/Ranking/20220601'
+RAKUTEN_GENRE_URL = 'https://app.rakuten.co.jp/services/api/IchibaGenre/Search/20140222'
+
+RANKING_PAGE_SIZE = 30   # ランキングAPIは1ページ30件
+RANKING_MAX_PAGES = 34   # 取得できるのは上位1000位（34ページ）まで
+PERIODS = ('realtime', 'daily')
+
+
+def add_ranking_arguments(parser):
+    parser.add_argument(
+        '--genres',
+        type=lambda value: [genre.strip() for genre in value.split(',') if genre.strip()],
+        help='ジャンル別ランキングを取得するジャンルID（カンマ区切り）。省略時は総合ランキングのみ',
+    )
+    parser.add_argument(
+        '--genre-tree-depth',
+        type=int,
+        default=0,
+        help='--genres の各ジャンルから何階層下のジャンルまでたどるか',
+    )
+    parser.add_argument(
+        '--periods',
+        type=lambda value: [period.strip() for period in value.split(',') if period.strip()],
+        default=list(PERIODS),
+        help='取得する集計期間（realtime, daily をカンマ区切り）',
+    )
+    parser.add_argument(
+        '--max-pages',
+        type=int,
+        default=RANKING_MAX_PAGES,
+        help='ジャンル・期間ごとに取得する最大ページ数',
+    )
+    add_history_mode_argument(parser)
+    return add_writer_argument(parser)
+
+
+def fetch_ranking_items(app_id):
+    params = {
+        'applicationId': app_id,
+        'format': 'json',
+        'hits': 100
+    }
+    try:
+        items = get_json(RAKUTEN_RANKING_URL, params).get('Items', [])
+        logger.info("楽天ランキングデータの取得に成功")
+        return items
+    except Exception as e:
+        logger.error(f"楽天ランキング取得失敗: {str(e)}")
+        return []
+
+
+def transform_items(items):
+    transformed = RANKING.rows_of(unwrap(items))
+    logger.debug(f"{len(transformed)} 件のランキングデータを整形")
+    return transformed
+
+
+def to_master_rows(items):
+    return MASTER.rows_of(items)
+
+
+def _write_retries():
+    return int(os.getenv('SUPABASE_WRITE_RETRIES', '3'))
+
+
+def upsert_items_to_master(supabase, items):
+    # 登録できたか（登録対象がなければ True）を返す
+    if not items:
+        logger.warning("商品マスタへの登録対象データが空です")
+        return True
+
+    master_items = to_master_rows(items)
+    stored = write_with_retries(
+        lambda: supabase.table('mst_rakuten_items').upsert(master_items, on_conflict="item_code").execute(),
+        'mst_rakuten_items', len(master_items), _write_retries(), f"{len(master_items)} 件",
+    )
+    if stored:
+        logger.info(f"{len(master_items)} 件の商品データを mst_rakuten_items に保存完了")
+    return stored
+
+
+def insert_ranking(supabase, data):
+    # 登録できたか（登録対象がなければ True）を返す
+    if not data:
+        logger.warning("Supabaseへの挿入対象データが空です")
+        return True
+    stored = write_with_retries(
+        lambda: supabase.table('trn_rakuten_ranking').upsert(data).execute(),
+        'trn_rakuten_ranking', len(data), _write_retries(), f"{len(data)} 件",
+    )
+    if stored:
+        logger.info(f"{len(data)} 件のデータを trn_rakuten_ranking に保存完了")
+    return stored
+
+
+def store_ranking(supabase, items):
+    # 商品マスタとランキングデータへ登録し、両方とも登録できたかを返す
+    stored_master = upsert_items_to_master(supabase, [item['Item'] for item in items])
+    stored_ranking = insert_ranking(supabase, transform_items(items))
+    return stored_master and stored_ranking
+
+
+def run_ranking(supabase, app_id, writer=None):
+    metrics.start_run('ranking')
+    items = fetch_ranking_items(app_id)
+    if not items:
+        logger.warning("ランキングデータが取得できませんでした")
+        return []
+
+    store_ranking(writer_client(supabase, writer), items)
+    log_api_stats()
+    return items
+
+
+# --- ジャンル別・期間別ランキングの一括取り込み ---
+
+def ranking_params(app_id, genre_id, period, page):
+    params = {
+        'applicationId': app_id,
+        'format': 'json',
+        'genreId': genre_id,
+        'page': page,
+    }
+    # period を省略するとデイリーランキングになる
+    if period == 'realtime':
+        params['period'] = 'realtime'
+    return params
+
+
+async def iter_genre_tree(app_id, genre_ids, depth, client):
+    # 指定ジャンルと、その depth 階層下までの子ジャンルのIDを返す
+    level = list(genre_ids)
+    for current_depth in range(depth + 1):
+        for genre_id in level:
+            yield str(genre_id)
+        if current_depth == depth:
+            return
+        jobs = (
+            (genre_id, RAKUTEN_GENRE_URL, {'applicationId': app_id, 'format': 'json', 'genreId': genre_id})
+            for genre_id in level
+        )
+        children = []
+        async with aclosing(iter_fetch(jobs, client=client)) as fetched:
+            async for _genre_id, data in fetched:
+                for child in (data or {}).get('children', []):
+                    children.append(child.get('child', child).get('genreId'))
+        level = [child for child in children if child is not None]
+
+
+async def iter_ranking_pages(app_id, genre_ids, periods, max_pages, tree_depth=0):
+    # ジャンル×期間の組み合わせを並列に取得する。ページ n は、ページ n-1 が満杯だった組み合わせだけ取得する。
+    # 全リクエストで1つのレート制限と接続プールを共有する。
+    # 取得に失敗したページは None、取得できたが商品のないページは [] を返す
+    async with new_async_client() as client:
+        genres = [genre async for genre in iter_genre_tree(app_id, genre_ids, tree_depth, client)]
+        logger.info(f"ランキング取得対象: {len(genres)} ジャンル × {len(periods)} 期間")
+        targets = [(genre_id, period) for genre_id in genres for period in periods]
+        page = 1
+        while targets and page <= max_pages:
+            jobs = (
+                ((genre_id, period, page), RAKUTEN_RANKING_URL, ranking_params(app_id, genre_id, period, page))
+                for genre_id, period in targets
+            )
+            next_targets = []
+            async with aclosing(iter_fetch(jobs, client=client)) as fetched:
+                async for (genre_id, period, current_page), data in fetched:
+                    items = None if data is None else data.get('Items', [])
+                    yield (genre_id, period, current_page), items
+                    page_count = (data or {}).get('pageCount', max_pages)
+                    if len(items or []) >= RANKING_PAGE_SIZE and current_page < page_count:
+                        next_targets.append((genre_id, period))
+            targets = next_targets
+            page += 1
+
+
+def run_ranking_ingestion(supabase, app_id, genres, periods=PERIODS, max_pages=RANKING_MAX_PAGES, genre_tree_depth=0,
+                          writer=None, history_mode='snapshot'):
+    # 取得できたページから順に整形し、mst_rakuten_items / trn_rakuten_ranking へまとめて書き込む。
+    # --history-mode intervals では trn_rakuten_ranking_interval に順位の期間として登録する
+    metrics.start_run('ranking')
+    pages = 0
+    db = writer_client(supabase, writer)
+    intervals = IntervalWriter(supabase, db, interval_spec('trn_rakuten_ranking')) if history_mode == 'intervals' else None
+    present = {}  # (ジャンル, 期間) -> ランキングに載っていた item_code。取得に失敗したページがあれば None
+    with BatchWriter(db) as writer:
+        produce = lambda: iter_ranking_pages(app_id, genres, periods, max_pages, genre_tree_depth)  # noqa: E731
+        for (genre_id, period, _page), items in iter_in_background(produce):
+            if items is None:
+                present[(genre_id, period)] = None
+                continue
+            # 商品のないページ（ランキングが短く、最後のページが空だった等）は失敗として扱わない
+            codes = present.setdefault((genre_id, period), set())
+            if not items:
+                continue
+            pages += 1
+            for row in to_master_rows([wrapper['Item'] for wrapper in items]):
+                writer.upsert('mst_rakuten_items', row, on_conflict='item_code')
+            for row in transform_items(items):
+                row['ranking_genre_id'] = genre_id
+                row['period'] = period
+                if intervals is None:
+                    writer.insert('trn_rakuten_ranking', row)
+                else:
+                    intervals.add(row)
+                    if codes is not None:
+                        codes.add(row['item_code'])
+    if intervals is not None:
+        # 全ページを取得できたジャンル・期間だけ、ランキングから外れた商品の期間を閉じる
+        valid_to = datetime.now().isoformat()
+        for (genre_id, period), codes in present.items():
+            if codes is not None:
+                intervals.close_missing({'ranking_genre_id': genre_id, 'period': period}, codes, valid_to)
+        summary = intervals.close()
+        writer.rows_written['trn_rakuten_ranking_interval'] = summary['inserted']
+    logger.info(
+        f"ランキング取り込み完了: {pages} ページ / trn_rakuten_ranking {writer.rows_written.get('trn_rakuten_ranking', 0)} 件 / "
+        f"mst_rakuten_items {writer.rows_written.get('mst_rakuten_items', 0)} 件（書き込み {writer.requests} 回）"
+    )
+    log_api_stats()
+    return writer.rows_written
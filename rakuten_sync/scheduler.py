@@ -0,0 +1,253 @@
+import heapq
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+
+from rakuten_sync.change_detection import fingerprint
+from rakuten_sync.intervals import interval_spec
+from supabase_client.pagination import iter_rows
+from utils import metrics
+from utils.state import state_path
+
+# 追跡商品の更新頻度を、価格の変わりやすさに合わせて調整する（--api-budget）。
+# 商品ごとに「取得した回数・変化していた回数・観測した期間」を記録し、1時間あたりの変化率を推定する。
+# 実行のたびに、前回の取得から変化している確率（1 - exp(-変化率 × 経過時間)）の高い商品から順に
+# API呼び出しの予算の範囲で選ぶ。直近でランキングに載った商品は変化率を ranking_boost 倍に見積もる。
+# ただし次回の実行までに max_staleness_hours を超えてしまう商品は、予算に関わらず必ず取得する。
+
+logger = logging.getLogger(__name__)
+
+# 変化率の事前分布（観測が少ない商品は「1週間に1回程度変わる」とみなす）
+PRIOR_CHANGES = 1.0
+PRIOR_HOURS = 168.0
+DEFAULT_RUN_INTERVAL_HOURS = 1.0
+
+
+def add_schedule_arguments(parser):
+    parser.add_argument(
+        '--api-budget',
+        type=int,
+        default=int(os.getenv('RAKUTEN_API_BUDGET', '0')) or None,
+        help='1回の実行で取得する商品数の上限。指定すると、価格の変わりやすい商品から優先して取得する（省略時は全件）',
+    )
+    parser.add_argument(
+        '--max-staleness-hours',
+        type=float,
+        default=float(os.getenv('RAKUTEN_MAX_STALENESS_HOURS', '24')),
+        help='--api-budget 指定時も、最後の取得からこの時間を超える前に必ず取得し直す',
+    )
+    parser.add_argument(
+        '--ranking-boost',
+        type=float,
+        default=float(os.getenv('RAKUTEN_RANKING_BOOST', '4')),
+        help='直近でランキングに載った商品の変化率を何倍に見積もるか',
+    )
+    parser.add_argument(
+        '--ranking-window-hours',
+        type=float,
+        default=float(os.getenv('RAKUTEN_RANKING_WINDOW_HOURS', '24')),
+        help='何時間以内にランキングに載った商品を優先するか',
+    )
+    return parser
+
+
+class ItemStatsStore:
+    # scope（登録先テーブル名など）ごとに item_code -> 取得・変化の記録 を保持する
+    def __init__(self, path=None):
+        self.path = path or state_path('schedule.sqlite')
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("""
+                create table if not exists item_stats (
+                    scope text not null,
+                    item_code text not null,
+                    first_polled real not null,
+                    last_polled real not null,
+                    polls integer not null,
+                    changes integer not null,
+                    fingerprint text not null,
+                    primary key (scope, item_code)
+                )
+            """)
+            self._conn.execute("create table if not exists run (scope text primary key, started_at real not null)")
+
+    def get_many(self, scope, item_codes):
+        found = {}
+        codes = list(item_codes)
+        with self._lock:
+            for start in range(0, len(codes), 500):
+                part = codes[start:start + 500]
+                placeholders = ','.join('?' * len(part))
+                cursor = self._conn.execute(
+                    "select item_code, first_polled, last_polled, polls, changes, fingerprint from item_stats "
+                    f"where scope = ? and item_code in ({placeholders})",
+                    [scope, *part],
+                )
+                found.update((row[0], row[1:]) for row in cursor)
+        return found
+
+    def record(self, scope, observations, polled_at):
+        # observations: item_code -> フィンガープリント。前回と異なれば変化ありとして数える
+        previous = self.get_many(scope, observations)
+        rows = []
+        for code, value in observations.items():
+            first, _last, polls, changes, last_value = previous.get(code, (polled_at, None, 0, 0, None))
+            changed = last_value is not None and last_value != value
+            rows.append((scope, code, first, polled_at, polls + 1, changes + changed, value))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "insert or replace into item_stats "
+                "(scope, item_code, first_polled, last_polled, polls, changes, fingerprint) values (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def last_run(self, scope):
+        # 前回の（最後まで終わった）実行の開始時刻
+        with self._lock:
+            row = self._conn.execute("select started_at from run where scope = ?", (scope,)).fetchone()
+        return row[0] if row else None
+
+    def record_run(self, scope, started_at):
+        with self._lock, self._conn:
+            self._conn.execute("insert or replace into run (scope, started_at) values (?, ?)", (scope, started_at))
+
+    def close(self):
+        self._conn.close()
+
+
+def change_rate(stats, now):
+    # 1時間あたりの変化回数の推定値（観測が少ないうちは事前分布に寄せる）
+    first, _last, _polls, changes, _fingerprint = stats
+    hours = max(now - first, 0) / 3600
+    return (changes + PRIOR_CHANGES) / (hours + PRIOR_HOURS)
+
+
+def recent_ranking_codes(supabase, hours, history_mode='snapshot'):
+    # hours 時間以内にランキングに載っていた商品コード
+    since = (datetime.now() - timedelta(hours=hours)).isoformat()
+    if history_mode == 'intervals':
+        table = interval_spec('trn_rakuten_ranking').table
+        where = lambda query: query.or_(f'valid_to.is.null,valid_to.gte."{since}"')  # noqa: E731
+    else:
+        table = 'trn_rakuten_ranking'
+        where = lambda query: query.gte('timestamp', since)  # noqa: E731
+    try:
+        return {row['item_code'] for row in iter_rows(supabase, table, 'item_code', 'item_code', where=where)}
+    except Exception:
+        logger.exception(f"{table} から直近のランキング商品の取得失敗")
+        return set()
+
+
+class RefreshScheduler:
+    def __init__(self, scope, budget, max_staleness_hours=24.0, ranking_codes=(), ranking_boost=4.0, store=None,
+                 now=None):
+        self.scope = scope
+        self.budget = budget
+        self.max_staleness = max_staleness_hours * 3600
+        self.ranking_codes = set(ranking_codes)
+        self.ranking_boost = ranking_boost
+        self.store = store or ItemStatsStore()
+        self.now = now or time.time()
+        previous_run = self.store.last_run(scope)
+        # 次回の実行までの間隔は、前回から今回までの間隔と同じとみなす
+        interval = self.now - previous_run if previous_run else DEFAULT_RUN_INTERVAL_HOURS * 3600
+        self.run_interval = min(max(interval, 60), self.max_staleness)
+        self.report = {}
+        self._observed = {}
+
+    def select(self, entries, key=lambda entry: entry, free=()):
+        # entries（item_code の昇順）から今回取得するものを選び、同じ順序のリストで返す。
+        # free に含まれる商品（取得済みのレスポンスを使える等、API呼び出しが不要なもの）は常に選び、予算に数えない
+        selected = []   # 必ず取得するもの
+        candidates = []  # (変化している確率, 順番, entry, 経過時間)
+        skipped_ages = []
+        total = 0
+        entries = iter(entries)
+        while block := list(islice(entries, 500)):
+            stats = self.store.get_many(self.scope, [key(entry) for entry in block])
+            for entry in block:
+                code = key(entry)
+                total += 1
+                previous = stats.get(code)
+                if code in free or previous is None:
+                    selected.append((total, entry))
+                    continue
+                age = self.now - previous[1]
+                if age + self.run_interval > self.max_staleness:
+                    selected.append((total, entry))
+                    continue
+                rate = change_rate(previous, self.now) * (self.ranking_boost if code in self.ranking_codes else 1)
+                candidates.append((1 - math.exp(-rate * age / 3600), total, entry, age))
+
+        paid = sum(1 for _order, entry in selected if key(entry) not in free)
+        room = max(self.budget - paid, 0)
+        chosen = heapq.nlargest(room, candidates)
+        chosen_orders = {order for _p, order, _entry, _age in chosen}
+        missed = 0.0
+        for probability, order, entry, age in candidates:
+            if order in chosen_orders:
+                selected.append((order, entry))
+            else:
+                skipped_ages.append(age)
+                missed += probability
+        selected.sort(key=lambda pair: pair[0])
+
+        polled = len(selected)
+        self.report = {
+            'tracked': total,
+            'selected': polled,
+            'forced': paid,
+            'calls_saved': total - polled,
+            'expected_missed_changes': round(missed, 1),
+            'mean_staleness_hours': round(sum(skipped_ages) / len(skipped_ages) / 3600, 2) if skipped_ages else 0.0,
+            'max_staleness_hours': round(max(skipped_ages, default=0) / 3600, 2),
+        }
+        metrics.count('schedule_selected', polled, scope=self.scope)
+        metrics.count('schedule_skipped', total - polled, scope=self.scope)
+        if paid > self.budget:
+            logger.warning(
+                f"最大 {self.max_staleness / 3600:g} 時間の鮮度を保つため、予算 {self.budget} 件を超えて {paid} 件を取得します"
+            )
+        logger.info(
+            f"取得計画（{self.scope}）: 追跡 {total} 件中 {polled} 件を取得（必須 {paid} 件）/ "
+            f"全件更新に比べて {total - polled} 回の呼び出しを節約 / 取得しない商品の経過時間 平均 "
+            f"{self.report['mean_staleness_hours']} 時間・最大 {self.report['max_staleness_hours']} 時間 / "
+            f"見逃している変化の期待値 {self.report['expected_missed_changes']} 件"
+        )
+        return [entry for _order, entry in selected]
+
+    def observe(self, code, rows):
+        # 取得できた商品だけを記録する（取得に失敗した商品は、次回も経過時間に応じて選ばれる）
+        if rows:
+            self._observed[code] = fingerprint(rows[0])
+        if len(self._observed) >= 500:
+            self.flush()
+
+    def flush(self):
+        if self._observed:
+            self.store.record(self.scope, self._observed, self.now)
+            self._observed = {}
+
+    def close(self, succeeded=True):
+        # 実行の開始時刻は、最後まで終わった実行だけを記録する（途中で失敗した実行は次回の間隔の見積もりに使わない）
+        self.flush()
+        if succeeded:
+            self.store.record_run(self.scope, self.now)
+        self.store.close()
+        return self.report
+
+
+def new_scheduler(supabase, scope, api_budget=None, max_staleness_hours=24.0, ranking_boost=4.0,
+                  ranking_window_hours=24.0, history_mode='snapshot'):
+    # --api-budget の指定がなければ None（全件を取得する）
+    if not api_budget:
+        return None
+    ranking = recent_ranking_codes(supabase, ranking_window_hours, history_mode) if ranking_boost != 1 else set()
+    logger.info(f"直近 {ranking_window_hours:g} 時間のランキング商品 {len(ranking)} 件を優先")
+    return RefreshScheduler(scope, api_budget, max_staleness_hours, ranking, ranking_boost)
@@ -0,0 +1,158 @@
+import dataclasses
+from datetime import datetime
+from typing import NamedTuple
+
+from utils import metrics
+
+# 楽天APIの商品項目 -> DBカラム の対応表（全ジョブ共通）。
+# スキーマごとに (項目名, 変換関数) の並びを一度だけ作り、1ページ分の商品をまとめて変換する。
+# タイムスタンプはバッチごとに1回だけ取得する。
+# 行はスキーマごとに生成する slots 付きのレコード（ItemRecord）で表す。辞書より小さく、
+# utils.fastjson（orjson）でそのまま bytes に変換できる。画像URLの配列は API の値をそのまま持ち、書き込み時に1回だけ変換する。
+
+
+class Field(NamedTuple):
+    column: str   # DBカラム名
+    source: str   # 楽天APIの項目名
+    kind: str     # 'raw' / 'int' / 'float' / 'bool' / 'json'
+
+
+FIELDS = {field.column: field for field in (
+    Field('rank', 'rank', 'raw'),
+    Field('item_code', 'itemCode', 'raw'),
+    Field('item_name', 'itemName', 'raw'),
+    Field('item_caption', 'itemCaption', 'raw'),
+    Field('catchcopy', 'catchcopy', 'raw'),
+    Field('item_price', 'itemPrice', 'int'),
+    Field('item_price_base_field', 'itemPriceBaseField', 'raw'),
+    Field('item_price_min1', 'itemPriceMin1', 'int'),
+    Field('item_price_min2', 'itemPriceMin2', 'int'),
+    Field('item_price_min3', 'itemPriceMin3', 'int'),
+    Field('item_price_max1', 'itemPriceMax1', 'int'),
+    Field('item_price_max2', 'itemPriceMax2', 'int'),
+    Field('item_price_max3', 'itemPriceMax3', 'int'),
+    Field('item_url', 'itemUrl', 'raw'),
+    Field('affiliate_url', 'affiliateUrl', 'raw'),
+    Field('affiliate_rate', 'affiliateRate', 'float'),
+    Field('availability', 'availability', 'raw'),
+    Field('credit_card_flag', 'creditCardFlag', 'bool'),
+    Field('postage_flag', 'postageFlag', 'bool'),
+    Field('tax_flag', 'taxFlag', 'bool'),
+    Field('point_rate', 'pointRate', 'raw'),
+    Field('review_average', 'reviewAverage', 'float'),
+    Field('review_count', 'reviewCount', 'raw'),
+    Field('shop_code', 'shopCode', 'raw'),
+    Field('shop_name', 'shopName', 'raw'),
+    Field('shop_url', 'shopUrl', 'raw'),
+    Field('genre_id', 'genreId', 'raw'),
+    Field('medium_image_urls', 'mediumImageUrls', 'json'),
+    Field('small_image_urls', 'smallImageUrls', 'json'),
+)}
+
+# 型ごとの変換関数。None や欠損は 0 / 0.0 / False / [] とみなす。
+# json は JSONB 列で、API の配列をそのまま渡す（文字列にすると JSONB の中に文字列として二重に変換される）
+def _raw(value):
+    return value
+
+
+def _int(value):
+    return int(value or 0)
+
+
+def _float(value):
+    return float(value or 0.0)
+
+
+def _json(value):
+    return value or []
+
+
+CONVERTERS = {
+    'raw': _raw,
+    'int': _int,
+    'float': _float,
+    'bool': bool,
+    'json': _json,
+}
+
+
+class ItemRecord:
+    # Schema ごとに生成するレコード型の基底。既存の処理から辞書と同じように読み書きできる
+    # （row['item_code'] / row.get(...) / row['period'] = ...）。列はスキーマで決まり、追加はできない。
+    # _optional_columns（後で設定する列）は、設定されていなければ keys() に含めない。
+    # 書き込みは keys() の列だけを登録するため、その列がないテーブルにも登録できる
+    __slots__ = ()
+    _optional_columns = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in self.__dataclass_fields__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.__dataclass_fields__ else default
+
+    def keys(self):
+        if not self._optional_columns:
+            return self.__dataclass_fields__.keys()
+        return [
+            name for name in self.__dataclass_fields__
+            if name not in self._optional_columns or getattr(self, name) is not None
+        ]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+
+def record_type(name, columns, extra_columns=()):
+    # extra_columns は API 以外から後で設定する列（未設定なら None）
+    fields = [*columns, *((column, object, dataclasses.field(default=None)) for column in extra_columns)]
+    return dataclasses.make_dataclass(
+        name, fields, bases=(ItemRecord,), slots=True, eq=False,
+        namespace={'_optional_columns': frozenset(extra_columns)},
+    )
+
+
+class Schema:
+    def __init__(self, name, columns, timestamp_column, extra_columns=()):
+        self.name = name
+        self.columns = tuple(columns)
+        self.timestamp_column = timestamp_column
+        self.record = record_type(
+            f"{name.title().replace('_', '')}Record", (*self.columns, timestamp_column), extra_columns,
+        )
+        self._fields = [(FIELDS[column].source, CONVERTERS[FIELDS[column].kind]) for column in self.columns]
+
+    def _to_rows(self, items, timestamp):
+        # 1件1レコードの行形式（PostgREST への書き込み用）。レコードの引数は列の順
+        record, fields = self.record, self._fields
+        return [record(*[convert(item.get(source)) for source, convert in fields], timestamp) for item in items]
+
+    def rows_of(self, items, timestamp=None):
+        # items は API の Item 辞書のリスト。self.record のリストを返す
+        with metrics.timer('transform', schema=self.name):
+            return self._to_rows(items, timestamp or datetime.now().isoformat())
+
+
+def unwrap(items):
+    # API レスポンスの [{'Item': {...}}, ...] から Item 辞書を取り出す
+    return [wrapper.get('Item', {}) for wrapper in items]
+
+
+_ITEM_COLUMNS = [column for column in FIELDS if column != 'rank']
+
+PRICE_HISTORY = Schema('price_history', _ITEM_COLUMNS, 'timestamp')
+# ジャンル別・期間別の取り込み（run_ranking_ingestion）では、取得したジャンルと期間を行に設定する
+RANKING = Schema('ranking', list(FIELDS), 'timestamp', extra_columns=('ranking_genre_id', 'period'))
+MASTER = Schema('master', [
+    'item_code', 'item_name', 'item_caption', 'catchcopy', 'item_price', 'item_url', 'affiliate_url',
+    'affiliate_rate', 'availability', 'credit_card_flag', 'postage_flag', 'tax_flag', 'point_rate',
+    'review_average', 'review_count', 'shop_code', 'shop_name', 'shop_url', 'genre_id',
+    'medium_image_urls', 'small_image_urls',
+], 'updated_at')
@@ -0,0 +1,112 @@
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+
+from utils.state import state_path
+
+# 価格履歴の更新を複数プロセス（GitHub Actions の matrix など）に分割するための仕組み。
+# item_code の安定したハッシュで担当を決めるため、どのワーカーでも同じ商品は同じシャードになる。
+# 各ワーカーは実行結果をレポートに書き出し、merge_shard_reports でまとめて集計する。
+
+logger = logging.getLogger(__name__)
+
+
+def shard_of(item_code, shard_count):
+    digest = hashlib.blake2b(item_code.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % shard_count
+
+
+def filter_shard(item_codes, shard_index, shard_count):
+    if shard_count <= 1:
+        yield from item_codes
+        return
+    for code in item_codes:
+        if shard_of(code, shard_count) == shard_index:
+            yield code
+
+
+def validate_shard(shard_index, shard_count):
+    if shard_count < 1 or not 0 <= shard_index < shard_count:
+        raise ValueError(f"シャード指定が不正です: --shard-index {shard_index} --shard-count {shard_count}")
+
+
+def shard_suffix(shard_index, shard_count):
+    return '' if shard_count <= 1 else f'_shard{shard_index}of{shard_count}'
+
+
+def write_shard_report(name, shard_index, shard_count, summary, started_at, finished_at):
+    report = {
+        'name': name,
+        'shard_index': shard_index,
+        'shard_count': shard_count,
+        'started_at': started_at.isoformat(),
+        'finished_at': finished_at.isoformat(),
+        'elapsed_sec': round((finished_at - started_at).total_seconds(), 3),
+        'summary': summary,
+    }
+    os.makedirs(state_path('reports'), exist_ok=True)
+    path = os.path.join(state_path('reports'), f'{name}{shard_suffix(shard_index, shard_count)}.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    logger.info(f"シャード実行結果を出力: {path}")
+    return path
+
+
+def _add_counts(total, summary):
+    for key, value in summary.items():
+        if isinstance(value, dict):
+            _add_counts(total.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+def merge_shard_reports(paths):
+    # 件数は合計し、所要時間は最初の開始から最後の終了まで（並列実行の実時間）とする
+    reports = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            reports.append(json.load(f))
+    if not reports:
+        return None
+    started = min(datetime.fromisoformat(report['started_at']) for report in reports)
+    finished = max(datetime.fromisoformat(report['finished_at']) for report in reports)
+    merged = {
+        'shards': sorted(f"{report['name']}[{report['shard_index']}]" for report in reports),
+        'shard_count': max(report['shard_count'] for report in reports),
+        'elapsed_sec': round((finished - started).total_seconds(), 3),
+        'slowest_shard_sec': max(report['elapsed_sec'] for report in reports),
+        'summary': {},
+    }
+    for report in reports:
+        _add_counts(merged['summary'], report['summary'] or {})
+    missing = merged['shard_count'] * len({report['name'] for report in reports}) - len(reports)
+    if missing:
+        logger.warning(f"{missing} シャード分のレポートがありません")
+    return merged
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    parser = argparse.ArgumentParser(description='シャードごとの実行結果レポートを集計する')
+    parser.add_argument('paths', nargs='*', help='レポートのパス（省略時は state/reports/*.json）')
+    args = parser.parse_args()
+    # 以前の版が state/reports に出力していた実行メトリクス（metrics_*.json）は集計しない
+    paths = args.paths or sorted(
+        path for path in glob.glob(os.path.join(state_path('reports'), '*.json'))
+        if not os.path.basename(path).startswith('metrics_')
+    )
+    merged = merge_shard_reports(paths)
+    if merged is None:
+        logger.error("集計対象のレポートがありません")
+        sys.exit(1)
+    print(json.dumps(merged, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
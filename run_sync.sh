@@ -3,6 +3,6 @@
 # 仮想環境を有効化
 source "/Users/koonishi/価格ついて席/rakuten_sync/venv/bin/activate"
 
-# スクリプトを実行
-python "/Users/koonishi/価格ついて席/rakuten_sync/main2.py"
-python "/Users/koonishi/価格ついて席/rakuten_sync/main3.py"
+# ランキングと追跡商品の価格履歴を1プロセスで実行（起動とクライアントの作成は1回だけ）
+cd "/Users/koonishi/価格ついて席/rakuten_sync"
+python -m rakuten_sync ranking tracked-refresh
@@ -0,0 +1,141 @@
+import logging
+import os
+from itertools import islice
+
+from supabase_client.pagination import iter_rows
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWriter:
+    # テーブルごとに行を溜め、batch_size 件に達したら複数行まとめて書き込む。
+    # 外部キーの親テーブルを先に書けるよう、最初に行が追加された順にフラッシュする。
+    def __init__(self, client, batch_size=None):
+        self.client = client
+        self.batch_size = batch_size or int(os.getenv('SUPABASE_BATCH_SIZE', '500'))
+        self._buffers = {}    # table -> 行のリスト、または conflict キー -> 行 の dict、または親キー -> 行の集合
+        self._conflicts = {}  # table -> on_conflict（None は insert）
+        self._replaced = {}   # replace で書き込むテーブル -> (親キーの列, 値の列)
+        self.rows_written = {}
+        self.rows_deleted = {}
+        self.requests = 0
+
+    def insert(self, table, row):
+        self._register(table, None)
+        self._buffers[table].append(row)
+        self._maybe_flush(table)
+
+    def upsert(self, table, row, on_conflict):
+        # 同じバッチ内で同じキーが2回現れると PostgREST の upsert が失敗するため、後勝ちで1行にまとめる
+        self._register(table, on_conflict)
+        key = tuple(row[column] for column in on_conflict.split(','))
+        self._buffers[table][key] = row
+        self._maybe_flush(table)
+
+    def replace(self, table, key_column, key, columns, rows):
+        # key_column = key の行の集合を rows（columns の値のタプル）に置き換える。
+        # フラッシュ時に登録済みの行と突き合わせ、足りない行の insert と余分な行（重複を含む）の delete だけを行う
+        if table not in self._buffers:
+            self._buffers[table] = {}
+            self._conflicts[table] = None
+            self._replaced[table] = (key_column, tuple(columns))
+        elif self._replaced.get(table) != (key_column, tuple(columns)):
+            raise ValueError(f"{table} に replace と insert / upsert（または列の異なる replace）を混在できません")
+        self._buffers[table][key] = set(rows)
+        self._maybe_flush(table)
+
+    def _register(self, table, on_conflict):
+        if table not in self._buffers:
+            self._buffers[table] = [] if on_conflict is None else {}
+            self._conflicts[table] = on_conflict
+        elif self._conflicts[table] != on_conflict or table in self._replaced:
+            raise ValueError(f"{table} に insert と upsert（または異なる on_conflict）を混在できません")
+
+    def _maybe_flush(self, table):
+        if len(self._buffers[table]) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        # 外部キーの親テーブルから順に書き込み、失敗したらそこで止めて例外を送出する。
+        # 書き込めた分だけバッファから取り除くため、失敗した行と後続テーブルの行は次の flush で書き直される
+        for table, buffer in self._buffers.items():
+            if table in self._replaced:
+                self._replace(table, buffer)
+            elif isinstance(buffer, dict):
+                while buffer:
+                    keys = list(islice(buffer, self.batch_size))
+                    self._write(table, [buffer[key] for key in keys])
+                    for key in keys:
+                        del buffer[key]
+            else:
+                while buffer:
+                    self._write(table, buffer[:self.batch_size])
+                    del buffer[:self.batch_size]
+
+    def _replace(self, table, desired):
+        # desired（親キー -> 行の集合）は、差分の書き込みが済んでから空にする
+        if not desired:
+            return
+        key_column, columns = self._replaced[table]
+        stale = []
+        present = set()
+        keys = list(desired)
+        for start in range(0, len(keys), 200):
+            part = keys[start:start + 200]
+            existing = iter_rows(
+                self.client, table, ','.join(('id', key_column, *columns)), 'id',
+                where=lambda query: query.in_(key_column, part),
+            )
+            for row in existing:
+                key = row[key_column]
+                values = tuple(row[column] for column in columns)
+                if values not in desired.get(key, ()) or (key, values) in present:
+                    stale.append(row['id'])
+                present.add((key, values))
+        missing = [
+            {key_column: key, **dict(zip(columns, values))}
+            for key, rows in desired.items() for values in rows if (key, values) not in present
+        ]
+        # 2つの書き込みはまとめて実行できないため、足りない行を先に登録してから余分な行を消す。
+        # 途中で失敗しても、行が欠けることはなく余分な行が残るだけで、次の flush の差分で消える
+        for start in range(0, len(missing), self.batch_size):
+            self._write(table, missing[start:start + self.batch_size])
+        for start in range(0, len(stale), 200):
+            self._delete(table, stale[start:start + 200])
+        count = len(desired)
+        desired.clear()
+        logger.info(f"{table}: {count} 件の {key_column} を差分更新（追加 {len(missing)} 件 / 削除 {len(stale)} 件）")
+
+    def _delete(self, table, ids):
+        with metrics.timer('supabase_write', table=table):
+            self.client.table(table).delete().in_('id', ids).execute()
+        metrics.count('rows_deleted', len(ids), table=table)
+        self.requests += 1
+        self.rows_deleted[table] = self.rows_deleted.get(table, 0) + len(ids)
+
+    def _write(self, table, rows):
+        on_conflict = self._conflicts[table]
+        query = self.client.table(table)
+        with metrics.timer('supabase_write', table=table):
+            if on_conflict is None:
+                query.insert(rows).execute()
+            else:
+                query.upsert(rows, on_conflict=on_conflict).execute()
+        metrics.count('rows_written', len(rows), table=table)
+        self.requests += 1
+        self.rows_written[table] = self.rows_written.get(table, 0) + len(rows)
+        logger.info(f"{table} に {len(rows)} 件を一括登録")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # 実行終了時に残りを書き出す。例外発生時も取得済みの分は保存を試みる
+        if exc_type is None:
+            self.flush()
+            return
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("例外発生後の残りデータの書き込みに失敗")
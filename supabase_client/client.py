@@ -1,14 +1,39 @@
 import os
-from supabase_client import create_client
-from dotenv import load_dotenv
+import threading
 
-load_dotenv()
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+from supabase_client.batch_writer import BatchWriter
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+# supabase パッケージの読み込みとクライアントの作成には時間がかかるため、最初に使うときに行う
+# （python -m rakuten_sync の --help や引数の誤りでは作らない）。プロセス内で1つを共有する
+_client = None
+_lock = threading.Lock()
+
+
+def get_supabase():
+    global _client
+    with _lock:
+        if _client is None:
+            from dotenv import load_dotenv
+            from supabase import create_client
+
+            load_dotenv()
+            url = os.getenv("SUPABASE_URL")
+            key = os.getenv("SUPABASE_KEY")
+            if not url or not key:
+                raise EnvironmentError("必要な環境変数（SUPABASE_URL, SUPABASE_KEY）が不足しています")
+            _client = create_client(url, key)
+        return _client
+
+def batch_writer(batch_size=None):
+    return BatchWriter(get_supabase(), batch_size)
+
+def insert_items(item, writer=None):
+    # writer を渡すと複数商品分の行をまとめて書き込む。省略時はこの商品分だけ即時に書き込む
+    if writer is None:
+        with batch_writer() as single:
+            insert_items(item, single)
+        return
 
-def insert_items(item):
     item_data = {
         "item_code": item["itemCode"],
         "item_name": item["itemName"],
@@ -17,18 +42,15 @@ def insert_items(item):
         "shop_name": item["shopName"],
     }
 
-    supabase.table("mst_item_detail").upsert(item_data).execute()
-
-    for size, field in [("small", "smallImageUrls"), ("medium", "mediumImageUrls")]:
-        for image in item.get(field, []):
-            supabase.table("mst_item_detail_image").insert({
-                "item_code": item["itemCode"],
-                "size": size,
-                "image_url": image["imageUrl"]
-            }).execute()
-
-    for tag_id in item.get("tagIds", []):
-        supabase.table("mst_item_detail_tag").insert({
-            "item_code": item["itemCode"],
-            "tag_id": tag_id
-        }).execute()
+    writer.upsert("mst_item_detail", item_data, on_conflict="item_code")
+
+    # 画像・タグは商品ごとの集合として、登録済みの行との差分だけを書き換える
+    writer.replace("mst_item_detail_image", "item_code", item["itemCode"], ("size", "image_url"), [
+        (size, image["imageUrl"])
+        for size, field in [("small", "smallImageUrls"), ("medium", "mediumImageUrls")]
+        for image in item.get(field, [])
+    ])
+
+    writer.replace("mst_item_detail_tag", "item_code", item["itemCode"], ("tag_id",), [
+        (tag_id,) for tag_id in item.get("tagIds", [])
+    ])
@@ -0,0 +1,156 @@
+import atexit
+import logging
+import os
+import threading
+
+from supabase_client.rest_writer import RestBytesClient, WriteResult
+
+# supabase クライアントの書き込み（table().insert / upsert）だけを、Postgres への直接接続に置き換える。
+# 行は COPY ... FROM STDIN で一時テーブルに流し込み、同じトランザクションで本テーブルへ
+# insert ... select（upsert の場合は on conflict do update）する。JSON の生成と PostgREST での解析を省ける。
+# 読み込み（select など）は元の supabase クライアントに任せる。
+# psycopg（3系）は任意の依存関係で、--writer copy を指定したときだけ読み込む。
+
+logger = logging.getLogger(__name__)
+
+WRITERS = ('rest', 'copy')
+# 一時テーブルに追加する、COPY した順の連番の列
+STAGE_ORDER_COLUMN = '_copy_order'
+
+
+def add_writer_argument(parser):
+    parser.add_argument(
+        '--writer',
+        choices=WRITERS,
+        default=os.getenv('SUPABASE_WRITER', 'rest'),
+        help='書き込み方法。rest は PostgREST へ JSON で、copy は SUPABASE_DB_URL の Postgres へ COPY で一括登録する（psycopg が必要）',
+    )
+    return parser
+
+
+def writer_client(supabase, writer=None):
+    # writer に応じて、書き込みに使うクライアントを返す
+    writer = writer or os.getenv('SUPABASE_WRITER', 'rest')
+    if writer == 'rest':
+        return RestBytesClient(supabase)
+    if writer == 'copy':
+        dsn = os.getenv('SUPABASE_DB_URL')
+        if not dsn:
+            raise EnvironmentError("--writer copy には SUPABASE_DB_URL（Postgres の接続文字列）が必要です")
+        logger.info("Postgres へ直接接続し、COPY で一括登録します")
+        return PostgresCopyClient(dsn, supabase)
+    raise ValueError(f"不明な書き込み方法です: {writer}")
+
+
+class _CopyTable:
+    # supabase の table(name) の代わり。insert / upsert は COPY で実行し、それ以外は元のクライアントに渡す
+    def __init__(self, client, name):
+        self._client = client
+        self._name = name
+        self._rows = None
+        self._on_conflict = None
+
+    def insert(self, rows, **_options):
+        self._rows = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows, on_conflict='', **_options):
+        # on_conflict のない upsert は主キー（自動採番）での衝突しか起きないため、insert と同じに扱う
+        self._rows = rows if isinstance(rows, list) else [rows]
+        self._on_conflict = on_conflict or None
+        return self
+
+    def execute(self):
+        return WriteResult(self._client.write(self._name, self._rows, self._on_conflict))
+
+    def __getattr__(self, name):
+        return getattr(self._client.reader.table(self._name), name)
+
+
+class PostgresCopyClient:
+    def __init__(self, dsn, reader):
+        try:
+            import psycopg  # noqa: F401
+        except ImportError:
+            raise ImportError("--writer copy には psycopg が必要です（pip install 'psycopg[binary]'）") from None
+        self.dsn = dsn
+        self.reader = reader
+        self._conn = None
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def table(self, name):
+        return _CopyTable(self, name)
+
+    def _connection(self):
+        import psycopg
+        if self._conn is None or self._conn.closed:
+            self._conn = psycopg.connect(self.dsn)
+        return self._conn
+
+    def write(self, table, rows, on_conflict=None):
+        if not rows:
+            return 0
+        from psycopg import sql
+        from psycopg.types.json import Jsonb
+
+        # 全行の列の和集合を登録する（rest_writer と同じ。行にない列は null）
+        columns = {}
+        for row in rows:
+            columns.update(dict.fromkeys(row.keys()))
+        columns = list(columns)
+        names = sql.SQL(', ').join(map(sql.Identifier, columns))
+        stage = sql.Identifier(f'_copy_stage_{table}')
+        target = sql.Identifier(table)
+        with self._lock:
+            conn = self._connection()
+            try:
+                with conn.transaction(), conn.cursor() as cur:
+                    # 型は本テーブルに合わせ、制約（NOT NULL や既定値）は持たない一時テーブル
+                    cur.execute(sql.SQL('create temp table {} on commit drop as select {} from {} with no data')
+                                .format(stage, names, target))
+                    # 同じキーの行を後勝ちでまとめるため、COPY した順の連番を持たせる
+                    cur.execute(sql.SQL('alter table {} add column {} bigint generated always as identity')
+                                .format(stage, sql.Identifier(STAGE_ORDER_COLUMN)))
+                    with cur.copy(sql.SQL('copy {} ({}) from stdin').format(stage, names)) as copy:
+                        for row in rows:
+                            # 画像URLの配列などは JSONB 列なので、Postgres の配列ではなく JSON として送る
+                            copy.write_row([
+                                Jsonb(value) if isinstance(value, (list, dict)) else value
+                                for value in (row.get(column) for column in columns)
+                            ])
+                    cur.execute(self._merge_statement(stage, target, columns, names, on_conflict))
+                    count = cur.rowcount
+            except Exception:
+                if conn.closed:
+                    self._conn = None
+                raise
+        return count
+
+    @staticmethod
+    def _merge_statement(stage, target, columns, names, on_conflict):
+        from psycopg import sql
+
+        if on_conflict is None:
+            return sql.SQL('insert into {} ({}) select {} from {}').format(target, names, names, stage)
+        keys = [key.strip() for key in on_conflict.split(',')]
+        key_names = sql.SQL(', ').join(map(sql.Identifier, keys))
+        updates = [column for column in columns if column not in keys]
+        # 同じキーが複数あると on conflict do update が失敗するため、一時テーブル側で後勝ちの1行にする
+        # （BatchWriter 経由なら後勝ちで1行にまとめ済み）
+        select = sql.SQL('select distinct on ({keys}) {names} from {stage} order by {keys}, {order} desc').format(
+            keys=key_names, names=names, stage=stage, order=sql.Identifier(STAGE_ORDER_COLUMN),
+        )
+        if not updates:
+            action = sql.SQL('do nothing')
+        else:
+            action = sql.SQL('do update set {}').format(sql.SQL(', ').join(
+                sql.SQL('{0} = excluded.{0}').format(sql.Identifier(column)) for column in updates
+            ))
+        return sql.SQL('insert into {} ({}) {} on conflict ({}) {}').format(target, names, select, key_names, action)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and not self._conn.closed:
+                self._conn.close()
+            self._conn = None
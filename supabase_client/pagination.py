@@ -0,0 +1,39 @@
+import os
+
+from utils import metrics
+
+# PostgREST は1回のレスポンスを max-rows 件で打ち切るため、大きなテーブルはキーセット方式で
+# ページごとに読む。order by key + key > 直前の値 で次のページを取得する。
+
+
+def iter_rows(client, table, columns, key, page_size=None, where=None):
+    # key の昇順に行を返すジェネレータ（key が null の行と、key が重複する2行目以降は除く）。
+    # 最初のページを読んだ時点から値を返し始め、max-rows がページサイズより小さくても
+    # 取りこぼさないよう、空のページが返るまで読み進める。where（クエリを受け取って返す関数）で絞り込める
+    page_size = page_size or int(os.getenv('SUPABASE_PAGE_SIZE', '1000'))
+    last = None
+    while True:
+        query = client.table(table).select(columns).order(key).limit(page_size)
+        if where is not None:
+            query = where(query)
+        if last is not None:
+            query = query.gt(key, last)
+        with metrics.timer('supabase_read', table=table):
+            rows = query.execute().data
+        metrics.count('rows_read', len(rows), table=table)
+        if not rows:
+            return
+        for row in rows:
+            value = row.get(key)
+            if value is None or value == last:
+                continue
+            last = value
+            yield row
+        if last is None:
+            return
+
+
+def iter_column_values(client, table, column, page_size=None):
+    # column の値を昇順・重複なしで返す
+    for row in iter_rows(client, table, column, column, page_size):
+        yield row[column]
@@ -0,0 +1,110 @@
+import os
+import threading
+
+from utils.fastjson import dumps, loads
+
+# supabase クライアントの書き込み（table().insert / upsert）を、行のリストを utils.fastjson で一度に bytes へ
+# 変換して PostgREST へそのまま送る実装に置き換える（--writer rest）。
+# supabase-py は行を標準の json で変換するため Schema のレコード（rakuten_sync/schema.py）を受け付けず、
+# 変換も orjson より遅い。書き込み用の HTTP クライアントは SUPABASE_URL / SUPABASE_KEY から自前で作る
+# （supabase-py 内部の PostgREST セッションには依存しない）。
+# 読み込みと update / delete は元のクライアントに任せる。
+
+WRITE_TIMEOUT = 120  # 秒（postgrest-py の既定と同じ）
+
+
+class WriteResult:
+    def __init__(self, count):
+        self.data = []
+        self.count = count
+
+
+class _RestTable:
+    # supabase の table(name) の代わり。insert / upsert は bytes で送り、それ以外は元のクライアントに渡す
+    def __init__(self, client, name):
+        self._client = client
+        self._name = name
+        self._rows = None
+        self._upsert = False
+        self._on_conflict = None
+
+    def insert(self, rows, **_options):
+        self._rows = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows, on_conflict='', **_options):
+        # on_conflict を省略した upsert は主キーでの衝突を更新する（supabase-py と同じ）
+        self._rows = rows if isinstance(rows, list) else [rows]
+        self._upsert = True
+        self._on_conflict = on_conflict or None
+        return self
+
+    def execute(self):
+        return WriteResult(self._client.write(self._name, self._rows, self._upsert, self._on_conflict))
+
+    def __getattr__(self, name):
+        return getattr(self._client.reader.table(self._name), name)
+
+
+class RestBytesClient:
+    def __init__(self, reader, url=None, key=None):
+        self.reader = reader
+        self._url = url
+        self._key = key
+        self._session = None
+        self._lock = threading.Lock()
+
+    def _client(self):
+        # 最初の書き込みで作る（httpx の読み込みを遅らせる。rakuten/http_client.py と同じ）
+        with self._lock:
+            if self._session is None:
+                import httpx
+
+                url = self._url or os.getenv('SUPABASE_URL')
+                key = self._key or os.getenv('SUPABASE_KEY')
+                if not url or not key:
+                    raise EnvironmentError("必要な環境変数（SUPABASE_URL, SUPABASE_KEY）が不足しています")
+                self._session = httpx.Client(
+                    base_url=f"{url.rstrip('/')}/rest/v1",
+                    headers={'apikey': key, 'Authorization': f'Bearer {key}'},
+                    timeout=WRITE_TIMEOUT,
+                )
+            return self._session
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def table(self, name):
+        return _RestTable(self, name)
+
+    def write(self, table, rows, upsert=False, on_conflict=None):
+        if not rows:
+            return 0
+        # 全行の列の和集合を columns で渡す（supabase-py と同じ。1行目にない列も登録される）
+        columns = {}
+        for row in rows:
+            columns.update(dict.fromkeys(row.keys()))
+        params = {'columns': ','.join(columns)}
+        prefer = ['return=minimal']
+        if upsert:
+            prefer.append('resolution=merge-duplicates')
+            if on_conflict:
+                params['on_conflict'] = on_conflict
+        response = self._client().post(
+            f'/{table}',
+            params=params,
+            content=dumps(rows),
+            headers={'Content-Type': 'application/json', 'Prefer': ','.join(prefer)},
+        )
+        if response.is_error:
+            from postgrest.exceptions import APIError
+
+            try:
+                detail = loads(response.content)
+            except ValueError:
+                detail = None
+            raise APIError(detail if isinstance(detail, dict) else {'message': response.text, 'code': response.status_code})
+        return len(rows)
@@ -0,0 +1,73 @@
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+import fake_postgrest  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def state_dir(tmp_path, monkeypatch):
+    # ローカル状態（ジャーナル・取得計画など）はテストごとの一時ディレクトリに置く
+    path = tmp_path / 'state'
+    monkeypatch.setenv('RAKUTEN_SYNC_STATE_DIR', str(path))
+    monkeypatch.setenv('RAKUTEN_METRICS_DIR', str(tmp_path / 'metrics'))
+    return path
+
+
+@pytest.fixture
+def postgrest():
+    # benchmarks/fake_postgrest.py のスタブサーバー（メモリ上のテーブル）
+    server = fake_postgrest.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def supabase(postgrest, monkeypatch):
+    from supabase import create_client
+
+    # --writer rest の書き込み（RestBytesClient）は SUPABASE_URL / SUPABASE_KEY から接続する
+    monkeypatch.setenv('SUPABASE_URL', postgrest.url)
+    monkeypatch.setenv('SUPABASE_KEY', 'test')
+    return create_client(postgrest.url, 'test')
+
+
+class FailingClient:
+    # 指定したテーブルへの insert / upsert / delete だけを失敗させる（読み込みはそのまま）
+    def __init__(self, client, tables):
+        self.client = client
+        self.tables = set(tables)
+
+    def table(self, name):
+        query = self.client.table(name)
+        return _FailingTable(query) if name in self.tables else query
+
+
+class _FailingTable:
+    def __init__(self, query):
+        self._query = query
+
+    def _fail(self, *args, **kwargs):
+        return self
+
+    insert = upsert = delete = _fail
+
+    def in_(self, *args):
+        return self
+
+    def execute(self):
+        raise RuntimeError('書き込み失敗（テスト）')
+
+    def select(self, *args, **kwargs):
+        return self._query.select(*args, **kwargs)
+
+
+@pytest.fixture
+def failing():
+    return FailingClient
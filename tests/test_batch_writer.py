@@ -0,0 +1,100 @@
+import pytest
+
+from supabase_client.batch_writer import BatchWriter
+
+
+def test_flush_writes_parent_tables_first(supabase, postgrest):
+    writer = BatchWriter(supabase, batch_size=10)
+    writer.upsert('mst_item_detail', {'item_code': 'a', 'item_name': '商品A'}, on_conflict='item_code')
+    writer.insert('mst_item_detail_tag', {'item_code': 'a', 'tag_id': 1})
+    writer.upsert('mst_item_detail', {'item_code': 'a', 'item_name': '商品A2'}, on_conflict='item_code')
+    writer.flush()
+
+    assert [row['item_name'] for row in postgrest.rows('mst_item_detail')] == ['商品A2']
+    assert [row['tag_id'] for row in postgrest.rows('mst_item_detail_tag')] == [1]
+    assert writer.rows_written == {'mst_item_detail': 1, 'mst_item_detail_tag': 1}
+
+
+def test_flush_splits_into_batches(supabase, postgrest):
+    writer = BatchWriter(supabase, batch_size=3)
+    for i in range(7):
+        writer.insert('mst_item_detail_tag', {'item_code': f'c{i}', 'tag_id': i})
+    writer.flush()
+
+    assert len(postgrest.rows('mst_item_detail_tag')) == 7
+    assert writer.requests == 3
+
+
+def test_failed_parent_keeps_rows_and_stops_children(supabase, postgrest, failing):
+    client = failing(supabase, {'mst_item_detail'})
+    writer = BatchWriter(client, batch_size=10)
+    writer.upsert('mst_item_detail', {'item_code': 'a', 'item_name': '商品A'}, on_conflict='item_code')
+    writer.insert('mst_item_detail_tag', {'item_code': 'a', 'tag_id': 1})
+
+    with pytest.raises(RuntimeError):
+        writer.flush()
+    # 親の書き込みに失敗したら子テーブルは書かない
+    assert postgrest.rows('mst_item_detail_tag') == []
+
+    # 失敗した行も後続テーブルの行も残っており、次の flush で書き込まれる
+    client.tables.clear()
+    writer.flush()
+    assert [row['item_code'] for row in postgrest.rows('mst_item_detail')] == ['a']
+    assert [row['tag_id'] for row in postgrest.rows('mst_item_detail_tag')] == [1]
+
+
+def test_exit_after_exception_still_flushes(supabase, postgrest):
+    with pytest.raises(ValueError):
+        with BatchWriter(supabase, batch_size=10) as writer:
+            writer.insert('mst_item_detail_tag', {'item_code': 'a', 'tag_id': 1})
+            raise ValueError('処理中の例外')
+    assert len(postgrest.rows('mst_item_detail_tag')) == 1
+
+
+def test_mixing_insert_and_upsert_is_rejected(supabase):
+    writer = BatchWriter(supabase, batch_size=10)
+    writer.insert('mst_item_detail', {'item_code': 'a'})
+    with pytest.raises(ValueError):
+        writer.upsert('mst_item_detail', {'item_code': 'a'}, on_conflict='item_code')
+
+
+def tag_rows(postgrest):
+    return sorted((row['item_code'], row['tag_id']) for row in postgrest.rows('mst_item_detail_tag'))
+
+
+def test_replace_writes_only_the_difference(supabase, postgrest):
+    postgrest.seed('mst_item_detail_tag', [
+        {'item_code': 'a', 'tag_id': 1},
+        {'item_code': 'a', 'tag_id': 1},  # 重複
+        {'item_code': 'a', 'tag_id': 2},  # 不要になったタグ
+        {'item_code': 'b', 'tag_id': 9},  # 対象外の商品
+    ])
+    kept_id = postgrest.rows('mst_item_detail_tag')[0]['id']
+    writer = BatchWriter(supabase, batch_size=10)
+    writer.replace('mst_item_detail_tag', 'item_code', 'a', ('tag_id',), [(1,), (3,)])
+    writer.flush()
+
+    assert tag_rows(postgrest) == [('a', 1), ('a', 3), ('b', 9)]
+    assert kept_id in {row['id'] for row in postgrest.rows('mst_item_detail_tag')}
+    assert writer.rows_written == {'mst_item_detail_tag': 1}
+    assert writer.rows_deleted == {'mst_item_detail_tag': 2}
+
+
+def test_replace_inserts_before_deleting(supabase, postgrest, monkeypatch):
+    postgrest.seed('mst_item_detail_tag', [{'item_code': 'a', 'tag_id': 1}])
+    writer = BatchWriter(supabase, batch_size=10)
+    writer.replace('mst_item_detail_tag', 'item_code', 'a', ('tag_id',), [(2,)])
+
+    def failed_delete(table, ids):
+        raise RuntimeError('削除失敗（テスト）')
+
+    monkeypatch.setattr(writer, '_delete', failed_delete)
+    with pytest.raises(RuntimeError):
+        writer.flush()
+    # 削除に失敗しても、新しい行は登録済みで欠けることはない
+    assert tag_rows(postgrest) == [('a', 1), ('a', 2)]
+
+    # 置き換えはバッファに残り、次の flush で余分な行が消える
+    monkeypatch.undo()
+    writer.flush()
+    assert tag_rows(postgrest) == [('a', 2)]
@@ -0,0 +1,58 @@
+import os
+import uuid
+
+import pytest
+
+psycopg = pytest.importorskip('psycopg')
+
+from supabase_client.copy_writer import PostgresCopyClient  # noqa: E402
+
+# 書き込み可能な Postgres の接続文字列（RAKUTEN_TEST_DB_URL）がある場合だけ実行する。
+# 作業用のスキーマを作り、終わったら消す
+DSN = os.getenv('RAKUTEN_TEST_DB_URL')
+pytestmark = pytest.mark.skipif(not DSN, reason='RAKUTEN_TEST_DB_URL が未設定')
+
+
+@pytest.fixture
+def copy_client(monkeypatch):
+    schema = f'test_copy_{uuid.uuid4().hex[:8]}'
+    with psycopg.connect(DSN, autocommit=True) as conn:
+        conn.execute(f'create schema {schema}')
+        conn.execute(f'''
+            create table {schema}.mst_item_detail (
+                item_code text primary key,
+                item_name text,
+                item_price integer,
+                medium_image_urls jsonb
+            )
+        ''')
+    monkeypatch.setenv('PGOPTIONS', f'-c search_path={schema}')
+    client = PostgresCopyClient(DSN, None)
+    yield client
+    client.close()
+    with psycopg.connect(DSN, autocommit=True) as conn:
+        conn.execute(f'drop schema {schema} cascade')
+
+
+def table_rows(client):
+    with client._connection().cursor() as cur:
+        cur.execute('select item_code, item_name, item_price, medium_image_urls from mst_item_detail order by item_code')
+        return cur.fetchall()
+
+
+def test_upsert_keeps_last_duplicate(copy_client):
+    rows = [{'item_code': 'a', 'item_price': price} for price in (100, 300, 200)]
+    copy_client.table('mst_item_detail').upsert(rows, on_conflict='item_code').execute()
+    assert table_rows(copy_client) == [('a', None, 200, None)]
+
+
+def test_write_uses_union_of_columns(copy_client):
+    rows = [
+        {'item_code': 'a', 'item_price': 100},
+        {'item_code': 'b', 'item_name': '商品B', 'medium_image_urls': ['https://example.com/b.jpg']},
+    ]
+    assert copy_client.table('mst_item_detail').insert(rows).execute().count == 2
+    assert table_rows(copy_client) == [
+        ('a', None, 100, None),
+        ('b', '商品B', None, ['https://example.com/b.jpg']),
+    ]
@@ -0,0 +1,52 @@
+import asyncio
+import time
+
+import pytest
+
+from rakuten import fetcher
+
+
+@pytest.fixture
+def fake_get_json(monkeypatch):
+    async def get_json(client, pool, key, url, params):
+        await asyncio.sleep(0.05)
+        return key, {'key': key}
+
+    monkeypatch.setattr(fetcher, '_get_json', get_json)
+
+
+def collect(jobs, concurrency=4):
+    async def run():
+        started = time.monotonic()
+        results = []
+        async for key, _data in fetcher.iter_fetch(jobs, pool=object(), concurrency=concurrency, client=object()):
+            results.append((key, time.monotonic() - started))
+        return results
+
+    return asyncio.run(run())
+
+
+def test_fetches_every_job(fake_get_json):
+    results = collect((code, 'url', {}) for code in range(10))
+    assert sorted(key for key, _elapsed in results) == list(range(10))
+
+
+def test_slow_source_does_not_block_requests_in_flight(fake_get_json):
+    # 商品コードのページの読み込み（同期の HTTP）を待つ間も、取得中のリクエストは完了する
+    def jobs():
+        yield 'a', 'url', {}
+        time.sleep(0.5)
+        yield 'b', 'url', {}
+
+    results = collect(jobs())
+    assert [key for key, _elapsed in results] == ['a', 'b']
+    assert results[0][1] < 0.3
+
+
+def test_source_errors_are_raised(fake_get_json):
+    def jobs():
+        yield 'a', 'url', {}
+        raise RuntimeError('商品コードの読み込み失敗（テスト）')
+
+    with pytest.raises(RuntimeError):
+        collect(jobs())
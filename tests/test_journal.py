@@ -0,0 +1,54 @@
+import time
+
+from rakuten_sync.journal import RunJournal
+
+ROW = {'item_code': 'shop:1', 'item_price': 100}
+
+
+def failed_run():
+    # ランキングを登録し、1商品を取得したところで失敗した実行（ジャーナルは残る）
+    journal = RunJournal('test')
+    journal.set_flag('ranking_stored')
+    journal.record('shop:1', {'history': [ROW]})
+    journal.close()
+
+
+def test_resume_skips_fetched_items_and_returns_pending_rows():
+    failed_run()
+    journal = RunJournal('test', resume=True)
+    assert journal.resumable
+    assert journal.get_flag('ranking_stored')
+    assert journal.seen() == {'shop:1'}
+    assert journal.pending('history') == [ROW]
+
+    journal.mark_committed('history', ['shop:1'])
+    assert journal.pending('history') == []
+    journal.finish()
+
+
+def test_without_resume_starts_over():
+    failed_run()
+    journal = RunJournal('test')
+    assert not journal.resumable
+    assert not journal.get_flag('ranking_stored')
+    assert journal.pending('history') == []
+
+
+def test_failed_run_then_stale_resume(monkeypatch):
+    failed_run()
+    later = time.time() + 25 * 3600
+    monkeypatch.setattr(time, 'time', lambda: later)
+
+    # 古いジャーナルは破棄する（ランキングも登録し直し、全件を取得し直す）
+    journal = RunJournal('test', resume=True)
+    assert not journal.resumable
+    assert not journal.get_flag('ranking_stored')
+    assert journal.seen() == set()
+    assert journal.pending('history') == []
+    journal.set_flag('ranking_stored')
+    journal.close()
+
+    # 開始時刻も新しくなるため、この実行が失敗しても次の --resume では再開できる
+    journal = RunJournal('test', resume=True)
+    assert journal.resumable
+    assert journal.get_flag('ranking_stored')
@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+from rakuten_sync import orchestrator, price_history
+from rakuten_sync.journal import RunJournal
+from rakuten_sync.orchestrator import iter_routed_codes
+from supabase_client.copy_writer import writer_client
+from utils.state import state_path
+
+
+def test_routed_codes_merge_streams():
+    routed = iter_routed_codes({'a': iter(['1', '3', '5']), 'b': iter(['2', '3'])})
+    assert list(routed) == [('1', {'a'}), ('2', {'b'}), ('3', {'a', 'b'}), ('5', {'a'})]
+
+
+def test_routed_codes_reject_unsorted_stream():
+    # DB の照合順序が Python の順序と異なる場合は、取りこぼす前に例外で止める
+    routed = iter_routed_codes({'a': iter(['shop:a', 'shop:B']), 'b': iter(['shop:_'])})
+    with pytest.raises(ValueError, match='昇順ではありません'):
+        list(routed)
+
+
+def test_tracked_item_codes_reraise_read_errors(monkeypatch):
+    def broken(*args):
+        yield 'shop:1'
+        raise RuntimeError('読み込み失敗（テスト）')
+
+    monkeypatch.setattr(price_history, 'iter_column_values', broken)
+    codes = price_history.iter_tracked_item_codes(None, 'mst_products')
+    assert next(codes) == 'shop:1'
+    with pytest.raises(RuntimeError):
+        next(codes)
+
+
+def fetched_item(code, name):
+    return {'Item': {'itemCode': code, 'itemName': name, 'itemPrice': 1000, 'availability': 1, 'shopCode': 'shop'}}
+
+
+@pytest.fixture
+def run(monkeypatch, supabase, failing):
+    # ランキングと商品検索は API を呼ばずに返し、書き込みは failing_tables だけ失敗させる
+    requested = []
+
+    def fetched(_supabase, codes, _app_id, _plan_by_shop):
+        for code in codes:
+            requested.append(code)
+            yield code, [fetched_item(code, 'new')]
+
+    def run_all(ranking_items=(), failing_tables=(), **options):
+        monkeypatch.setattr(orchestrator, 'fetch_ranking_items', lambda app_id: list(ranking_items))
+        monkeypatch.setattr(orchestrator, 'iter_fetched', fetched)
+        monkeypatch.setattr(
+            orchestrator, 'writer_client', lambda client, writer=None: failing(writer_client(client), failing_tables),
+        )
+        return orchestrator.run_all(supabase, 'app', **options)
+
+    monkeypatch.setenv('SUPABASE_WRITE_RETRIES', '0')
+    run_all.requested = requested
+    return run_all
+
+
+def test_failed_ranking_store_keeps_the_journal(run, postgrest):
+    postgrest.seed('mst_rakuten_items', [{'item_code': 'shop:1', 'item_name': 'old'}])
+    summary = run(ranking_items=[fetched_item('shop:2', 'ranked')], failing_tables={'trn_rakuten_ranking'})
+    assert summary['trn_rakuten_ranking']['failed'] == 1
+    assert os.path.exists(state_path('journal_orchestrator.sqlite'))
+    assert not RunJournal('orchestrator', resume=True).get_flag('ranking_stored')
+
+
+def test_master_rows_are_written_on_resume(run, postgrest):
+    # 商品マスタの登録に失敗した商品は、--resume で取得し直さずにジャーナルの行から登録する
+    postgrest.seed('mst_rakuten_items', [{'item_code': 'shop:1', 'item_name': 'old'}])
+    with pytest.raises(RuntimeError):
+        run(failing_tables={'mst_rakuten_items'})
+    assert postgrest.rows('mst_rakuten_items')[0]['item_name'] == 'old'
+
+    run.requested.clear()
+    summary = run(resume=True)
+    assert run.requested == []
+    assert summary['mst_rakuten_items'] == 1
+    assert postgrest.rows('mst_rakuten_items')[0]['item_name'] == 'new'
+    assert not os.path.exists(state_path('journal_orchestrator.sqlite'))
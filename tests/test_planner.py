@@ -0,0 +1,25 @@
+from rakuten_sync import planner
+
+
+def test_planned_items_read_codes_in_windows(monkeypatch):
+    # 商品コードは window 件ずつ読み、全件を読み込む前から取得結果を返す
+    consumed = []
+
+    def codes():
+        for index in range(6):
+            consumed.append(index)
+            yield f'shop{index // 3}:{index}'
+
+    async def fake_fetch(jobs, client=None):
+        for key, _url, params in jobs:
+            yield key, {'Items': [{'Item': {'itemCode': params['itemCode']}}]}
+
+    monkeypatch.setattr(planner, 'iter_fetch', fake_fetch)
+    stats = {}
+    fetched = planner.iter_planned_items(codes(), 'app', {}, min_dense=10, stats=stats, window=2)
+    first, _items = next(fetched)
+    assert first == 'shop0:0'
+    assert len(consumed) <= 2
+    assert [first] + [code for code, _items in fetched] == [f'shop{index // 3}:{index}' for index in range(6)]
+    assert stats['codes'] == 6
+    assert stats['api_calls'] == 6
@@ -0,0 +1,21 @@
+from rakuten_sync.price_history import HistoryWriter, insert_chunk
+
+ROWS = [
+    {'item_code': 'shop:1', 'item_price': 100, 'timestamp': '2026-10-17T00:00:00'},
+    {'item_code': 'shop:2', 'item_price': 200, 'timestamp': '2026-10-17T00:00:00'},
+]
+
+
+def test_history_rows_are_written_idempotently(supabase, postgrest):
+    # タイムアウト後の再試行や --resume で同じ行をもう一度登録しても、二重にならない
+    for _ in range(2):
+        writer = HistoryWriter(supabase, 'trn_rakuten_price_history', chunk_size=10, max_retries=0)
+        for row in ROWS:
+            writer.add(dict(row))
+        assert writer.close()['inserted'] == 2
+    assert sorted(row['item_code'] for row in postgrest.rows('trn_rakuten_price_history')) == ['shop:1', 'shop:2']
+
+
+def test_insert_chunk_reports_failure(supabase, failing):
+    client = failing(supabase, {'trn_rakuten_price_history'})
+    assert not insert_chunk(client, 'trn_rakuten_price_history', ROWS, max_retries=0)
@@ -0,0 +1,36 @@
+from rakuten_sync import ranking
+
+
+def ranked_item(code, rank):
+    return {'Item': {'itemCode': code, 'itemName': code, 'itemPrice': 1000, 'rank': rank, 'availability': 1,
+                     'pointRate': 1, 'shopCode': code.split(':')[0]}}
+
+
+def open_interval(id, code, genre_id):
+    return {'id': id, 'item_code': code, 'ranking_genre_id': genre_id, 'period': 'daily',
+            'valid_from': '2026-10-01T00:00:00', 'valid_to': None, 'rank': 1, 'item_price': 1000,
+            'availability': 1, 'point_rate': 1}
+
+
+def test_empty_page_is_not_a_fetch_failure(supabase, postgrest, monkeypatch):
+    # 最後のページが空でも、そのジャンル・期間は全ページ取得できたものとして外れた商品の期間を閉じる。
+    # 取得に失敗したページがあるジャンル・期間は閉じない
+    postgrest.seed('trn_rakuten_ranking_interval', [
+        open_interval(101, 'shop:dropped', '100'),
+        open_interval(102, 'shop:kept', '200'),
+    ])
+    pages = [
+        (('100', 'daily', 1), [ranked_item('shop:1', 1)]),
+        (('100', 'daily', 2), []),
+        (('200', 'daily', 1), None),
+    ]
+
+    async def fake_pages(*args):
+        for page in pages:
+            yield page
+
+    monkeypatch.setattr(ranking, 'iter_ranking_pages', fake_pages)
+    ranking.run_ranking_ingestion(supabase, 'app', ['100', '200'], periods=['daily'], history_mode='intervals')
+
+    closed = {row['item_code'] for row in postgrest.rows('trn_rakuten_ranking_interval') if row['valid_to']}
+    assert closed == {'shop:dropped'}
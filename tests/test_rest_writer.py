@@ -0,0 +1,19 @@
+import pytest
+
+from supabase_client.rest_writer import RestBytesClient
+
+
+def test_writes_without_the_supabase_client_session(supabase, postgrest):
+    # 書き込みは SUPABASE_URL / SUPABASE_KEY から作る自前の接続で行い、supabase-py の内部には依存しない
+    writer = RestBytesClient(reader=None)
+    writer.table('mst_rakuten_items').upsert([{'item_code': 'shop:1'}], on_conflict='item_code').execute()
+    writer.table('mst_rakuten_items').upsert([{'item_code': 'shop:1', 'item_name': 'new'}], on_conflict='item_code').execute()
+    writer.close()
+    assert postgrest.rows('mst_rakuten_items') == [{'id': 1, 'item_code': 'shop:1', 'item_name': 'new'}]
+
+
+def test_missing_credentials_are_reported(monkeypatch):
+    monkeypatch.delenv('SUPABASE_URL', raising=False)
+    monkeypatch.delenv('SUPABASE_KEY', raising=False)
+    with pytest.raises(EnvironmentError, match='SUPABASE_URL'):
+        RestBytesClient(reader=None).write('mst_rakuten_items', [{'item_code': 'shop:1'}])
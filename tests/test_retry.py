@@ -0,0 +1,36 @@
+import httpx
+
+from rakuten.key_pool import KeyPool
+from rakuten.retry import RetryPolicy
+
+
+def response(status, text=''):
+    return httpx.Response(status, text=text, request=httpx.Request('GET', 'https://app.rakuten.co.jp/'))
+
+
+def policy_with_credits(app_ids, monkeypatch):
+    pool = KeyPool(app_ids)
+    credited = []
+    monkeypatch.setattr(pool, 'on_success', credited.append)
+    return RetryPolicy(pool, 'test'), pool, credited
+
+
+def test_only_successful_responses_raise_the_rate(monkeypatch):
+    policy, pool, credited = policy_with_credits(['app'], monkeypatch)
+    key = pool.keys[0]
+    assert policy.on_response(key, response(404)) is None
+    assert policy.on_response(key, response(400, 'wrong_parameter')) is None
+    assert credited == []
+    assert policy.on_response(key, response(200)) is None
+    assert credited == [key]
+
+
+def test_rejected_last_key_is_not_credited(monkeypatch):
+    # 他にアプリIDがあれば別のアプリIDですぐに再試行し、最後の1つが拒否されたらそのまま返す
+    policy, pool, credited = policy_with_credits(['a', 'b'], monkeypatch)
+    first, second = pool.keys
+    assert policy.on_response(first, response(403)) == 0.0
+    assert first.disabled
+    assert policy.on_response(second, response(403)) is None
+    assert not second.disabled
+    assert credited == []
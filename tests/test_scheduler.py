@@ -0,0 +1,58 @@
+from rakuten_sync.scheduler import ItemStatsStore, RefreshScheduler
+
+HOUR = 3600.0
+NOW = 1_700_000_000.0
+
+
+def scheduler(budget, now=NOW, **options):
+    return RefreshScheduler('test', budget, store=ItemStatsStore(), now=now, **options)
+
+
+def poll(codes, polled_at, prices=None):
+    # codes を polled_at に取得した記録を残す（prices を変えると変化ありとして数える）
+    store = ItemStatsStore()
+    store.record('test', {code: str((prices or {}).get(code, 100)) for code in codes}, polled_at)
+    store.close()
+
+
+def test_unknown_items_are_always_selected():
+    selected = scheduler(budget=1).select(['a', 'b', 'c'])
+    assert selected == ['a', 'b', 'c']
+
+
+def test_budget_limits_known_items_and_keeps_order():
+    codes = [f'c{i}' for i in range(10)]
+    poll(codes, NOW - 30 * HOUR)
+    poll(codes, NOW - 2 * HOUR, prices={'c3': 200, 'c7': 300})  # c3 / c7 は価格が変わりやすい
+
+    planner = scheduler(budget=2)
+    assert planner.select(codes) == ['c3', 'c7']
+    assert planner.report['calls_saved'] == 8
+
+
+def test_items_about_to_go_stale_are_forced():
+    poll(['old'], NOW - 23.5 * HOUR)
+    poll(['new'], NOW - 1 * HOUR)
+    planner = scheduler(budget=0, max_staleness_hours=24.0)
+    assert planner.select(['new', 'old']) == ['old']
+    assert planner.report['forced'] == 1
+
+
+def test_free_items_do_not_use_budget():
+    poll(['a', 'b'], NOW - 2 * HOUR)
+    planner = scheduler(budget=1)
+    selected = planner.select([('a', 1), ('b', 2)], key=lambda pair: pair[0], free={'a'})
+    assert selected == [('a', 1), ('b', 2)]
+
+
+def test_run_start_is_recorded_only_after_success():
+    planner = scheduler(budget=1, now=NOW)
+    planner.close(succeeded=False)
+    # 失敗した実行は記録しないため、次の実行は既定の間隔（1時間）で見積もる
+    planner = scheduler(budget=1, now=NOW + 6 * HOUR)
+    assert planner.run_interval == HOUR
+    planner.close()
+
+    planner = scheduler(budget=1, now=NOW + 8 * HOUR)
+    assert planner.run_interval == 2 * HOUR
+    planner.close()
@@ -0,0 +1,26 @@
+from rakuten_sync.schema import PRICE_HISTORY, RANKING
+from supabase_client.rest_writer import RestBytesClient
+
+ITEM = {'itemCode': 'shop:1', 'rank': 1, 'itemPrice': '1200', 'mediumImageUrls': [{'imageUrl': 'https://example.com/1.jpg'}]}
+
+
+def test_records_convert_api_items():
+    row = PRICE_HISTORY.rows_of([ITEM], '2026-10-17T00:00:00')[0]
+    assert row['item_code'] == 'shop:1'
+    assert row['item_price'] == 1200
+    assert row['small_image_urls'] == []
+    assert row['timestamp'] == '2026-10-17T00:00:00'
+    assert list(row) == [*PRICE_HISTORY.columns, 'timestamp']
+
+
+def test_unset_ranking_columns_are_not_written(supabase, postgrest):
+    # ジャンル・期間を設定しないランキング（上位100件）は、その列を送らない
+    top = RANKING.rows_of([ITEM])[0]
+    assert 'period' not in dict(top)
+    RestBytesClient(supabase).table('trn_rakuten_ranking').insert([top]).execute()
+    assert 'period' not in postgrest.rows('trn_rakuten_ranking')[0]
+
+    genre = RANKING.rows_of([ITEM])[0]
+    genre['ranking_genre_id'], genre['period'] = '100227', 'daily'
+    RestBytesClient(supabase).table('trn_rakuten_ranking').insert([genre]).execute()
+    assert postgrest.rows('trn_rakuten_ranking')[1]['period'] == 'daily'
@@ -0,0 +1,41 @@
+import json
+import sys
+from datetime import datetime
+
+from rakuten_sync import sharding
+from rakuten_sync.sharding import merge_shard_reports, shard_of, write_shard_report
+from utils import metrics
+
+
+def write_reports(count):
+    return [
+        write_shard_report(
+            'orchestrator', index, count, {'codes': 10 + index, 'trn': {'inserted': 5, 'failed': 0}},
+            datetime(2026, 10, 17, 0, 0, index), datetime(2026, 10, 17, 0, 1, index * 2),
+        )
+        for index in range(count)
+    ]
+
+
+def test_merge_shard_reports_adds_counts():
+    merged = merge_shard_reports(write_reports(3))
+    assert merged['shards'] == ['orchestrator[0]', 'orchestrator[1]', 'orchestrator[2]']
+    assert merged['summary'] == {'codes': 33, 'trn': {'inserted': 15, 'failed': 0}}
+    assert merged['elapsed_sec'] == 64.0
+    assert merged['slowest_shard_sec'] == 62.0
+
+
+def test_merge_ignores_run_metrics(monkeypatch, capsys):
+    # 実行メトリクスは既定でシャードのレポートとは別のディレクトリに出力される
+    monkeypatch.delenv('RAKUTEN_METRICS_DIR')
+    monkeypatch.setattr(metrics, '_job', 'all')
+    metrics.write_reports()
+    write_reports(2)
+
+    monkeypatch.setattr(sys, 'argv', ['sharding'])
+    sharding.main()
+    assert json.loads(capsys.readouterr().out)['summary']['codes'] == 21
+
+
+def test_shard_of_uses_every_shard():
+    assert {shard_of(f'shop:{i}', 4) for i in range(100)} == {0, 1, 2, 3}
@@ -0,0 +1,30 @@
+import dataclasses
+import json
+
+# 楽天APIのレスポンスの解析と、Supabase へ送る行の JSON 生成に使う。
+# orjson があれば使い（解析・生成とも標準の json より数倍速く、bytes を直接返す）、なければ標準の json で同じ結果を返す。
+# Schema のレコード（rakuten_sync/schema.py、slots 付きの dataclass）は、orjson ならそのまま変換できる。
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data):
+    # data は bytes / str のどちらでもよい
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _default(value):
+    if dataclasses.is_dataclass(value):
+        return {field.name: getattr(value, field.name) for field in dataclasses.fields(value)}
+    raise TypeError(f"JSON に変換できない型です: {type(value).__name__}")
+
+
+def dumps(value):
+    # UTF-8 の bytes を返す（日本語はエスケープしない）
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=_default).encode('utf-8')
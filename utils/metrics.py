@@ -0,0 +1,227 @@
+import atexit
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from utils.state import state_path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 実行中の計測値（カウンタ・所要時間のヒストグラム）をプロセス内に集計し、終了時に
+# JSON の実行レポートと Prometheus の textfile（node_exporter の textfile collector 用）に書き出す。
+# 計測は常に行い、出力は RAKUTEN_METRICS=0 で止められる。出力先は RAKUTEN_METRICS_DIR（既定 state/metrics）。
+# シャードの実行レポート（state/reports、rakuten_sync/sharding.py）とは別のディレクトリに置く。
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'rakuten_sync_'
+# 所要時間のヒストグラムの区切り（秒）
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> 値
+_histograms = {}  # (name, labels) -> _Histogram
+_job = None
+_started_at = None
+_started = None
+
+
+class _Histogram:
+    __slots__ = ('counts', 'sum', 'count', 'max')
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        # バケットの上限で近似する
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def count(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = _Histogram()
+        histogram.observe(seconds)
+
+
+@contextmanager
+def timer(name, **labels):
+    # with 文の所要時間を name（秒のヒストグラム）に記録する
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def peak_memory_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # Linux は KB 単位
+
+
+def start_run(job):
+    # 実行の開始を記録し、終了時にレポートを書き出す。同じプロセスで続けて実行した場合は、
+    # 前の実行分をここで書き出してから集計をやり直す
+    global _job, _started_at, _started
+    if _job is None:
+        atexit.register(write_reports)
+    else:
+        write_reports()
+        with _lock:
+            _counters.clear()
+            _histograms.clear()
+    _job = job
+    _started_at = datetime.now()
+    _started = time.perf_counter()
+
+
+def snapshot():
+    with _lock:
+        counters = [
+            {'name': name, 'labels': dict(labels), 'value': value}
+            for (name, labels), value in sorted(_counters.items())
+        ]
+        histograms = [
+            {
+                'name': name, 'labels': dict(labels), 'count': h.count, 'sum': round(h.sum, 6),
+                'p50': round(h.quantile(0.5), 6), 'p95': round(h.quantile(0.95), 6), 'max': round(h.max, 6),
+            }
+            for (name, labels), h in sorted(_histograms.items())
+        ]
+    return {
+        'job': _job,
+        'started_at': _started_at.isoformat() if _started_at else None,
+        'finished_at': datetime.now().isoformat(),
+        'elapsed_sec': round(time.perf_counter() - _started, 3) if _started is not None else None,
+        'peak_memory_bytes': peak_memory_bytes(),
+        'counters': counters,
+        'timings': histograms,
+    }
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def to_prometheus(report):
+    # job はスクレイプ側のラベルと衝突するため batch とする
+    job = (('batch', report['job']),)
+    lines = []
+    typed = set()
+
+    def declare(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f'# TYPE {name} {kind}')
+
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, (list(h.counts), h.sum, h.count)) for key, h in _histograms.items())
+    for (name, labels), value in counters:
+        metric = PREFIX + name + '_total'
+        declare(metric, 'counter')
+        lines.append(f'{metric}{_format_labels(job + labels)} {value}')
+    for (name, labels), (counts, total, n) in histograms:
+        metric = PREFIX + name + '_seconds'
+        declare(metric, 'histogram')
+        cumulative = 0
+        for bound, c in zip(BUCKETS, counts):
+            cumulative += c
+            lines.append(f'{metric}_bucket{_format_labels(job + labels, [("le", bound)])} {cumulative}')
+        lines.append(f'{metric}_bucket{_format_labels(job + labels, [("le", "+Inf")])} {n}')
+        lines.append(f'{metric}_sum{_format_labels(job + labels)} {total:.6f}')
+        lines.append(f'{metric}_count{_format_labels(job + labels)} {n}')
+    gauges = {
+        'run_duration_seconds': report['elapsed_sec'],
+        'peak_memory_bytes': report['peak_memory_bytes'],
+        'last_run_timestamp_seconds': int(time.time()),
+    }
+    for name, value in gauges.items():
+        if value is not None:
+            declare(PREFIX + name, 'gauge')
+            lines.append(f'{PREFIX}{name}{_format_labels(job)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def log_summary(report):
+    for timing in report['timings']:
+        labels = ', '.join(f'{k}={v}' for k, v in timing['labels'].items())
+        logger.info(
+            f"所要時間 {timing['name']}[{labels}]: {timing['count']} 回 / 合計 {timing['sum']:.1f} 秒 / "
+            f"p50 {timing['p50']} 秒 / p95 {timing['p95']} 秒"
+        )
+    if report['peak_memory_bytes']:
+        logger.info(f"ピークメモリ: {report['peak_memory_bytes'] / 1024 / 1024:.1f} MB")
+
+
+def _write_atomic(path, text):
+    # textfile collector が書きかけのファイルを読まないよう、一時ファイルから置き換える
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def write_reports():
+    if _job is None or os.getenv('RAKUTEN_METRICS', '1') == '0':
+        return None
+    try:
+        directory = os.getenv('RAKUTEN_METRICS_DIR') or state_path('metrics')
+        os.makedirs(directory, exist_ok=True)
+        report = snapshot()
+        json_path = os.path.join(directory, f'metrics_{_job}.json')
+        _write_atomic(json_path, json.dumps(report, ensure_ascii=False, indent=2))
+        _write_atomic(os.path.join(directory, f'{PREFIX}{_job}.prom'), to_prometheus(report))
+        log_summary(report)
+        logger.info(f"実行メトリクスを出力: {json_path}")
+        return json_path
+    except Exception:
+        logger.exception("実行メトリクスの出力に失敗")
+        return None
@@ -0,0 +1,13 @@
+import os
+
+# 実行をまたいで保持するローカル状態（フィンガープリント、キャッシュ等）の保存先
+
+
+def state_dir():
+    path = os.getenv('RAKUTEN_SYNC_STATE_DIR', './state')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def state_path(name):
+    return os.path.join(state_dir(), name)